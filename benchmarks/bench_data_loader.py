@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks of ``DataLoader`` against in-process S3 and DynamoDB stand-ins (moto), no AWS account needed.
+
+For every format and number of objects, a synthetic prefix is generated and the following are measured:
+
+- listing time of ``get_latest_files_from_s3_using_bookmark``, full and key ordered (resuming at 90%)
+- bookmark round trip latencies (register, read, commit) of both bookmark layouts
+- read throughput and peak RSS of ``load_data_from_s3`` (on at most ``--read-objects`` objects)
+
+Results are saved as json, one record per measured figure, and can be compared with the results of a previous
+run to catch regressions between releases::
+
+    python benchmarks/bench_data_loader.py --objects 10000 100000 --output benchmarks/results/1.1.0.json
+    python benchmarks/bench_data_loader.py --baseline benchmarks/results/1.1.0.json
+
+The figures reflect the stand-ins, not S3 and DynamoDB: compare runs made on the same machine with each other,
+don't read them as absolute AWS numbers. moto lists objects much slower than S3, 1M objects runs take long.
+"""
+
+import os
+
+# the stand-ins don't check credentials, make sure real ones are never used
+os.environ["AWS_ACCESS_KEY_ID"] = "benchmark"
+os.environ["AWS_SECRET_ACCESS_KEY"] = "benchmark"
+os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+os.environ.pop("AWS_PROFILE", None)
+os.environ.pop("AWS_SESSION_TOKEN", None)
+
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import datetime
+import statistics
+import threading
+
+import numpy as np
+import pandas as pd
+from moto import mock_aws
+
+dir_here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(dir_here))
+
+import bookmark_utils
+from bookmark_utils import DataLoader
+
+bucket = "bookmark-utils-benchmark"
+dynamodb_table = "bookmark_utils_benchmark"
+
+
+def make_object_body(format_of_data: str, rows: int, seed: int) -> bytes:
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "id": np.arange(seed * rows, (seed + 1) * rows),
+        "amount": rng.random(rows),
+        "category": rng.choice(["a", "b", "c", "d"], rows),
+    })
+    if format_of_data == "csv":
+        return df.to_csv(index=False).encode("utf-8")
+    elif format_of_data == "json":
+        return df.to_json(orient="records").encode("utf-8")
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+
+def seed_objects(prefix: str, format_of_data: str, count: int, rows_per_object: int):
+    """
+    Write the objects straight into the moto backend, going through the S3 api would take hours for 1M objects.
+    A few distinct bodies are reused, the listing and bookmark figures don't depend on the content.
+    """
+    from moto.core import DEFAULT_ACCOUNT_ID
+    from moto.s3.models import s3_backends
+
+    backend = s3_backends[DEFAULT_ACCOUNT_ID]["aws"]
+    bodies = [make_object_body(format_of_data, rows_per_object, seed) for seed in range(16)]
+    for index in range(count):
+        backend.put_object(bucket, f"{prefix}/part-{index:07d}.{format_of_data}", bodies[index % len(bodies)])
+
+
+def current_rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):  # not linux, fall back to the peak so far
+        import resource
+
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+class PeakRssSampler(object):
+    """
+    Sample the resident set size of the process every ``interval`` seconds while in the ``with`` block.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.start_bytes = 0
+        self.peak_bytes = 0
+        self.__stopped = threading.Event()
+        self.__thread = threading.Thread(target=self.__sample, daemon=True)
+
+    def __sample(self):
+        while not self.__stopped.wait(self.interval):
+            self.peak_bytes = max(self.peak_bytes, current_rss_bytes())
+
+    def __enter__(self):
+        self.start_bytes = self.peak_bytes = current_rss_bytes()
+        self.__thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.__stopped.set()
+        self.__thread.join()
+        self.peak_bytes = max(self.peak_bytes, current_rss_bytes())
+
+
+def record(results: list, benchmark: str, metric: str, value: float, unit: str, better: str, **parameters):
+    results.append(dict(benchmark=benchmark, metric=metric, value=value, unit=unit, better=better, **parameters))
+    print(f"{benchmark:<24} {metric:<20} {value:>14.4f} {unit:<6} {parameters}")
+
+
+def new_data_loader(prefix: str, format_of_data: str, job_name: str, **kwargs) -> DataLoader:
+    return DataLoader(
+        s3_bucket_name=bucket,
+        s3_location=prefix,
+        format_of_data=format_of_data,
+        job_name=job_name,
+        dynamo_db_table_for_bookmark_storage=dynamodb_table,
+        **kwargs)
+
+
+def bench_listing(results: list, prefix: str, format_of_data: str, count: int, repeats: int):
+    data_loader = new_data_loader(prefix, format_of_data, f"bench_listing_{prefix}")
+    timings = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        _, files = data_loader.get_latest_files_from_s3_using_bookmark(0)
+        timings.append(time.perf_counter() - start_time)
+    assert len(files) == count
+    seconds = min(timings)
+    record(results, "listing", "seconds", seconds, "s", "lower", format=format_of_data, objects=count)
+    record(results, "listing", "objects_per_second", count / seconds, "obj/s", "higher",
+           format=format_of_data, objects=count)
+
+    # key ordered mode resuming after 90% of the keys only lists the tail
+    data_loader = new_data_loader(prefix, format_of_data, f"bench_listing_key_ordered_{prefix}", key_ordered=True)
+    last_read_key = f"{prefix}/part-{int(count * 0.9) - 1:07d}.{format_of_data}"
+    timings = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        data_loader.get_latest_files_from_s3_using_bookmark(0, last_read_key)
+        timings.append(time.perf_counter() - start_time)
+    record(results, "listing_key_ordered", "seconds", min(timings), "s", "lower",
+           format=format_of_data, objects=count)
+
+
+def bench_bookmark_round_trip(results: list, iterations: int):
+    for bookmark_layout in DataLoader.valid_bookmark_layouts:
+        data_loader = new_data_loader("bookmark", "csv", f"bench_bookmark_{bookmark_layout}",
+                                      bookmark_layout=bookmark_layout)
+        timings = {"register": [], "get": [], "commit": []}
+        for iteration in range(iterations):
+            latest_timestamp = datetime.datetime.fromtimestamp(1600000000 + iteration)
+            start_time = time.perf_counter()
+            data_loader.register_bookmark(latest_timestamp, status="IN_PROGRESS")
+            timings["register"].append(time.perf_counter() - start_time)
+
+            start_time = time.perf_counter()
+            data_loader.get_latest_bookmark_from_db(status="COMPLETE")
+            timings["get"].append(time.perf_counter() - start_time)
+
+            start_time = time.perf_counter()
+            data_loader.commit()
+            timings["commit"].append(time.perf_counter() - start_time)
+
+        for operation, operation_timings in timings.items():
+            operation_timings = sorted(operation_timings)
+            record(results, f"bookmark_{operation}", "median_ms", statistics.median(operation_timings) * 1000,
+                   "ms", "lower", bookmark_layout=bookmark_layout, iterations=iterations)
+            record(results, f"bookmark_{operation}", "p95_ms",
+                   operation_timings[int(len(operation_timings) * 0.95) - 1] * 1000,
+                   "ms", "lower", bookmark_layout=bookmark_layout, iterations=iterations)
+
+
+def bench_load(results: list, prefix: str, format_of_data: str, count: int, rows_per_object: int, max_workers: int):
+    data_loader = new_data_loader(prefix, format_of_data, f"bench_load_{prefix}", max_workers=max_workers)
+    with PeakRssSampler() as sampler:
+        df = data_loader.load_data_from_s3()
+    stats = data_loader.last_load_stats
+    assert stats["files"] == count and df.shape[0] == stats["rows"]
+
+    parameters = dict(format=format_of_data, objects=count, rows_per_object=rows_per_object, max_workers=max_workers)
+    record(results, "load", "seconds", stats["seconds"], "s", "lower", **parameters)
+    record(results, "load", "files_per_second", stats["files"] / stats["seconds"], "file/s", "higher", **parameters)
+    record(results, "load", "megabytes_per_second", stats["megabytes_per_second"], "MB/s", "higher", **parameters)
+    record(results, "load", "peak_rss_mb", sampler.peak_bytes / 1024 / 1024, "MB", "lower", **parameters)
+    record(results, "load", "rss_increase_mb", (sampler.peak_bytes - sampler.start_bytes) / 1024 / 1024,
+           "MB", "lower", **parameters)
+
+
+def result_id(result: dict) -> tuple:
+    return tuple(sorted((name, value) for name, value in result.items() if name not in ("value", "unit", "better")))
+
+
+def compare_with_baseline(results: list, baseline_path: str, tolerance: float) -> list:
+    """
+    Return the figures which are worse than in the baseline by more than tolerance (a ratio).
+    """
+    with open(baseline_path) as f:
+        baseline = {result_id(result): result for result in json.load(f)["results"]}
+
+    regressions = []
+    for result in results:
+        baseline_result = baseline.get(result_id(result))
+        if baseline_result is None or not baseline_result["value"]:
+            continue
+        ratio = result["value"] / baseline_result["value"]
+        if (result["better"] == "lower" and ratio > 1 + tolerance) \
+                or (result["better"] == "higher" and ratio < 1 - tolerance):
+            regressions.append(dict(result, baseline_value=baseline_result["value"], ratio=ratio))
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--objects", type=int, nargs="+", default=[10000],
+                        help="numbers of objects of the synthetic prefixes")
+    parser.add_argument("--formats", nargs="+", default=["csv", "parquet", "json"],
+                        choices=["csv", "parquet", "json"])
+    parser.add_argument("--rows-per-object", type=int, default=10)
+    parser.add_argument("--read-objects", type=int, default=1000,
+                        help="maximum number of objects read by the load benchmark")
+    parser.add_argument("--max-workers", type=int, default=8)
+    parser.add_argument("--bookmark-iterations", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=3, help="repeats of the listing benchmarks, best is kept")
+    parser.add_argument("--output", default=os.path.join(
+        dir_here, "results", f"{bookmark_utils.__version__}-{datetime.datetime.now():%Y%m%d%H%M%S}.json"))
+    parser.add_argument("--baseline", help="results of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="accepted degradation ratio compared with the baseline")
+    args = parser.parse_args(argv)
+
+    results = []
+    with mock_aws():
+        import boto3
+
+        boto3.client("s3").create_bucket(Bucket=bucket)
+        bench_bookmark_round_trip(results, args.bookmark_iterations)
+        for format_of_data in args.formats:
+            for count in args.objects:
+                prefix = f"{format_of_data}/{count}"
+                seed_objects(prefix, format_of_data, count, args.rows_per_object)
+                bench_listing(results, prefix, format_of_data, count, args.repeats)
+
+            read_count = min(max(args.objects), args.read_objects)
+            read_prefix = f"read/{format_of_data}/{read_count}"
+            seed_objects(read_prefix, format_of_data, read_count, args.rows_per_object)
+            bench_load(results, read_prefix, format_of_data, read_count, args.rows_per_object, args.max_workers)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump({
+            "version": bookmark_utils.__version__,
+            "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "parameters": vars(args),
+            "results": results,
+        }, f, indent=4)
+    print(f"results saved to {args.output}")
+
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression['benchmark']} {regression['metric']}: {regression['value']:.4f} "
+                  f"vs {regression['baseline_value']:.4f} {regression['unit']} ({regression['ratio']:.2f}x)")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
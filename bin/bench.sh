@@ -0,0 +1,10 @@
+#!/bin/bash
+
+# Run the benchmarks against the local S3 / DynamoDB stand-ins, arguments are passed to the benchmark script,
+# e.g. ``bin/bench.sh --objects 10000 100000 --baseline benchmarks/results/<previous version>.json``
+
+dir_here="$( cd "$( dirname "${BASH_SOURCE[0]}" )" >/dev/null 2>&1 && pwd )"
+dir_project_root="$(dirname "${dir_here}")"
+bin_python="${dir_project_root}/venv/bin/python"
+
+${bin_python} "${dir_project_root}/benchmarks/bench_data_loader.py" "$@"
@@ -9,6 +9,9 @@ __author_email__ = "daruns@amazon.com"
 # API
 try:
     from .bookmark_for_python_shell import DataLoader
+    from .multi_source_loader import MultiSourceLoader
+    from .sharded_loader import ShardedLoader
+    from .async_data_loader import AsyncDataLoader
 except ImportError: # pragma: no cover
     pass
 except: # pragma: no cover
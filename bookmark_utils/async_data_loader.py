@@ -0,0 +1,336 @@
+"""
+This utility runs the DataLoader operations as coroutines on non-blocking AWS clients, for asyncio applications
+"""
+
+import asyncio
+import contextlib
+import datetime
+import time
+from typing import TYPE_CHECKING, List, Tuple
+
+from .bookmark_for_python_shell import DataLoader
+from .helpers import S3ObjectSummary, parse_partition_time_range
+
+if TYPE_CHECKING:  # pragma: no cover
+    import pandas as pd
+
+
+class AsyncDataLoader(object):
+    """
+    The constructor initializes the utility with a DataLoader, whose location, format, bookmark layout and parsing
+    options are used. S3 and DynamoDB are called with aiobotocore clients, opened and closed with ``async with``,
+    so listing pages, bookmark calls and object downloads of many loaders overlap on one event loop. At most
+    max_concurrency objects are read at once, the objects are read in memory (the object cache and the large object
+    settings of the DataLoader don't apply) and parsed in the default executor of the event loop, or in the
+    process pool of the DataLoader when parse_processes is set. The clients use the region and the credentials of
+    the boto3 session of the DataLoader, unless an aiobotocore session is given as aio_session, whose own credentials
+    are used then.
+    """
+
+    def __init__(self,
+                 data_loader: DataLoader,
+                 max_concurrency: int = 256,
+                 aio_session=None):
+        if data_loader.use_schema_registry:
+            raise Exception("use_schema_registry is not supported by AsyncDataLoader")
+
+        self.__data_loader = data_loader
+        self.max_concurrency = max_concurrency
+        self.__aio_session = aio_session
+        self.__exit_stack = None
+        self.__s3_client = None
+        self.__dynamodb_client = None
+        self.__read_semaphore = None
+        self.__last_load_stats = {}
+
+    @property
+    def data_loader(self) -> DataLoader:
+        return self.__data_loader
+
+    @property
+    def max_concurrency(self):
+        return self.__max_concurrency
+
+    @max_concurrency.setter
+    def max_concurrency(self, value):
+        if not isinstance(value, int) or value < 1:
+            raise Exception("max_concurrency should be a positive integer")
+
+        self.__max_concurrency = value
+
+    @property
+    def s3_client(self):
+        if self.__s3_client is None:
+            raise Exception("AsyncDataLoader should be opened with async with")
+        return self.__s3_client
+
+    @property
+    def dynamodb_client(self):
+        if self.__dynamodb_client is None:
+            raise Exception("AsyncDataLoader should be opened with async with")
+        return self.__dynamodb_client
+
+    @property
+    def last_load_stats(self):
+        """
+        Throughput figures of the last ``load_data_from_s3`` run.
+        """
+        return self.__last_load_stats
+
+    async def __aenter__(self):
+        try:
+            from aiobotocore.config import AioConfig
+            from aiobotocore.session import get_session
+        except ImportError:  # pragma: no cover
+            raise Exception("AsyncDataLoader requires the aiobotocore package")
+
+        boto3_session = self.data_loader.boto3_session
+        client_kwargs = dict(
+            region_name=boto3_session.region_name,
+            config=AioConfig(max_pool_connections=self.max_concurrency),
+        )
+        aio_session = self.__aio_session
+        if aio_session is None:
+            aio_session = get_session()
+            credentials = boto3_session.get_credentials()
+            if credentials is not None:
+                credentials = credentials.get_frozen_credentials()
+                client_kwargs.update(
+                    aws_access_key_id=credentials.access_key,
+                    aws_secret_access_key=credentials.secret_key,
+                    aws_session_token=credentials.token,
+                )
+        self.__exit_stack = contextlib.AsyncExitStack()
+        try:
+            self.__s3_client = await self.__exit_stack.enter_async_context(
+                aio_session.create_client("s3", **client_kwargs))
+            self.__dynamodb_client = await self.__exit_stack.enter_async_context(
+                aio_session.create_client("dynamodb", **client_kwargs))
+        except BaseException:
+            await self.__aexit__(None, None, None)
+            raise
+        self.__read_semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        exit_stack, self.__exit_stack = self.__exit_stack, None
+        self.__s3_client = None
+        self.__dynamodb_client = None
+        if exit_stack is not None:
+            await exit_stack.aclose()
+
+    """
+    List the objects under a prefix, all the pages of it, or one level of it with ``Delimiter="/"``
+    """
+
+    async def list_s3_objects(self, prefix: str, start_after: str = None,
+                              delimiter: str = None) -> Tuple[List[S3ObjectSummary], List[str]]:
+        paginate_kwargs = dict(Bucket=self.data_loader.s3_bucket_name, Prefix=prefix)
+        if start_after:
+            paginate_kwargs["StartAfter"] = start_after
+        if delimiter:
+            paginate_kwargs["Delimiter"] = delimiter
+
+        objects, child_prefixes = list(), list()
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        async for page in paginator.paginate(**paginate_kwargs):
+            self.data_loader.metrics.increment("list_pages")
+            for content in page.get("Contents", []):
+                objects.append(S3ObjectSummary(
+                    key=content["Key"],
+                    last_modified=content["LastModified"],
+                    size=content["Size"],
+                    e_tag=content["ETag"],
+                ))
+            for common_prefix in page.get("CommonPrefixes", []):
+                child_prefixes.append(common_prefix["Prefix"])
+        return objects, child_prefixes
+
+    """
+    List a hive partitioned location level by level, the partitions older than modified_after - lookback are
+    skipped and all the partitions of a level are listed concurrently
+    """
+
+    async def list_s3_objects_with_partition_pruning(self, modified_after: datetime.datetime,
+                                                     lookback: datetime.timedelta) -> List[S3ObjectSummary]:
+        prefix = self.data_loader.s3_location
+        cutoff = modified_after - lookback
+
+        def is_pruned(child_prefix: str) -> bool:
+            time_range = parse_partition_time_range(child_prefix[len(prefix):])
+            return time_range is not None and time_range[1] <= cutoff
+
+        objects = list()
+        frontier = [prefix]
+        while frontier:
+            levels = await asyncio.gather(*(self.list_s3_objects(level_prefix, delimiter="/")
+                                            for level_prefix in frontier))
+            frontier = list()
+            for level_objects, child_prefixes in levels:
+                objects.extend(level_objects)
+                frontier.extend(child_prefix for child_prefix in child_prefixes if not is_pruned(child_prefix))
+        return objects
+
+    """
+    The awaitable DataLoader.get_latest_files_from_s3_using_bookmark
+    """
+
+    async def get_latest_files_from_s3_using_bookmark(self, last_read_timestamp, last_read_key: str = None):
+        data_loader = self.data_loader
+        if data_loader.inventory_location is not None or data_loader.manifest_location is not None:
+            # one bulk read of the report rather than many listing pages, read off the event loop
+            return await asyncio.get_running_loop().run_in_executor(
+                None, data_loader.get_latest_files_from_s3_using_bookmark, last_read_timestamp, last_read_key)
+
+        with data_loader.metrics.timer("list"):
+            if data_loader.key_ordered:
+                objects, _ = await self.list_s3_objects(data_loader.s3_location, start_after=last_read_key)
+            elif data_loader.partition_pruning:
+                objects = await self.list_s3_objects_with_partition_pruning(
+                    modified_after=data_loader.bookmark_datetime(last_read_timestamp),
+                    lookback=datetime.timedelta(seconds=data_loader.partition_lookback_seconds))
+            else:
+                objects, _ = await self.list_s3_objects(data_loader.s3_location)
+            return data_loader.select_new_files(objects, last_read_timestamp)
+
+    """
+    The awaitable DataLoader.get_latest_bookmark_from_db
+    """
+
+    async def get_latest_bookmark_from_db(self, status="COMPLETE") -> dict:
+        data_loader = self.data_loader
+        with data_loader.metrics.timer("bookmark_read"):
+            if data_loader.bookmark_layout == "latest_pointer":
+                response = await self.dynamodb_client.get_item(
+                    TableName=data_loader.dynamo_db_table_for_bookmark_storage,
+                    Key=data_loader.latest_pointer_key(),
+                    ConsistentRead=True,
+                )
+                return data_loader.bookmark_from_latest_pointer(response.get('Item', {}), status=status)
+
+            query_kwargs = data_loader.latest_bookmark_query_kwargs(status=status)
+            while True:
+                result = await self.dynamodb_client.query(**query_kwargs)
+                if len(result['Items']) >= 1:
+                    return data_loader.bookmark_from_history_item(result['Items'][0])
+                if 'LastEvaluatedKey' not in result:
+                    return {"bookmark_timestamp": 0, "last_processed_key": None}
+                query_kwargs['ExclusiveStartKey'] = result['LastEvaluatedKey']
+
+    async def get_latest_timestamp_from_db(self, status="COMPLETE"):
+        return (await self.get_latest_bookmark_from_db(status=status))["bookmark_timestamp"]
+
+    """
+    The awaitable DataLoader.register_bookmark
+    """
+
+    async def register_bookmark(self, latest_timestamp, status="IN_PROGRESS", last_processed_key: str = None,
+                                only_forward: bool = False, clear_in_progress: bool = False):
+        data_loader = self.data_loader
+        with data_loader.metrics.timer("bookmark_write"):
+            if data_loader.bookmark_layout == "latest_pointer":
+                await self.dynamodb_client.update_item(**data_loader.latest_pointer_update_kwargs(
+                    latest_timestamp, status=status, last_processed_key=last_processed_key,
+                    only_forward=only_forward, clear_in_progress=clear_in_progress))
+                if not data_loader.write_history:
+                    return
+
+            await self.put_history_item(latest_timestamp, status=status, last_processed_key=last_processed_key)
+
+    """
+    The awaitable DataLoader.put_history_item
+    """
+
+    async def put_history_item(self, latest_timestamp, status="IN_PROGRESS", last_processed_key: str = None):
+        try:
+            await self.dynamodb_client.put_item(**self.data_loader.put_history_item_kwargs(
+                latest_timestamp, status=status, last_processed_key=last_processed_key))
+        except self.dynamodb_client.exceptions.ConditionalCheckFailedException:
+            print(f"the COMPLETE bookmark is already at {latest_timestamp.strftime('%s')}")
+
+    """
+    Download a file and parse it off the event loop
+    """
+
+    async def read_file_from_s3(self, file):
+        data_loader = self.data_loader
+        async with self.__read_semaphore:
+            with data_loader.metrics.timer("download"):
+                response = await self.s3_client.get_object(Bucket=data_loader.s3_bucket_name, Key=file.key)
+                async with response['Body'] as stream:
+                    body = await stream.read()
+            with data_loader.metrics.timer("parse"):
+                df = await asyncio.get_running_loop().run_in_executor(
+                    None, data_loader.read_file_from_bytes, file, body)
+        data_loader.metrics.increment("files")
+        data_loader.metrics.increment("bytes_read", file.size)
+        return df
+
+    """
+    The awaitable DataLoader.load_data_from_s3: all the new files are downloaded concurrently, up to
+    max_concurrency at once, and the IN_PROGRESS bookmark is registered once they have all been loaded
+    """
+
+    async def load_data_from_s3(self) -> "pd.DataFrame":
+        data_loader = self.data_loader
+        try:
+            with data_loader.metrics.timer("load_data_from_s3"):
+                return await self.__load_data_from_s3()
+        finally:
+            data_loader.metrics.flush(operation="load_data_from_s3")
+
+    async def __load_data_from_s3(self):
+        data_loader = self.data_loader
+        existing_bookmark = await self.get_latest_bookmark_from_db(status="COMPLETE")
+        existing_timestamp = existing_bookmark["bookmark_timestamp"]
+        print(f"existing timestamp {existing_timestamp}")
+
+        latest_timestamp, files_to_process = await self.get_latest_files_from_s3_using_bookmark(
+            existing_timestamp, existing_bookmark["last_processed_key"])
+        if not files_to_process:
+            print("there are no files to process")
+            return data_loader.concat_loaded_data([])
+
+        start_time = time.time()
+        dataframes = await asyncio.gather(*(self.read_file_from_s3(file) for file in files_to_process))
+        final_dataframe_with_latest_data = await asyncio.get_running_loop().run_in_executor(
+            None, data_loader.concat_loaded_data, list(dataframes))
+        data_loader.metrics.increment("rows", final_dataframe_with_latest_data.shape[0])
+        self.__last_load_stats = data_loader.compute_load_stats(
+            files_to_process, final_dataframe_with_latest_data.shape[0], time.time() - start_time)
+        print(f"loaded {len(files_to_process)} files, {final_dataframe_with_latest_data.shape[0]} rows "
+              f"in {self.__last_load_stats['seconds']:.2f} seconds "
+              f"({self.__last_load_stats['megabytes_per_second']:.2f} MB/s)")
+
+        await self.register_bookmark(**data_loader.loaded_files_bookmark_kwargs(
+            existing_timestamp, latest_timestamp, files_to_process))
+        print("Data Load completed successfully")
+        return final_dataframe_with_latest_data
+
+    """
+    The awaitable DataLoader.commit
+    """
+
+    async def commit(self):
+        data_loader = self.data_loader
+        try:
+            with data_loader.metrics.timer("commit"):
+                if data_loader.bookmark_layout == "latest_pointer":
+                    await self.commit_latest_pointer()
+                    return
+
+                in_progress_bookmark = await self.get_latest_bookmark_from_db(status="IN_PROGRESS")
+                await self.register_bookmark(**data_loader.committed_bookmark_kwargs(in_progress_bookmark))
+        finally:
+            data_loader.metrics.flush(operation="commit")
+
+    async def commit_latest_pointer(self):
+        data_loader = self.data_loader
+        try:
+            result = await self.dynamodb_client.update_item(**data_loader.commit_latest_pointer_kwargs())
+        except self.dynamodb_client.exceptions.ConditionalCheckFailedException:
+            print("there is no in progress bookmark to commit")
+            return
+
+        if data_loader.write_history:
+            await self.put_history_item(**data_loader.committed_history_item_kwargs(result['Attributes']))
@@ -2,21 +2,89 @@
 This simple utility reads the data from S3 and does checkpoint the information about last read location
 """
 
+import contextlib
 import datetime
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-import pandas as pd
 import boto3
-import awswrangler as wr
-import pytest
 import logging
 
 logger = logging.getLogger("root")
-from typing import List
-from .helpers import create_dynamodb_table_if_not_exists
+from typing import TYPE_CHECKING, Callable, List, Iterator
+from .metrics import NULL_METRICS, MeteredStream, Metrics, timed
+from .object_cache import ObjectCache
+from .helpers import (
+    COMPRESSION_EXTENSIONS,
+    S3SeekableFile,
+    apply_row_filters,
+    batch_delete_dynamodb_items,
+    create_dynamodb_table_if_not_exists,
+    filter_manifest_table,
+    find_latest_inventory_manifest_key,
+    get_boto3_client,
+    get_compression,
+    arrow_ipc_to_table,
+    get_default_boto3_session,
+    list_s3_objects,
+    list_s3_objects_with_partition_pruning,
+    open_decompressed_stream,
+    optimize_dataframe_dtypes,
+    parse_csv,
+    parse_file_body,
+    parse_file_bytes,
+    parse_xml,
+    read_file_manifest,
+    read_inventory_file,
+    split_s3_url,
+    strip_compression_extension,
+    unify_categorical_columns,
+    validate_row_filters,
+)
+
+# pandas, pyarrow and awswrangler take seconds to import, they are only imported when files are actually read
+if TYPE_CHECKING:  # pragma: no cover
+    import pandas as pd
+
+# sort key of the single "current state" item per job used by the latest_pointer bookmark layout,
+# history items always have a positive epoch timestamp as sort key
+LATEST_POINTER_BOOKMARK_TIMESTAMP = -1
+
+# sort key of the csv schema registry item of a job
+SCHEMA_REGISTRY_BOOKMARK_TIMESTAMP = -2
+
+# sort key of the resumable load checkpoint item of a job
+CHECKPOINT_BOOKMARK_TIMESTAMP = -3
+
+# number of rows parsed at once when row filters are applied while reading csv files
+CSV_FILTER_CHUNK_SIZE = 100000
+
+# number of xml records flattened into a dataframe at once
+XML_RECORD_BATCH_SIZE = 100000
+
+# the manifest rows are filtered against the bookmark with this margin, the exact comparison is then done on the
+# candidates like for the listed objects (naive datetimes in the local time zone, 14 hours is the largest UTC offset)
+MANIFEST_TIMESTAMP_MARGIN_SECONDS = 14 * 3600
+
+# dynamodb TTL attribute of the history items
+HISTORY_TTL_ATTRIBUTE_NAME = "expires_at"
+
+# (region, table name, check) of the bookmark table checks already done in this process
+_validated_bookmark_tables = set()
+_validated_bookmark_tables_lock = threading.Lock()
 
 
 class DataLoader(object):
     valid_file_formats = ["csv", "parquet", "json", "xml"]
+    valid_bookmark_layouts = ["history", "latest_pointer"]
+    valid_output_formats = ["pandas", "arrow"]
+    # formats also read from gzip, bz2 and zstd compressed files (e.g. data.csv.gz), parquet is compressed internally
+    compressible_file_formats = ["csv", "json", "xml"]
     """
     The constructor initializes the utility with S3 location information and table to store bookmark info.
     """
@@ -26,12 +94,80 @@ class DataLoader(object):
                  s3_location: str,
                  format_of_data: str,
                  job_name: str,
-                 dynamo_db_table_for_bookmark_storage: str = "bookmark_table"):
+                 dynamo_db_table_for_bookmark_storage: str = "bookmark_table",
+                 max_workers: int = 1,
+                 key_ordered: bool = False,
+                 partition_pruning: bool = False,
+                 partition_lookback_seconds: int = 86400,
+                 bookmark_layout: str = "history",
+                 write_history: bool = True,
+                 history_ttl_seconds: int = None,
+                 boto3_session: boto3.session.Session = None,
+                 max_pool_connections: int = None,
+                 columns: List[str] = None,
+                 filters: List[tuple] = None,
+                 parquet_dataset_mode: bool = False,
+                 output_format: str = "pandas",
+                 optimize_dtypes: bool = False,
+                 category_max_ratio: float = 0.5,
+                 use_arrow_strings: bool = False,
+                 use_schema_registry: bool = False,
+                 cache_dir: str = None,
+                 cache_max_bytes: int = 10 * 1024 ** 3,
+                 large_object_threshold_bytes: int = None,
+                 range_size_bytes: int = 64 * 1024 ** 2,
+                 range_concurrency: int = 8,
+                 xml_record_path: str = None,
+                 parse_processes: int = None,
+                 metrics_sinks: List[Callable[[dict], None]] = None,
+                 inventory_location: str = None,
+                 manifest_location: str = None):
         self.s3_bucket_name = s3_bucket_name
         self.s3_location = s3_location
         self.format_of_the_data = format_of_data
         self.job_name = job_name
+        self.boto3_session = boto3_session
+        self.max_workers = max_workers
+        self.max_pool_connections = max_pool_connections
         self.dynamo_db_table_for_bookmark_storage = dynamo_db_table_for_bookmark_storage
+        self.key_ordered = key_ordered
+        self.partition_pruning = partition_pruning
+        self.partition_lookback_seconds = partition_lookback_seconds
+        self.bookmark_layout = bookmark_layout
+        self.write_history = write_history
+        self.history_ttl_seconds = history_ttl_seconds
+        self.columns = columns
+        self.filters = filters
+        self.parquet_dataset_mode = parquet_dataset_mode
+        self.output_format = output_format
+        self.optimize_dtypes = optimize_dtypes
+        self.category_max_ratio = category_max_ratio
+        self.use_arrow_strings = use_arrow_strings
+        self.use_schema_registry = use_schema_registry
+        self.__registered_csv_dtypes = None
+        self.__schema_drifts = []
+        self.__schema_registry_lock = threading.RLock()
+        self.__object_cache = ObjectCache(cache_dir, max_bytes=cache_max_bytes) if cache_dir else None
+        self.large_object_threshold_bytes = large_object_threshold_bytes
+        self.range_size_bytes = range_size_bytes
+        self.range_concurrency = range_concurrency
+        self.__local_copy_paths = {}
+        self.xml_record_path = xml_record_path
+        self.__metrics = Metrics(metrics_sinks, dimensions={"job_name": job_name}) if metrics_sinks else NULL_METRICS
+        if self.format_of_the_data == "xml" and self.xml_record_path is None:
+            raise Exception("xml_record_path is required to read xml files")
+        if self.use_schema_registry and self.output_format == "arrow":
+            raise Exception("use_schema_registry is not supported with the arrow output format")
+        self.parse_processes = parse_processes
+        self.inventory_location = inventory_location
+        self.manifest_location = manifest_location
+        if self.inventory_location is not None and self.manifest_location is not None:
+            raise Exception("Only one of inventory_location and manifest_location should be given")
+        self.__parse_process_pool = None
+        self.__parse_process_pool_lock = threading.Lock()
+        if self.history_ttl_seconds is not None:
+            self.enable_history_ttl()
+        self.__last_load_stats = {}
 
     @property
     def s3_bucket_name(self):
@@ -66,8 +202,13 @@ class DataLoader(object):
 
     @dynamo_db_table_for_bookmark_storage.setter
     def dynamo_db_table_for_bookmark_storage(self, value):
+        # The table checks below are control plane calls, only do them once per process and table
+        if self.is_bookmark_table_validated(value, "schema"):
+            self.__dynamo_db_table_for_bookmark_storage = value
+            return
+
         # Ensure the table exists (already created or just create a new one)
-        dynamodb_boto3_client = boto3.client("dynamodb")
+        dynamodb_boto3_client = self.dynamodb_client
         create_table_kwargs = dict(
             TableName=value,
             KeySchema=[
@@ -110,8 +251,52 @@ class DataLoader(object):
         if sort_key != "bookmark_timestamp":  # pragma: no cover
             raise Exception("Sort key name is not incorrect. It should be bookmark_timestamp")
 
+        self.mark_bookmark_table_validated(value, "schema")
         self.__dynamo_db_table_for_bookmark_storage = value
 
+    def is_bookmark_table_validated(self, table_name: str, check: str) -> bool:
+        with _validated_bookmark_tables_lock:
+            return (self.boto3_session.region_name, table_name, check) in _validated_bookmark_tables
+
+    def mark_bookmark_table_validated(self, table_name: str, check: str):
+        with _validated_bookmark_tables_lock:
+            _validated_bookmark_tables.add((self.boto3_session.region_name, table_name, check))
+
+    @property
+    def boto3_session(self):
+        """
+        The boto3 session used for every AWS call. Defaults to a session shared by the whole process.
+        """
+        return self.__boto3_session
+
+    @boto3_session.setter
+    def boto3_session(self, value):
+        self.__boto3_session = value if value is not None else get_default_boto3_session()
+
+    @property
+    def max_pool_connections(self):
+        """
+        Size of the http connection pool of the S3 and DynamoDB clients, defaults to max(10, max_workers).
+        """
+        return self.__max_pool_connections
+
+    @max_pool_connections.setter
+    def max_pool_connections(self, value):
+        if value is None:
+            value = max(10, self.max_workers)
+        if not isinstance(value, int) or value < 1:
+            raise Exception("max_pool_connections should be a positive integer")
+
+        self.__max_pool_connections = value
+
+    @property
+    def s3_client(self):
+        return get_boto3_client(self.boto3_session, "s3", max_pool_connections=self.max_pool_connections)
+
+    @property
+    def dynamodb_client(self):
+        return get_boto3_client(self.boto3_session, "dynamodb", max_pool_connections=self.max_pool_connections)
+
     @property
     def job_name(self):
         return self.__job_name
@@ -120,6 +305,370 @@ class DataLoader(object):
     def job_name(self, value):
         self.__job_name = value
 
+    @property
+    def max_workers(self):
+        return self.__max_workers
+
+    @max_workers.setter
+    def max_workers(self, value):
+        if not isinstance(value, int) or value < 1:
+            raise Exception("max_workers should be a positive integer")
+
+        self.__max_workers = value
+
+    @property
+    def key_ordered(self):
+        """
+        Whether the S3 keys are lexicographically increasing (e.g. timestamps or sequence numbers in the key).
+        In that case the last processed key is bookmarked and listing resumes after it.
+        """
+        return self.__key_ordered
+
+    @key_ordered.setter
+    def key_ordered(self, value):
+        self.__key_ordered = bool(value)
+
+    @property
+    def partition_pruning(self):
+        """
+        Whether the S3 location is hive partitioned by time (``dt=YYYY-MM-DD/hour=HH/`` and alike).
+        In that case partitions entirely older than the bookmark are not listed at all.
+        Ignored in key ordered mode.
+        """
+        return self.__partition_pruning
+
+    @partition_pruning.setter
+    def partition_pruning(self, value):
+        self.__partition_pruning = bool(value)
+
+    @property
+    def partition_lookback_seconds(self):
+        """
+        How long after the end of its time range a partition may still receive late files.
+        """
+        return self.__partition_lookback_seconds
+
+    @partition_lookback_seconds.setter
+    def partition_lookback_seconds(self, value):
+        if not isinstance(value, int) or value < 0:
+            raise Exception("partition_lookback_seconds should be a non negative integer")
+
+        self.__partition_lookback_seconds = value
+
+    @property
+    def bookmark_layout(self):
+        """
+        How bookmarks are stored in the DynamoDB table:
+
+        - ``history``: one item per load and commit, the latest one is found with a Query.
+        - ``latest_pointer``: one "current state" item per job, read with GetItem and advanced with
+          a conditional UpdateItem, so reads and commits cost one round trip regardless of job age.
+          History items are still written as an audit trail when ``write_history`` is true.
+        """
+        return self.__bookmark_layout
+
+    @bookmark_layout.setter
+    def bookmark_layout(self, value):
+        if value not in self.valid_bookmark_layouts:
+            raise Exception("Bookmark layout is not valid. Layout should be one of history and latest_pointer")
+
+        self.__bookmark_layout = value
+
+    @property
+    def write_history(self):
+        return self.__write_history
+
+    @write_history.setter
+    def write_history(self, value):
+        self.__write_history = bool(value)
+
+    @property
+    def history_ttl_seconds(self):
+        """
+        When set, history items expire (DynamoDB TTL) this many seconds after they are written.
+        Only allowed with the latest_pointer layout, in the history layout the newest history item is the bookmark.
+        """
+        return self.__history_ttl_seconds
+
+    @history_ttl_seconds.setter
+    def history_ttl_seconds(self, value):
+        if value is not None:
+            if not isinstance(value, int) or value < 1:
+                raise Exception("history_ttl_seconds should be a positive integer")
+            if self.bookmark_layout != "latest_pointer":
+                raise Exception("history_ttl_seconds requires the latest_pointer bookmark layout")
+
+        self.__history_ttl_seconds = value
+
+    @property
+    def columns(self):
+        """
+        Columns to load, all of them when None. Only these column chunks are fetched from parquet files
+        and only these columns are parsed from csv files.
+        """
+        return self.__columns
+
+    @columns.setter
+    def columns(self, value):
+        self.__columns = list(value) if value is not None else None
+
+    @property
+    def filters(self):
+        """
+        Row filters, a list of ``(column, operator, value)`` tuples which should all match, e.g.
+        ``[("country", "==", "US"), ("amount", ">", 0)]``. They are pushed down to parquet files
+        (row groups that can't match are never fetched) and applied chunk by chunk while parsing csv files.
+        """
+        return self.__filters
+
+    @filters.setter
+    def filters(self, value):
+        if value is not None:
+            value = [tuple(row_filter) for row_filter in value]
+            validate_row_filters(value)
+
+        self.__filters = value
+
+    @property
+    def parquet_dataset_mode(self):
+        """
+        Whether ``load_data_from_s3`` reads all the new parquet files as one dataset, with unified schemas
+        and without the per file pandas conversion and the final concat copy.
+        """
+        return self.__parquet_dataset_mode
+
+    @parquet_dataset_mode.setter
+    def parquet_dataset_mode(self, value):
+        self.__parquet_dataset_mode = bool(value)
+
+    @property
+    def output_format(self):
+        """
+        What the loads return: ``pandas`` dataframes, or ``arrow`` tables (``pyarrow.Table``) built by zero copy
+        concatenation of the per file tables, call ``to_pandas()`` on them only when needed.
+        With ``arrow``, json and xml files are still parsed by pandas, hence every column of theirs should hold
+        values of a single type (pandas keeps mixed types in object columns, which arrow can't convert), and the
+        csv schema registry isn't supported.
+        """
+        return self.__output_format
+
+    @output_format.setter
+    def output_format(self, value):
+        if value not in self.valid_output_formats:
+            raise Exception("Output format is not valid. Format should be one of pandas and arrow")
+
+        self.__output_format = value
+
+    @property
+    def optimize_dtypes(self):
+        """
+        Whether every loaded pandas dataframe gets smaller dtypes before concatenation: categoricals for low
+        cardinality strings (at most ``category_max_ratio`` distinct values per row), downcast numerics and,
+        with ``use_arrow_strings``, arrow backed strings for the other string columns.
+        """
+        return self.__optimize_dtypes
+
+    @optimize_dtypes.setter
+    def optimize_dtypes(self, value):
+        self.__optimize_dtypes = bool(value)
+
+    @property
+    def category_max_ratio(self):
+        return self.__category_max_ratio
+
+    @category_max_ratio.setter
+    def category_max_ratio(self, value):
+        if not 0 <= value <= 1:
+            raise Exception("category_max_ratio should be between 0 and 1")
+
+        self.__category_max_ratio = value
+
+    @property
+    def use_arrow_strings(self):
+        return self.__use_arrow_strings
+
+    @use_arrow_strings.setter
+    def use_arrow_strings(self, value):
+        self.__use_arrow_strings = bool(value)
+
+    @property
+    def use_schema_registry(self):
+        """
+        Whether the dtypes inferred from the first csv file of the job are stored in the bookmark table and
+        passed as explicit ``dtype=`` on the later reads: no type inference, and consistent dtypes across files
+        so that the concat doesn't upcast. Files which don't match are reported in ``schema_drifts``.
+        """
+        return self.__use_schema_registry
+
+    @use_schema_registry.setter
+    def use_schema_registry(self, value):
+        self.__use_schema_registry = bool(value)
+
+    @property
+    def schema_drifts(self):
+        """
+        The differences found between the registered csv dtypes and the files read by this DataLoader.
+        """
+        return self.__schema_drifts
+
+    @property
+    def object_cache(self):
+        """
+        The local object cache (``cache_dir``, at most ``cache_max_bytes``) consulted before S3, None if disabled.
+        """
+        return self.__object_cache
+
+    @property
+    def large_object_threshold_bytes(self):
+        """
+        Objects of at least this size are downloaded with concurrent byte-range GETs before being parsed,
+        instead of being read through a single stream. Disabled when None.
+        """
+        return self.__large_object_threshold_bytes
+
+    @large_object_threshold_bytes.setter
+    def large_object_threshold_bytes(self, value):
+        if value is not None and (not isinstance(value, int) or value < 1):
+            raise Exception("large_object_threshold_bytes should be a positive integer")
+
+        self.__large_object_threshold_bytes = value
+
+    @property
+    def range_size_bytes(self):
+        return self.__range_size_bytes
+
+    @range_size_bytes.setter
+    def range_size_bytes(self, value):
+        # S3 multipart parts can't be smaller than 5 MiB, keep the ranges in line with them
+        if not isinstance(value, int) or value < 5 * 1024 ** 2:
+            raise Exception("range_size_bytes should be an integer of at least 5 MiB")
+
+        self.__range_size_bytes = value
+
+    @property
+    def range_concurrency(self):
+        return self.__range_concurrency
+
+    @range_concurrency.setter
+    def range_concurrency(self, value):
+        if not isinstance(value, int) or value < 1:
+            raise Exception("range_concurrency should be a positive integer")
+
+        self.__range_concurrency = value
+
+    @property
+    def xml_record_path(self):
+        """
+        Slash separated tags from the root element of the xml files to their record elements, e.g. "catalog/book".
+        """
+        return self.__xml_record_path
+
+    @xml_record_path.setter
+    def xml_record_path(self, value):
+        if value is not None and (not isinstance(value, str) or not value.strip("/")):
+            raise Exception("xml_record_path should be a non empty string")
+
+        self.__xml_record_path = value
+
+    @property
+    def inventory_location(self):
+        """
+        ``s3://`` url of an S3 Inventory configuration of the bucket (``<destination prefix>/<source bucket>/
+        <configuration id>/``, the latest report is used) or of the ``manifest.json`` of a report. New files are then
+        found in the report instead of listing the location. Reports are daily or weekly, a file written after the
+        latest report is picked up once a report includes it.
+        """
+        return self.__inventory_location
+
+    @inventory_location.setter
+    def inventory_location(self, value):
+        if value is not None and (not isinstance(value, str) or not value.startswith("s3://")):
+            raise Exception("inventory_location should be an s3:// url")
+
+        self.__inventory_location = value
+
+    @property
+    def manifest_location(self):
+        """
+        ``s3://`` url of a manifest written by the producer of the data, a csv, json lines or parquet file with a row
+        per data file (key, size, last_modified and optionally e_tag columns), read instead of listing the location.
+        """
+        return self.__manifest_location
+
+    @manifest_location.setter
+    def manifest_location(self, value):
+        if value is not None and (not isinstance(value, str) or not value.startswith("s3://")):
+            raise Exception("manifest_location should be an s3:// url")
+
+        self.__manifest_location = value
+
+    @property
+    def parse_processes(self):
+        """
+        Number of processes parsing csv, json and xml files, files are parsed by the reading threads when None.
+        Downloads stay in threads, max(max_workers, parse_processes) of them, to keep the processes busy.
+        With the arrow output format, csv files are parsed by the multithreaded pyarrow reader instead.
+        """
+        return self.__parse_processes
+
+    @parse_processes.setter
+    def parse_processes(self, value):
+        if value is not None and (not isinstance(value, int) or value < 1):
+            raise Exception("parse_processes should be a positive integer")
+
+        self.__parse_processes = value
+
+    @property
+    def parse_process_pool(self) -> ProcessPoolExecutor:
+        """
+        The pool of parse_processes processes, started on first use and reused by the later loads. Processes are
+        spawned rather than forked, forking a process running threads (boto3, readers) isn't safe, hence the
+        script creating the DataLoader should guard its entry point with ``if __name__ == "__main__":``.
+        """
+        with self.__parse_process_pool_lock:
+            if self.__parse_process_pool is None:
+                self.__parse_process_pool = ProcessPoolExecutor(
+                    max_workers=self.parse_processes, mp_context=multiprocessing.get_context("spawn"))
+            return self.__parse_process_pool
+
+    """
+    Stop the parsing processes, if any. They are started again when needed.
+    """
+
+    def close(self):
+        with self.__parse_process_pool_lock:
+            if self.__parse_process_pool is not None:
+                self.__parse_process_pool.shutdown()
+                self.__parse_process_pool = None
+
+    @property
+    def metrics(self):
+        """
+        Timers and counters of the phases of the loads (listing, bookmark reads and writes, downloads, parsing),
+        sent to the metrics sinks at the end of every load, batch and commit. Every call is a no-op without sinks.
+        """
+        return self.__metrics
+
+    @property
+    def transfer_config(self):
+        """
+        The s3transfer settings of the large object downloads: ``range_concurrency`` concurrent GETs of
+        ``range_size_bytes`` each.
+        """
+        from boto3.s3.transfer import TransferConfig
+
+        return TransferConfig(multipart_threshold=self.range_size_bytes,
+                              multipart_chunksize=self.range_size_bytes,
+                              max_concurrency=self.range_concurrency,
+                              use_threads=True)
+
+    @property
+    def last_load_stats(self):
+        """
+        Throughput figures of the last ``load_data_from_s3`` run, useful to tune ``max_workers``.
+        """
+        return self.__last_load_stats
+
     """
     process s3 file location information
     """
@@ -136,117 +685,1218 @@ class DataLoader(object):
         list_of_files_to_process = [f"s3://{self.s3_bucket_name}/{file['Key']}" for file in files]
         return latest_timestamp, list_of_files_to_process
 
+    """
+    Whether an S3 key holds data of the format of this DataLoader, either plain or compressed
+    """
+
+    def is_data_file(self, key: str) -> bool:
+        if key.endswith(self.format_of_the_data):
+            return True
+        return (self.format_of_the_data in self.compressible_file_formats
+                and get_compression(key) is not None
+                and strip_compression_extension(key).endswith(self.format_of_the_data))
+
     """
     This method uses the latest timestamp picked up from Dynamo DB and separates the S3 files 
     which are modified or added after that.
+    In key ordered mode the listing resumes after the last processed key instead, so only new
+    keys are listed. With partition pruning, time partitions older than the bookmark are not listed.
+    With an inventory or manifest location, the candidates are read from there instead of listing the location.
+    Files are returned newest first (or highest key first in key ordered mode).
     """
 
-    def get_latest_files_from_s3_using_bookmark(self, last_read_timestamp):
+    @timed("list")
+    def get_latest_files_from_s3_using_bookmark(self, last_read_timestamp, last_read_key: str = None):
+        s3_boto3_client = self.s3_client
 
-        import boto3
-        import datetime
+        if self.inventory_location is not None or self.manifest_location is not None:
+            objects_to_filter = self.list_objects_from_manifest(last_read_timestamp, last_read_key)
+        elif self.key_ordered:
+            objects_to_filter = list_s3_objects(s3_client=s3_boto3_client,
+                                                bucket=self.s3_bucket_name,
+                                                prefix=self.s3_location,
+                                                start_after=last_read_key,
+                                                metrics=self.metrics)
+        elif self.partition_pruning:
+            objects_to_filter = list_s3_objects_with_partition_pruning(
+                s3_client=s3_boto3_client,
+                bucket=self.s3_bucket_name,
+                prefix=self.s3_location,
+                modified_after=self.bookmark_datetime(last_read_timestamp),
+                lookback=datetime.timedelta(seconds=self.partition_lookback_seconds),
+                max_workers=self.max_workers,
+                metrics=self.metrics)
+        else:
+            objects_to_filter = list_s3_objects(s3_client=s3_boto3_client,
+                                                bucket=self.s3_bucket_name,
+                                                prefix=self.s3_location,
+                                                metrics=self.metrics)
 
-        # bucket Resource
-        s3 = boto3.resource('s3')
-        bucket = s3.Bucket(self.s3_bucket_name)
+        return self.select_new_files(objects_to_filter, last_read_timestamp)
 
-        date_time_for_filter = datetime.datetime.fromtimestamp(last_read_timestamp)
+    """
+    Read the candidate new files from the S3 Inventory report or the producer manifest: one bulk read per report
+    file (concurrently, up to max_workers) filtered with vectorized operations on the location, the file
+    extension and the bookmark, only the candidates are turned into object summaries
+    """
+
+    def list_objects_from_manifest(self, last_read_timestamp, last_read_key: str = None) -> list:
+        suffixes = [self.format_of_the_data]
+        if self.format_of_the_data in self.compressible_file_formats:
+            suffixes += [f"{self.format_of_the_data}{extension}" for extension in COMPRESSION_EXTENSIONS]
+        filter_kwargs = dict(prefix=self.s3_location, suffixes=suffixes)
+        if self.key_ordered:
+            filter_kwargs["start_after"] = last_read_key
+        else:
+            filter_kwargs["modified_after"] = last_read_timestamp - MANIFEST_TIMESTAMP_MARGIN_SECONDS
 
-        objects_to_filter = bucket.objects.filter(Prefix=self.s3_location)
+        if self.manifest_location is not None:
+            bucket, key = split_s3_url(self.manifest_location)
+            table = read_file_manifest(self.s3_client, bucket, key)
+            self.metrics.increment("manifest_rows", table.num_rows)
+            return filter_manifest_table(table, **filter_kwargs)
 
-        files = sorted((file for file in objects_to_filter if
-                        (file.last_modified.replace(tzinfo=None) > date_time_for_filter) and file.key.endswith(
-                            self.format_of_the_data)),
-                       key=lambda file_name: file_name.last_modified.replace(tzinfo=None), reverse=True)
+        bucket, key = split_s3_url(self.inventory_location)
+        if not key.endswith("manifest.json"):
+            key = find_latest_inventory_manifest_key(self.s3_client, bucket, key)
+        manifest = json.loads(self.s3_client.get_object(Bucket=bucket, Key=key)['Body'].read())
+        print(f"reading the inventory report s3://{bucket}/{key} ({len(manifest['files'])} files)")
+        # the data files are in the destination bucket, given as an ARN
+        destination_bucket = manifest["destinationBucket"].split(":::")[-1]
 
+        def read_inventory_candidates(inventory_file: dict) -> list:
+            table = read_inventory_file(self.s3_client, destination_bucket, inventory_file["key"],
+                                        file_format=manifest["fileFormat"], file_schema=manifest.get("fileSchema", ""))
+            self.metrics.increment("manifest_rows", table.num_rows)
+            return filter_manifest_table(table, **filter_kwargs)
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, max(len(manifest["files"]), 1))) as executor:
+            return [
+                candidate
+                for candidates in executor.map(read_inventory_candidates, manifest["files"])
+                for candidate in candidates
+            ]
+
+    """
+    Keep the listed objects which are new data files, newest first (highest key first in key ordered mode, the
+    listing already started after the last processed key), and find the bookmark timestamp they lead to
+    """
+
+    def select_new_files(self, objects, last_read_timestamp):
+        if self.key_ordered:
+            files = sorted((file for file in self.count_scanned_objects(objects) if self.is_data_file(file.key)),
+                           key=lambda file_name: file_name.key, reverse=True)
+        else:
+            date_time_for_filter = self.bookmark_datetime(last_read_timestamp)
+            files = sorted((file for file in self.count_scanned_objects(objects) if
+                            (file.last_modified.replace(tzinfo=None) > date_time_for_filter) and self.is_data_file(
+                                file.key)),
+                           key=lambda file_name: file_name.last_modified.replace(tzinfo=None), reverse=True)
+
+        self.metrics.increment("objects_kept", len(files))
         if len(files) < 1:
             return None, []
         else:
-            latest_timestamp = files[0].last_modified.replace(tzinfo=None)
+            latest_timestamp = max(file.last_modified for file in files).replace(tzinfo=None)
             return latest_timestamp, files
 
+    """
+    The naive local time datetime of a bookmark timestamp, bookmarks are encoded in local time with strftime('%s')
+    """
+
+    def bookmark_datetime(self, bookmark_timestamp) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(bookmark_timestamp)
+
+    def count_scanned_objects(self, objects):
+        if not self.metrics.enabled:
+            return objects
+        return self.__counted_objects(objects)
+
+    def __counted_objects(self, objects):
+        count = 0
+        for listed_object in objects:
+            count += 1
+            yield listed_object
+        self.metrics.increment("objects_scanned", count)
+
     """
     This method registers the information about the last read timestamp in DynamoDB table
     """
 
-    def register_bookmark(self, latest_timestamp, status="IN_PROGRESS"):
-        dynamodb_boto3_client = boto3.client("dynamodb")
-        dynamodb_boto3_client.put_item(
+    @timed("bookmark_write")
+    def register_bookmark(self, latest_timestamp, status="IN_PROGRESS", last_processed_key: str = None,
+                          only_forward: bool = False, clear_in_progress: bool = False):
+        if self.bookmark_layout == "latest_pointer":
+            self.update_latest_pointer(latest_timestamp, status=status, last_processed_key=last_processed_key,
+                                       only_forward=only_forward, clear_in_progress=clear_in_progress)
+            if not self.write_history:
+                return
+
+        self.put_history_item(latest_timestamp, status=status, last_processed_key=last_processed_key)
+
+    """
+    This method appends a bookmark item to the history of the job. An IN_PROGRESS item never replaces the COMPLETE
+    item of the same second, which is the bookmark: that COMPLETE item already is the bookmark it would lead to.
+    """
+
+    def put_history_item(self, latest_timestamp, status="IN_PROGRESS", last_processed_key: str = None):
+        dynamodb_boto3_client = self.dynamodb_client
+        try:
+            dynamodb_boto3_client.put_item(**self.put_history_item_kwargs(
+                latest_timestamp, status=status, last_processed_key=last_processed_key))
+        except dynamodb_boto3_client.exceptions.ConditionalCheckFailedException:
+            print(f"the COMPLETE bookmark is already at {latest_timestamp.strftime('%s')}")
+
+    def put_history_item_kwargs(self, latest_timestamp, status="IN_PROGRESS", last_processed_key: str = None) -> dict:
+        put_item_kwargs = dict(
             TableName=self.dynamo_db_table_for_bookmark_storage,
-            Item={
-                'job_name': {'S': self.job_name},
-                'bookmark_timestamp': {'N': latest_timestamp.strftime('%s')},
-                'data_load_timestamp': {'N': datetime.datetime.now().strftime('%s')},
-                'status': {'S': status}
-            }
+            Item=self.history_item(latest_timestamp, status=status, last_processed_key=last_processed_key)
         )
+        if status != "COMPLETE":
+            put_item_kwargs.update(
+                ConditionExpression="attribute_not_exists(#status) OR #status <> :complete",
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={':complete': {'S': "COMPLETE"}},
+            )
+        return put_item_kwargs
+
+    def history_item(self, latest_timestamp, status="IN_PROGRESS", last_processed_key: str = None) -> dict:
+        item = {
+            'job_name': {'S': self.job_name},
+            'bookmark_timestamp': {'N': latest_timestamp.strftime('%s')},
+            'data_load_timestamp': {'N': datetime.datetime.now().strftime('%s')},
+            'status': {'S': status}
+        }
+        if last_processed_key is not None:
+            item['last_processed_key'] = {'S': last_processed_key}
+        if self.history_ttl_seconds is not None:
+            item[HISTORY_TTL_ATTRIBUTE_NAME] = {'N': str(int(time.time()) + self.history_ttl_seconds)}
+        return item
 
     """
-    get latest timestamp information from DynamoDB table
+    This method advances the latest pointer item of the job with a single conditional UpdateItem.
+    An IN_PROGRESS bookmark is never allowed to move behind the COMPLETE one, nor a COMPLETE bookmark
+    behind itself when only_forward (concurrent writers), a ConditionalCheckFailedException is raised instead.
+    With clear_in_progress, a COMPLETE bookmark written without a commit (e.g. by ShardedLoader) also drops the
+    IN_PROGRESS one, which a later commit would otherwise promote over it.
     """
 
-    def get_latest_timestamp_from_db(self, status="COMPLETE"):
-        dynamodb_boto3_client = boto3.client("dynamodb")
-        result = dynamodb_boto3_client.query(
+    def update_latest_pointer(self, latest_timestamp, status="IN_PROGRESS", last_processed_key: str = None,
+                              only_forward: bool = False, clear_in_progress: bool = False):
+        dynamodb_boto3_client = self.dynamodb_client
+        dynamodb_boto3_client.update_item(**self.latest_pointer_update_kwargs(
+            latest_timestamp, status=status, last_processed_key=last_processed_key, only_forward=only_forward,
+            clear_in_progress=clear_in_progress))
+
+    def latest_pointer_update_kwargs(self, latest_timestamp, status="IN_PROGRESS", last_processed_key: str = None,
+                                     only_forward: bool = False, clear_in_progress: bool = False) -> dict:
+        attribute_prefix = "complete" if status == "COMPLETE" else "in_progress"
+        update_expression = "SET #timestamp = :timestamp, #data_load_timestamp = :data_load_timestamp"
+        expression_attribute_names = {
+            '#timestamp': f'{attribute_prefix}_timestamp',
+            '#key': f'{attribute_prefix}_key',
+            '#data_load_timestamp': 'data_load_timestamp',
+        }
+        expression_attribute_values = {
+            ':timestamp': {'N': latest_timestamp.strftime('%s')},
+            ':data_load_timestamp': {'N': datetime.datetime.now().strftime('%s')},
+        }
+        removed_attributes = []
+        if last_processed_key is not None:
+            update_expression += ", #key = :key"
+            expression_attribute_values[':key'] = {'S': last_processed_key}
+        else:
+            removed_attributes.append("#key")
+        if clear_in_progress and status == "COMPLETE":
+            removed_attributes += ["in_progress_timestamp", "in_progress_key"]
+        if removed_attributes:
+            update_expression += " REMOVE " + ", ".join(removed_attributes)
+
+        update_item_kwargs = dict(
             TableName=self.dynamo_db_table_for_bookmark_storage,
-            KeyConditionExpression="#job_name = :job_name",
+            Key=self.latest_pointer_key(),
+            UpdateExpression=update_expression,
+            ExpressionAttributeNames=expression_attribute_names,
+            ExpressionAttributeValues=expression_attribute_values,
+        )
+        if status != "COMPLETE":
+            update_item_kwargs["ConditionExpression"] = \
+                "attribute_not_exists(complete_timestamp) OR complete_timestamp <= :timestamp"
+        elif only_forward and last_processed_key is not None:
+            update_item_kwargs["ConditionExpression"] = \
+                "attribute_not_exists(#timestamp) OR #timestamp < :timestamp OR " \
+                "(#timestamp = :timestamp AND (attribute_not_exists(#key) OR #key <= :key))"
+        elif only_forward:
+            update_item_kwargs["ConditionExpression"] = "attribute_not_exists(#timestamp) OR #timestamp <= :timestamp"
+        return update_item_kwargs
+
+    def latest_pointer_key(self) -> dict:
+        return {
+            'job_name': {'S': self.job_name},
+            'bookmark_timestamp': {'N': str(LATEST_POINTER_BOOKMARK_TIMESTAMP)},
+        }
+
+    def bookmark_from_latest_pointer(self, item: dict, status="COMPLETE") -> dict:
+        attribute_prefix = "complete" if status == "COMPLETE" else "in_progress"
+        return {
+            "bookmark_timestamp": int(item.get(f'{attribute_prefix}_timestamp', {}).get('N', 0)),
+            "last_processed_key": item.get(f'{attribute_prefix}_key', {}).get('S'),
+        }
+
+    """
+    get latest bookmark information (timestamp and, in key ordered mode, last processed key) from DynamoDB table
+    """
+
+    @timed("bookmark_read")
+    def get_latest_bookmark_from_db(self, status="COMPLETE") -> dict:
+        dynamodb_boto3_client = self.dynamodb_client
+
+        if self.bookmark_layout == "latest_pointer":
+            item = dynamodb_boto3_client.get_item(
+                TableName=self.dynamo_db_table_for_bookmark_storage,
+                Key=self.latest_pointer_key(),
+                ConsistentRead=True,
+            ).get('Item', {})
+            return self.bookmark_from_latest_pointer(item, status=status)
+
+        # DynamoDB applies Limit before FilterExpression, so keep reading pages
+        # (newest first) until an item with the requested status shows up
+        query_kwargs = self.latest_bookmark_query_kwargs(status=status)
+        while True:
+            result = dynamodb_boto3_client.query(**query_kwargs)
+            if len(result['Items']) >= 1:
+                return self.bookmark_from_history_item(result['Items'][0])
+            if 'LastEvaluatedKey' not in result:
+                return {"bookmark_timestamp": 0, "last_processed_key": None}
+            query_kwargs['ExclusiveStartKey'] = result['LastEvaluatedKey']
+
+    def latest_bookmark_query_kwargs(self, status="COMPLETE") -> dict:
+        return dict(
+            TableName=self.dynamo_db_table_for_bookmark_storage,
+            KeyConditionExpression="#job_name = :job_name AND #bookmark_timestamp >= :zero",
             FilterExpression='#status = :status',
             ExpressionAttributeNames={
                 '#job_name': 'job_name',
+                '#bookmark_timestamp': 'bookmark_timestamp',
                 '#status': 'status'
             },
             ExpressionAttributeValues={
                 ':job_name': {
                     'S': self.job_name
                 },
+                ':zero': {
+                    'N': '0'
+                },
                 ':status': {
                     'S': status
                 }
             },
             ScanIndexForward=False,
-            Limit=1,
+            Limit=10,
         )
 
-        if len(result['Items']) < 1:
-            return 0
-        else:
-            return int(result['Items'][0]['bookmark_timestamp']['N'])
+    def bookmark_from_history_item(self, item: dict) -> dict:
+        return {
+            "bookmark_timestamp": int(item['bookmark_timestamp']['N']),
+            "last_processed_key": item.get('last_processed_key', {}).get('S'),
+        }
+
+    """
+    get latest timestamp information from DynamoDB table
+    """
+
+    def get_latest_timestamp_from_db(self, status="COMPLETE"):
+        return self.get_latest_bookmark_from_db(status=status)["bookmark_timestamp"]
+
+    """
+    Sort the files in the order they should be processed and bookmarked: by key in key ordered mode,
+    by last modified timestamp otherwise.
+    """
+
+    def sort_files_for_processing(self, files) -> list:
+        if self.key_ordered:
+            return sorted(files, key=lambda file: file.key)
+        return sorted(files, key=lambda file: file.last_modified)
+
+    """
+    Check whether there is new data to load: reads the COMPLETE bookmark and lists the files added after it,
+    newest first. Only the AWS SDK is needed, runs which find nothing new can exit before pandas is ever imported.
+    """
+
+    def check_for_new_data(self) -> list:
+        existing_bookmark = self.get_latest_bookmark_from_db(status="COMPLETE")
+        _, files_to_process = self.get_latest_files_from_s3_using_bookmark(
+            existing_bookmark["bookmark_timestamp"], existing_bookmark["last_processed_key"])
+        return files_to_process
 
     """
     This method reads the data from S3
     """
 
-    def load_data_from_s3(self) -> pd.DataFrame:
-        global df
-        existing_timestamp = self.get_latest_timestamp_from_db(status="COMPLETE")
+    @timed("load_data_from_s3", flush=True)
+    def load_data_from_s3(self) -> "pd.DataFrame":
+        existing_bookmark = self.get_latest_bookmark_from_db(status="COMPLETE")
+        existing_timestamp = existing_bookmark["bookmark_timestamp"]
         print("--------------->>>>>>>")
         print(f"existing timestamp {existing_timestamp}")
         print("--------------->>>>>>>")
 
-        latest_timestamp, files_to_process = self.get_latest_files_from_s3_using_bookmark(existing_timestamp)
+        latest_timestamp, files_to_process = self.get_latest_files_from_s3_using_bookmark(
+            existing_timestamp, existing_bookmark["last_processed_key"])
         if not files_to_process:
             print("there are no files to process")
-            return pd.DataFrame()
+            return self.concat_loaded_data([])
         else:
-            dataframes_to_union = []
-
-            for file in files_to_process:
-                filename = f"s3://{self.s3_bucket_name}/{file.key}"
-                print(f"loading the filename: {filename}")
-
-                if self.format_of_the_data == 'parquet':
-                    df = wr.s3.read_parquet(filename)
-                elif self.format_of_the_data == 'csv':
-                    df = wr.s3.read_csv(filename, encoding='ISO-8859-1')
-                elif self.format_of_the_data == 'json':
-                    df = wr.s3.read_json(filename)
-                dataframes_to_union.append(df)
-
-            final_dataframe_with_latest_data = pd.concat(dataframes_to_union, axis=0, ignore_index=True)
-            self.register_bookmark(latest_timestamp, status="IN_PROGRESS")
+            start_time = time.time()
+            if self.format_of_the_data == 'parquet' and self.parquet_dataset_mode and self.output_format == "pandas":
+                final_dataframe_with_latest_data = self.read_parquet_dataset_from_s3(files_to_process)
+                if self.optimize_dtypes:
+                    final_dataframe_with_latest_data = self.optimize_dataframe_dtypes(final_dataframe_with_latest_data)
+            else:
+                dataframes_to_union = self.read_files_from_s3(files_to_process)
+                final_dataframe_with_latest_data = self.concat_loaded_data(dataframes_to_union)
+            self.metrics.increment("rows", final_dataframe_with_latest_data.shape[0])
+            self.__last_load_stats = self.compute_load_stats(files_to_process,
+                                                             final_dataframe_with_latest_data.shape[0],
+                                                             time.time() - start_time)
+            self.print_load_stats()
+            self.register_loaded_files(existing_timestamp, latest_timestamp, files_to_process)
             print("Data Load completed successfully")
             return final_dataframe_with_latest_data
 
+    """
+    This method registers the IN_PROGRESS bookmark of files returned by get_latest_files_from_s3_using_bookmark
+    once they have all been loaded
+    """
+
+    def register_loaded_files(self, existing_timestamp: int, latest_timestamp, files_to_process):
+        self.register_bookmark(**self.loaded_files_bookmark_kwargs(existing_timestamp, latest_timestamp,
+                                                                   files_to_process))
+
+    def loaded_files_bookmark_kwargs(self, existing_timestamp: int, latest_timestamp, files_to_process) -> dict:
+        if self.key_ordered:
+            return dict(latest_timestamp=self.key_ordered_bookmark_timestamp(existing_timestamp, latest_timestamp),
+                        status="IN_PROGRESS",
+                        last_processed_key=files_to_process[0].key)
+        return dict(latest_timestamp=latest_timestamp, status="IN_PROGRESS")
+
+    """
+    In key ordered mode the listing resumes after the last processed key, the bookmark timestamp only orders the
+    history items. The IN_PROGRESS one is kept after the COMPLETE one, a new key may well be older or from the same
+    second, and taking the sort key of the COMPLETE item would replace the bookmark.
+    """
+
+    def key_ordered_bookmark_timestamp(self, existing_timestamp: int, latest_timestamp):
+        return max(latest_timestamp, datetime.datetime.fromtimestamp(existing_timestamp + 1))
+
+    def is_large_object(self, file) -> bool:
+        return self.large_object_threshold_bytes is not None and file.size >= self.large_object_threshold_bytes
+
+    """
+    Download the local copy a file is read from within the block. With the object cache, the cached copy is
+    pinned until the block ends, so no concurrent eviction removes it before it is read (large objects are
+    cached with concurrent byte-range GETs). Otherwise a large object is downloaded to a temporary file with
+    concurrent byte-range GETs, removed afterwards. Nothing to do for small objects read from S3.
+    """
+
+    @contextlib.contextmanager
+    def local_copy_downloaded(self, file):
+        if self.object_cache is not None:
+            with self.object_cache.pinned(self.s3_bucket_name, file.key, file.e_tag):
+                self.__local_copy_paths[file.key] = self.fetch_from_object_cache(file)
+                try:
+                    yield
+                finally:
+                    self.__local_copy_paths.pop(file.key, None)
+            return
+        if not self.is_large_object(file):
+            yield
+            return
+
+        # keep the file name, readers may rely on the extension (e.g. compression)
+        fd, path = tempfile.mkstemp(suffix=f"-{os.path.basename(file.key)}")
+        os.close(fd)
+        try:
+            start_time = time.time()
+            with self.metrics.timer("download"):
+                self.s3_client.download_file(Bucket=self.s3_bucket_name, Key=file.key, Filename=path,
+                                             Config=self.transfer_config)
+            seconds = max(time.time() - start_time, 1e-9)
+            print(f"downloaded s3://{self.s3_bucket_name}/{file.key} with {self.range_concurrency} "
+                  f"concurrent ranges at {file.size / 1024 / 1024 / seconds:.2f} MB/s")
+            self.__local_copy_paths[file.key] = path
+            yield
+        finally:
+            self.__local_copy_paths.pop(file.key, None)
+            os.remove(path)
+
+    """
+    Where a file is read from: its local copy when the object cache is enabled or when it's a large object
+    being read, its S3 url otherwise
+    """
+
+    def get_file_path(self, file) -> str:
+        if file.key in self.__local_copy_paths:
+            return self.__local_copy_paths[file.key]
+        if self.object_cache is None:
+            return f"s3://{self.s3_bucket_name}/{file.key}"
+        return self.fetch_from_object_cache(file)
+
+    def fetch_from_object_cache(self, file) -> str:
+        transfer_config = self.transfer_config if self.is_large_object(file) else None
+        with self.metrics.timer("download"):
+            return self.object_cache.fetch(self.s3_client, self.s3_bucket_name, file.key, file.e_tag, size=file.size,
+                                           transfer_config=transfer_config)
+
+    def open_file(self, file):
+        path = self.get_file_path(file)
+        if path.startswith("s3://"):
+            return S3SeekableFile(self.s3_client, self.s3_bucket_name, file.key, size=file.size)
+        return open(path, "rb")
+
+    def read_file_bytes(self, file) -> bytes:
+        path = self.get_file_path(file)
+        if path.startswith("s3://"):
+            with self.metrics.timer("download"):
+                return self.s3_client.get_object(Bucket=self.s3_bucket_name, Key=file.key)['Body'].read()
+        with open(path, "rb") as f:
+            return f.read()
+
+    """
+    What the csv and json parsers read a file from: its path for plain files, a stream decompressing the
+    data as it is parsed for compressed files. With metrics, plain S3 objects are streamed from the object body
+    too, so the time spent downloading them is measured apart from the parse time.
+    """
+
+    @contextlib.contextmanager
+    def opened_for_parsing(self, file, always_stream: bool = False):
+        compression = get_compression(file.key)
+        path = self.get_file_path(file)
+        is_local = not path.startswith("s3://")
+        if compression is None and not always_stream and (is_local or not self.metrics.enabled):
+            yield path
+            return
+
+        if not is_local:
+            raw_stream = self.s3_client.get_object(Bucket=self.s3_bucket_name, Key=file.key)['Body']
+            if self.metrics.enabled:
+                raw_stream = MeteredStream(raw_stream, self.metrics)
+        else:
+            raw_stream = open(path, "rb")
+        try:
+            if compression is None:
+                yield raw_stream
+            else:
+                with open_decompressed_stream(raw_stream, compression) as stream:
+                    yield stream
+        finally:
+            raw_stream.close()
+
+    def read_csv(self, source, **read_csv_kwargs):
+        if isinstance(source, str) and source.startswith("s3://"):
+            import awswrangler as wr
+
+            return wr.s3.read_csv(source, boto3_session=self.boto3_session, **read_csv_kwargs)
+
+        import pandas as pd
+
+        return pd.read_csv(source, **read_csv_kwargs)
+
+    def read_json(self, source, **read_json_kwargs) -> "pd.DataFrame":
+        if isinstance(source, str) and source.startswith("s3://"):
+            import awswrangler as wr
+
+            return wr.s3.read_json(source, boto3_session=self.boto3_session, **read_json_kwargs)
+
+        import pandas as pd
+
+        return pd.read_json(source, **read_json_kwargs)
+
+    def read_parquet(self, path: str, columns: List[str] = None) -> "pd.DataFrame":
+        if path.startswith("s3://"):
+            import awswrangler as wr
+
+            return wr.s3.read_parquet(path, columns=columns, boto3_session=self.boto3_session)
+
+        import pandas as pd
+
+        return pd.read_parquet(path, columns=columns)
+
+    """
+    This method reads a single S3 file into a pandas dataframe
+    """
+
+    def read_file_from_s3(self, file) -> "pd.DataFrame":
+        print(f"loading the filename: s3://{self.s3_bucket_name}/{file.key}")
+        start_time = time.perf_counter()
+        download_seconds = self.metrics.thread_seconds("download")
+
+        with self.local_copy_downloaded(file):
+            if self.output_format == "arrow":
+                df = self.read_table_from_s3(file)
+            elif self.format_of_the_data == 'parquet':
+                df = self.read_parquet_file_from_s3(file)
+            elif self.format_of_the_data == 'csv':
+                df = self.read_csv_file_from_s3(file)
+            elif self.format_of_the_data == 'json' and self.parse_processes is not None:
+                df = self.parse_file_in_process_pool(file)
+            elif self.format_of_the_data == 'json':
+                with self.opened_for_parsing(file) as source:
+                    df = apply_row_filters(self.read_json(source), self.filters)
+                if self.columns is not None:
+                    df = df[self.columns]
+            elif self.format_of_the_data == 'xml':
+                df = self.read_xml_file_from_s3(file)
+
+        if self.optimize_dtypes and self.output_format == "pandas":
+            df = self.optimize_dataframe_dtypes(df)
+        if self.metrics.enabled:
+            self.record_file_metrics(file, time.perf_counter() - start_time,
+                                     self.metrics.thread_seconds("download") - download_seconds)
+        return df
+
+    """
+    Record the read of a file: its read time is split into the time spent downloading it and the rest, counted
+    as parse time. Parquet files read by awswrangler without filters are downloaded and parsed in one call,
+    that call is counted as parse time.
+    """
+
+    def record_file_metrics(self, file, seconds: float, download_seconds: float):
+        self.metrics.add_time("read_file", seconds)
+        self.metrics.add_time("parse", max(seconds - download_seconds, 0.0))
+        self.metrics.increment("files")
+        self.metrics.increment("bytes_read", file.size)
+
+    def optimize_dataframe_dtypes(self, df: "pd.DataFrame") -> "pd.DataFrame":
+        return optimize_dataframe_dtypes(df,
+                                         category_max_ratio=self.category_max_ratio,
+                                         use_arrow_strings=self.use_arrow_strings)
+
+    """
+    Read a parquet file, with column projection and, when filters are given, row group pruning
+    """
+
+    def read_parquet_file_from_s3(self, file) -> "pd.DataFrame":
+        if not self.filters:
+            return self.read_parquet(self.get_file_path(file), columns=self.columns)
+
+        return self.read_parquet_table_from_s3(file).to_pandas()
+
+    def read_parquet_table_from_s3(self, file):
+        import pyarrow.parquet
+
+        # ranged reads of the footer, then of the column chunks of the row groups which may match
+        with self.open_file(file) as f:
+            return pyarrow.parquet.read_table(f, columns=self.columns, filters=self.filters)
+
+    """
+    Read many parquet files as one dataset: the files are read concurrently as arrow tables, their schemas
+    are unified (e.g. a column added over time is null in the older files) and the tables are concatenated
+    without copy before a single conversion to pandas.
+    """
+
+    @timed("read_dataset")
+    def read_parquet_dataset_from_s3(self, files) -> "pd.DataFrame":
+        self.metrics.increment("files", len(files))
+        self.metrics.increment("bytes_read", sum(file.size for file in files))
+        if not self.filters and self.object_cache is None and not any(self.is_large_object(file) for file in files):
+            import awswrangler as wr
+
+            return wr.s3.read_parquet([f"s3://{self.s3_bucket_name}/{file.key}" for file in files],
+                                      columns=self.columns,
+                                      use_threads=self.max_workers if self.max_workers > 1 else True,
+                                      boto3_session=self.boto3_session)
+
+        import pyarrow
+
+        def read_table(file):
+            with self.local_copy_downloaded(file):
+                return self.read_parquet_table_from_s3(file)
+
+        tables = self.map_files(read_table, files)
+        return pyarrow.concat_tables(tables, promote_options="default").to_pandas()
+
+    """
+    Read an xml file record by record while it is downloaded. Records are flattened into columns and turned
+    into dataframes by batches of XML_RECORD_BATCH_SIZE, on which the filters and the column selection are applied.
+    """
+
+    def read_xml_file_from_s3(self, file) -> "pd.DataFrame":
+        if self.parse_processes is not None:
+            return self.parse_file_in_process_pool(file)
+
+        with self.opened_for_parsing(file, always_stream=True) as stream:
+            return parse_xml(stream, self.xml_record_path, columns=self.columns, filters=self.filters,
+                             batch_size=XML_RECORD_BATCH_SIZE)
+
+    """
+    Read a csv file, parsing only the selected columns and filtering rows chunk by chunk
+    """
+
+    def read_csv_file_from_s3(self, file) -> "pd.DataFrame":
+        if not self.use_schema_registry:
+            return self.parse_csv_file_from_s3(file)
+
+        registered_dtypes = self.get_registered_csv_dtypes()
+        if not registered_dtypes:
+            df = self.parse_csv_file_from_s3(file)
+            self.register_csv_dtypes(df)
+            return df
+
+        error = None
+        try:
+            df = self.parse_csv_file_from_s3(file, dtypes=registered_dtypes)
+        except (ValueError, TypeError) as e:
+            # values which don't fit the registered dtypes, fall back to type inference
+            error = str(e)
+            df = self.parse_csv_file_from_s3(file)
+        self.check_schema_drift(file, df, registered_dtypes, error=error)
+        return df
+
+    def parse_csv_file_from_s3(self, file, dtypes: dict = None) -> "pd.DataFrame":
+        if self.parse_processes is not None:
+            return self.parse_file_in_process_pool(file, dtypes=dtypes)
+
+        read_csv_kwargs = dict(encoding='ISO-8859-1')
+        if dtypes:
+            read_csv_kwargs["dtype"] = dtypes
+        with self.opened_for_parsing(file) as source:
+            return parse_csv(self.read_csv, source, columns=self.columns, filters=self.filters,
+                             chunk_size=CSV_FILTER_CHUNK_SIZE, **read_csv_kwargs)
+
+    """
+    Parse a csv, json or xml file in the process pool: the raw bytes are downloaded here and handed to a parsing
+    process, which sends the parsed columns back as an Arrow IPC stream (or the pickled dataframe when arrow
+    can't convert it, e.g. mixed type columns)
+    """
+
+    def parse_file_in_process_pool(self, file, dtypes: dict = None, body: bytes = None) -> "pd.DataFrame":
+        if body is None:
+            body = self.read_file_bytes(file)
+        parsed = self.parse_process_pool.submit(
+            parse_file_bytes,
+            body,
+            self.format_of_the_data,
+            compression=get_compression(file.key),
+            columns=self.columns,
+            filters=self.filters,
+            dtypes=dtypes,
+            xml_record_path=self.xml_record_path,
+            csv_chunk_size=CSV_FILTER_CHUNK_SIZE,
+            xml_batch_size=XML_RECORD_BATCH_SIZE,
+        ).result()
+        if isinstance(parsed, bytes):
+            return arrow_ipc_to_table(parsed).to_pandas()
+        return parsed
+
+    """
+    Parse a file whose content was already downloaded (e.g. by AsyncDataLoader) with the columns, filters, output
+    format and dtype options of this DataLoader. csv, json and xml files are parsed by the process pool when
+    parse_processes is set.
+    """
+
+    def read_file_from_bytes(self, file, body: bytes):
+        if self.format_of_the_data == 'parquet':
+            import pyarrow
+            import pyarrow.parquet
+
+            table = pyarrow.parquet.read_table(pyarrow.BufferReader(body), columns=self.columns, filters=self.filters)
+            df = table if self.output_format == "arrow" else table.to_pandas()
+        else:
+            if self.parse_processes is not None:
+                df = self.parse_file_in_process_pool(file, body=body)
+            else:
+                df = parse_file_body(
+                    body,
+                    self.format_of_the_data,
+                    compression=get_compression(file.key),
+                    columns=self.columns,
+                    filters=self.filters,
+                    xml_record_path=self.xml_record_path,
+                    csv_chunk_size=CSV_FILTER_CHUNK_SIZE,
+                    xml_batch_size=XML_RECORD_BATCH_SIZE,
+                )
+            if self.output_format == "arrow":
+                df = self.dataframe_to_table(file, df)
+
+        if self.optimize_dtypes and self.output_format == "pandas":
+            df = self.optimize_dataframe_dtypes(df)
+        return df
+
+    """
+    get the csv dtypes registered for the job, an empty dict if there are none yet.
+    They are fetched once per DataLoader.
+    """
+
+    def get_registered_csv_dtypes(self) -> dict:
+        with self.__schema_registry_lock:
+            if self.__registered_csv_dtypes is None:
+                item = self.dynamodb_client.get_item(
+                    TableName=self.dynamo_db_table_for_bookmark_storage,
+                    Key=self.schema_registry_key(),
+                    ConsistentRead=True,
+                ).get('Item')
+                self.__registered_csv_dtypes = {
+                    column: item['csv_dtypes']['M'][column]['S'] for column in
+                    [value['S'] for value in item['csv_columns']['L']]
+                } if item else {}
+            return self.__registered_csv_dtypes
+
+    """
+    register the dtypes of a parsed csv file for the job, unless some are already registered
+    """
+
+    def register_csv_dtypes(self, df: "pd.DataFrame"):
+        dtypes = {str(column): str(dtype) for column, dtype in df.dtypes.items()}
+        with self.__schema_registry_lock:
+            if self.__registered_csv_dtypes:
+                return
+            try:
+                self.dynamodb_client.put_item(
+                    TableName=self.dynamo_db_table_for_bookmark_storage,
+                    Item={
+                        **self.schema_registry_key(),
+                        'csv_columns': {'L': [{'S': column} for column in dtypes]},
+                        'csv_dtypes': {'M': {column: {'S': dtype} for column, dtype in dtypes.items()}},
+                        'data_load_timestamp': {'N': datetime.datetime.now().strftime('%s')},
+                    },
+                    ConditionExpression="attribute_not_exists(job_name)",
+                )
+                self.__registered_csv_dtypes = dtypes
+                print(f"registered the csv dtypes of {self.job_name}: {dtypes}")
+            except self.dynamodb_client.exceptions.ConditionalCheckFailedException:
+                self.__registered_csv_dtypes = None  # registered by someone else meanwhile, fetch it next time
+
+    def schema_registry_key(self) -> dict:
+        return {
+            'job_name': {'S': self.job_name},
+            'bookmark_timestamp': {'N': str(SCHEMA_REGISTRY_BOOKMARK_TIMESTAMP)},
+        }
+
+    """
+    compare the columns and dtypes of a parsed csv file with the registered ones and report the differences
+    """
+
+    def check_schema_drift(self, file, df: "pd.DataFrame", registered_dtypes: dict, error: str = None):
+        expected_columns = [column for column in registered_dtypes
+                            if self.columns is None or column in self.columns]
+        new_columns = [str(column) for column in df.columns if str(column) not in registered_dtypes]
+        missing_columns = [column for column in expected_columns if column not in df.columns]
+        changed_dtypes = {
+            str(column): str(dtype) for column, dtype in df.dtypes.items()
+            if str(column) in registered_dtypes and str(dtype) != registered_dtypes[str(column)]
+        }
+        if new_columns or missing_columns or changed_dtypes or error:
+            drift = {
+                "key": file.key,
+                "new_columns": new_columns,
+                "missing_columns": missing_columns,
+                "changed_dtypes": changed_dtypes,
+                "error": error,
+            }
+            self.report_schema_drift(drift)
+
+    def report_schema_drift(self, drift: dict):
+        logger.warning(f"schema drift of {self.job_name}: {drift}")
+        print(f"schema drift detected: {drift}")
+        with self.__schema_registry_lock:
+            self.__schema_drifts.append(drift)
+
+    """
+    This method reads a single S3 file into a pyarrow table, without going through pandas
+    (except for json files, pyarrow only reads newline delimited json, and xml files)
+    """
+
+    def read_table_from_s3(self, file):
+        import pyarrow
+        import pyarrow.csv
+        import pyarrow.parquet
+
+        if self.format_of_the_data == 'parquet':
+            if self.columns is not None or self.filters:
+                return self.read_parquet_table_from_s3(file)
+            return pyarrow.parquet.read_table(pyarrow.BufferReader(self.read_file_bytes(file)))
+        elif self.format_of_the_data == 'csv':
+            include_columns = []
+            if self.columns is not None:
+                include_columns = self.columns + [
+                    column for column, _, _ in self.filters or [] if column not in self.columns]
+            with self.opened_for_parsing(file) as source:
+                if isinstance(source, str) and source.startswith("s3://"):
+                    source = pyarrow.BufferReader(self.read_file_bytes(file))
+                table = pyarrow.csv.read_csv(
+                    source,
+                    read_options=pyarrow.csv.ReadOptions(encoding='ISO-8859-1'),
+                    convert_options=pyarrow.csv.ConvertOptions(include_columns=include_columns),
+                )
+        elif self.format_of_the_data == 'xml':
+            return self.dataframe_to_table(file, self.read_xml_file_from_s3(file))
+        elif self.parse_processes is not None:
+            # filtered and projected by the parsing process
+            return self.dataframe_to_table(file, self.parse_file_in_process_pool(file))
+        else:
+            with self.opened_for_parsing(file) as source:
+                table = self.dataframe_to_table(file, self.read_json(source))
+
+        if self.filters:
+            table = table.filter(pyarrow.parquet.filters_to_expression(self.filters))
+        if self.columns is not None:
+            table = table.select(self.columns)
+        return table
+
+    def dataframe_to_table(self, file, df: "pd.DataFrame"):
+        import pyarrow
+
+        try:
+            return pyarrow.Table.from_pandas(df, preserve_index=False)
+        except pyarrow.ArrowInvalid as e:
+            raise Exception(f"s3://{self.s3_bucket_name}/{file.key} can't be loaded as an arrow table, "
+                            f"every column should hold values of a single type: {e}")
+
+    """
+    This method concatenates the per file data: pandas concat, or zero copy concatenation of arrow tables
+    with unified schemas
+    """
+
+    @timed("concat")
+    def concat_loaded_data(self, dataframes: list):
+        if self.output_format == "arrow":
+            import pyarrow
+
+            if not dataframes:
+                return pyarrow.table({})
+            return pyarrow.concat_tables(dataframes, promote_options="default")
+
+        import pandas as pd
+
+        if not dataframes:
+            return pd.DataFrame()
+        if self.optimize_dtypes:
+            dataframes = unify_categorical_columns(dataframes)
+        return pd.concat(dataframes, axis=0, ignore_index=True)
+
+    """
+    This method reads the given S3 files, concurrently when max_workers is greater than one.
+    The returned dataframes are always in the same order as the given files.
+    """
+
+    def read_files_from_s3(self, files) -> "List[pd.DataFrame]":
+        return self.map_files(self.read_file_from_s3, files)
+
+    def map_files(self, func, files) -> list:
+        max_workers = max(self.max_workers, self.parse_processes or 1)
+        if max_workers == 1 or len(files) < 2:
+            return [func(file) for file in files]
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(files))) as executor:
+            return list(executor.map(func, files))
+
+    """
+    This method computes the throughput figures of a load
+    """
+
+    def compute_load_stats(self, files, rows: int, seconds: float) -> dict:
+        total_bytes = sum(file.size for file in files)
+        seconds = max(seconds, 1e-9)
+        return {
+            "files": len(files),
+            "rows": rows,
+            "bytes": total_bytes,
+            "seconds": seconds,
+            "max_workers": self.max_workers,
+            "files_per_second": len(files) / seconds,
+            "rows_per_second": rows / seconds,
+            "megabytes_per_second": total_bytes / 1024 / 1024 / seconds,
+        }
+
+    def print_load_stats(self):
+        print(f"loaded {self.__last_load_stats['files']} files, "
+              f"{self.__last_load_stats['rows']} rows in {self.__last_load_stats['seconds']:.2f} seconds "
+              f"({self.__last_load_stats['megabytes_per_second']:.2f} MB/s, "
+              f"max_workers={self.max_workers})")
+
+    """
+    This method reads the data from S3 as a stream of bounded-size dataframes, oldest files first.
+    A batch is closed once it holds at least rows_per_batch rows or files_per_batch files, and
+    never between two files sharing the same last modified timestamp, so the bookmark can't skip data.
+    The IN_PROGRESS bookmark is registered for a batch only when the consumer asks for the next one
+    (or exhausts the iterator), i.e. once the yielded batch has actually been handled.
+    In key ordered mode files are processed in key order and the last key of each batch is bookmarked.
+    When checkpointed, a checkpoint (last modified timestamp and keys processed at that timestamp) is written
+    along with every IN_PROGRESS bookmark, and a run restarted before commit() resumes after the checkpoint
+    instead of going back to the COMPLETE bookmark.
+    """
+
+    def iter_batches(self, rows_per_batch: int = None, files_per_batch: int = None,
+                     checkpointed: bool = False) -> "Iterator[pd.DataFrame]":
+        if rows_per_batch is None and files_per_batch is None:
+            raise Exception("At least one of rows_per_batch and files_per_batch should be given")
+
+        existing_bookmark = self.get_latest_bookmark_from_db(status="COMPLETE")
+        existing_timestamp = existing_bookmark["bookmark_timestamp"]
+        print(f"existing timestamp {existing_timestamp}")
+
+        checkpoint = self.get_checkpoint_from_db(existing_bookmark) if checkpointed else None
+        if checkpoint is None:
+            _, files_to_process = self.get_latest_files_from_s3_using_bookmark(
+                existing_timestamp, existing_bookmark["last_processed_key"])
+            checkpoint = {"checkpoint_timestamp": existing_timestamp, "checkpoint_keys": set()}
+        else:
+            print(f"resuming from checkpoint {checkpoint['checkpoint_timestamp']} "
+                  f"({len(checkpoint['checkpoint_keys'])} files processed at that timestamp)")
+            files_to_process = self.get_files_after_checkpoint(existing_bookmark, checkpoint)
+        if not files_to_process:
+            print("there are no files to process")
+            self.metrics.flush(operation="iter_batches")
+            return
+
+        start_time = time.time()
+        total_rows = 0
+        bookmark_timestamp = datetime.datetime.fromtimestamp(
+            max(existing_timestamp, checkpoint["checkpoint_timestamp"]))
+        checkpoint_time = datetime.datetime.fromtimestamp(checkpoint["checkpoint_timestamp"])
+        checkpoint_keys = set(checkpoint["checkpoint_keys"])
+        files_to_process = self.sort_files_for_processing(files_to_process)
+        files_per_read = files_per_batch or self.max_workers
+        pending_dataframes = []
+        pending_rows = 0
+        for window_start in range(0, len(files_to_process), files_per_read):
+            window = files_to_process[window_start:window_start + files_per_read]
+            for index, df in enumerate(self.read_files_from_s3(window), start=window_start):
+                pending_dataframes.append(df)
+                pending_rows += df.shape[0]
+
+                file = files_to_process[index]
+                bookmark_timestamp = max(bookmark_timestamp, file.last_modified.replace(tzinfo=None))
+                if checkpointed:
+                    # bookmarks have a one second resolution
+                    file_time = file.last_modified.replace(tzinfo=None, microsecond=0)
+                    if self.key_ordered:
+                        checkpoint_time, checkpoint_keys = max(checkpoint_time, file_time), {file.key}
+                    elif file_time > checkpoint_time:
+                        checkpoint_time, checkpoint_keys = file_time, {file.key}
+                    else:
+                        checkpoint_keys.add(file.key)
+                is_last_file = index == len(files_to_process) - 1
+                if not is_last_file:
+                    if not self.key_ordered and files_to_process[index + 1].last_modified == file.last_modified:
+                        continue
+                    batch_is_full = (
+                        (rows_per_batch is not None and pending_rows >= rows_per_batch)
+                        or (files_per_batch is not None and len(pending_dataframes) >= files_per_batch)
+                    )
+                    if not batch_is_full:
+                        continue
+
+                batch = self.concat_loaded_data(pending_dataframes)
+                pending_dataframes = []
+                pending_rows = 0
+                total_rows += batch.shape[0]
+                self.metrics.increment("rows", batch.shape[0])
+                yield batch
+                if self.key_ordered:
+                    self.register_bookmark(self.key_ordered_bookmark_timestamp(existing_timestamp, bookmark_timestamp),
+                                           status="IN_PROGRESS", last_processed_key=file.key)
+                else:
+                    self.register_bookmark(bookmark_timestamp, status="IN_PROGRESS")
+                if checkpointed:
+                    self.put_checkpoint(existing_bookmark, checkpoint_time, checkpoint_keys)
+                self.metrics.flush(operation="iter_batches")
+
+        self.__last_load_stats = self.compute_load_stats(files_to_process, total_rows, time.time() - start_time)
+        self.print_load_stats()
+
+    """
+    get the checkpoint of the unfinished run started from the given COMPLETE bookmark, None if there isn't any
+    """
+
+    @timed("bookmark_read")
+    def get_checkpoint_from_db(self, existing_bookmark: dict) -> dict:
+        item = self.dynamodb_client.get_item(
+            TableName=self.dynamo_db_table_for_bookmark_storage,
+            Key=self.checkpoint_key(),
+            ConsistentRead=True,
+        ).get('Item')
+        # a checkpoint left by a run started from an older bookmark is obsolete once a newer one is committed
+        if (item is None
+                or int(item['base_timestamp']['N']) != existing_bookmark["bookmark_timestamp"]
+                or item.get('base_key', {}).get('S') != existing_bookmark["last_processed_key"]):
+            return None
+        return {
+            "checkpoint_timestamp": int(item['checkpoint_timestamp']['N']),
+            "checkpoint_keys": set(item['checkpoint_keys']['SS']),
+        }
+
+    """
+    write the checkpoint of a run started from the given COMPLETE bookmark: the last modified timestamp of the
+    last processed file and the keys of the processed files with that timestamp (the last key in key ordered mode).
+    The keys are stored in a single item, hence they should fit in 400 KB.
+    """
+
+    @timed("bookmark_write")
+    def put_checkpoint(self, existing_bookmark: dict, checkpoint_time: datetime.datetime, checkpoint_keys: set):
+        item = dict(self.checkpoint_key())
+        item.update({
+            'base_timestamp': {'N': str(existing_bookmark["bookmark_timestamp"])},
+            'checkpoint_timestamp': {'N': checkpoint_time.strftime('%s')},
+            'checkpoint_keys': {'SS': sorted(checkpoint_keys)},
+            'data_load_timestamp': {'N': datetime.datetime.now().strftime('%s')},
+        })
+        if existing_bookmark["last_processed_key"] is not None:
+            item['base_key'] = {'S': existing_bookmark["last_processed_key"]}
+        self.dynamodb_client.put_item(
+            TableName=self.dynamo_db_table_for_bookmark_storage,
+            Item=item,
+        )
+
+    def checkpoint_key(self) -> dict:
+        return {
+            'job_name': {'S': self.job_name},
+            'bookmark_timestamp': {'N': str(CHECKPOINT_BOOKMARK_TIMESTAMP)},
+        }
+
+    """
+    list the files left to process after a checkpoint: the files modified after it and the files modified at the
+    checkpoint timestamp which weren't processed yet (e.g. written right after the interrupted run listed them)
+    """
+
+    def get_files_after_checkpoint(self, existing_bookmark: dict, checkpoint: dict) -> list:
+        if self.key_ordered:
+            _, files = self.get_latest_files_from_s3_using_bookmark(
+                existing_bookmark["bookmark_timestamp"], max(checkpoint["checkpoint_keys"]))
+            return files
+
+        checkpoint_time = datetime.datetime.fromtimestamp(checkpoint["checkpoint_timestamp"])
+        _, files = self.get_latest_files_from_s3_using_bookmark(checkpoint["checkpoint_timestamp"] - 1)
+        return [
+            file for file in files
+            if file.last_modified.replace(tzinfo=None, microsecond=0) > checkpoint_time
+            or (file.last_modified.replace(tzinfo=None, microsecond=0) == checkpoint_time
+                and file.key not in checkpoint["checkpoint_keys"])
+        ]
+
+    @timed("commit", flush=True)
     def commit(self):
-        latest_timestamp = datetime.datetime.fromtimestamp(self.get_latest_timestamp_from_db(status="IN_PROGRESS"))
-        self.register_bookmark(latest_timestamp, status="COMPLETE")
\ No newline at end of file
+        if self.bookmark_layout == "latest_pointer":
+            self.commit_latest_pointer()
+            return
+
+        in_progress_bookmark = self.get_latest_bookmark_from_db(status="IN_PROGRESS")
+        self.register_bookmark(**self.committed_bookmark_kwargs(in_progress_bookmark))
+
+    def committed_bookmark_kwargs(self, in_progress_bookmark: dict) -> dict:
+        return dict(latest_timestamp=self.bookmark_datetime(in_progress_bookmark["bookmark_timestamp"]),
+                    status="COMPLETE",
+                    last_processed_key=in_progress_bookmark["last_processed_key"])
+
+    """
+    Promote the IN_PROGRESS bookmark of the latest pointer item to COMPLETE in one conditional UpdateItem
+    """
+
+    def commit_latest_pointer(self):
+        dynamodb_boto3_client = self.dynamodb_client
+        try:
+            result = dynamodb_boto3_client.update_item(**self.commit_latest_pointer_kwargs())
+        except dynamodb_boto3_client.exceptions.ConditionalCheckFailedException:
+            print("there is no in progress bookmark to commit")
+            return
+
+        if self.write_history:
+            self.put_history_item(**self.committed_history_item_kwargs(result['Attributes']))
+
+    def committed_history_item_kwargs(self, latest_pointer: dict) -> dict:
+        return dict(latest_timestamp=self.bookmark_datetime(int(latest_pointer['complete_timestamp']['N'])),
+                    status="COMPLETE",
+                    last_processed_key=latest_pointer.get('complete_key', {}).get('S'))
+
+    def commit_latest_pointer_kwargs(self) -> dict:
+        update_expression = "SET complete_timestamp = in_progress_timestamp"
+        if self.key_ordered:
+            update_expression += ", complete_key = in_progress_key"
+
+        return dict(
+            TableName=self.dynamo_db_table_for_bookmark_storage,
+            Key=self.latest_pointer_key(),
+            UpdateExpression=update_expression,
+            ConditionExpression="attribute_exists(in_progress_timestamp)",
+            ReturnValues="ALL_NEW",
+        )
+
+    """
+    Turn on DynamoDB TTL on the bookmark table so expired history items get deleted for free
+    """
+
+    def enable_history_ttl(self):
+        if self.is_bookmark_table_validated(self.dynamo_db_table_for_bookmark_storage, "ttl"):
+            return
+
+        dynamodb_boto3_client = self.dynamodb_client
+        ttl_description = dynamodb_boto3_client.describe_time_to_live(
+            TableName=self.dynamo_db_table_for_bookmark_storage)['TimeToLiveDescription']
+        if ttl_description.get('TimeToLiveStatus') in ("ENABLED", "ENABLING"):
+            if ttl_description.get('AttributeName') != HISTORY_TTL_ATTRIBUTE_NAME:  # pragma: no cover
+                raise Exception(f"TTL is already enabled on attribute {ttl_description.get('AttributeName')}, "
+                                f"it should be {HISTORY_TTL_ATTRIBUTE_NAME}")
+            self.mark_bookmark_table_validated(self.dynamo_db_table_for_bookmark_storage, "ttl")
+            return
+
+        dynamodb_boto3_client.update_time_to_live(
+            TableName=self.dynamo_db_table_for_bookmark_storage,
+            TimeToLiveSpecification={
+                'Enabled': True,
+                'AttributeName': HISTORY_TTL_ATTRIBUTE_NAME,
+            }
+        )
+        self.mark_bookmark_table_validated(self.dynamo_db_table_for_bookmark_storage, "ttl")
+
+    """
+    Delete the history items of the job but the newest keep_last_items ones, with BatchWriteItem. A committed run
+    leaves one item (its COMPLETE item replaces its IN_PROGRESS one), a run which didn't commit leaves its
+    IN_PROGRESS items. In the history layout the newest COMPLETE item is always kept since it is the bookmark.
+    Returns the number of deleted items.
+    """
+
+    def compact_bookmark_history(self, keep_last_items: int = 10) -> int:
+        if not isinstance(keep_last_items, int) or keep_last_items < 1:
+            raise Exception("keep_last_items should be a positive integer")
+
+        dynamodb_boto3_client = self.dynamodb_client
+        paginator = dynamodb_boto3_client.get_paginator("query")
+        pages = paginator.paginate(
+            TableName=self.dynamo_db_table_for_bookmark_storage,
+            KeyConditionExpression="#job_name = :job_name AND #bookmark_timestamp >= :zero",
+            ProjectionExpression="#job_name, #bookmark_timestamp, #status",
+            ExpressionAttributeNames={
+                '#job_name': 'job_name',
+                '#bookmark_timestamp': 'bookmark_timestamp',
+                '#status': 'status'
+            },
+            ExpressionAttributeValues={
+                ':job_name': {'S': self.job_name},
+                ':zero': {'N': '0'}
+            },
+            ScanIndexForward=False,
+        )
+
+        keys_to_delete = []
+        kept_items = 0
+        complete_item_kept = self.bookmark_layout == "latest_pointer"
+        for page in pages:
+            for item in page['Items']:
+                is_complete = item.get('status', {}).get('S') == "COMPLETE"
+                if kept_items < keep_last_items or (is_complete and not complete_item_kept):
+                    kept_items += 1
+                    complete_item_kept = complete_item_kept or is_complete
+                    continue
+                keys_to_delete.append({
+                    'job_name': item['job_name'],
+                    'bookmark_timestamp': item['bookmark_timestamp'],
+                })
+
+        batch_delete_dynamodb_items(
+            dynamodb_client=dynamodb_boto3_client,
+            table_name=self.dynamo_db_table_for_bookmark_storage,
+            keys=keys_to_delete,
+        )
+        print(f"deleted {len(keys_to_delete)} bookmark history items of {self.job_name}")
+        return len(keys_to_delete)
@@ -1,7 +1,26 @@
 # -*- coding: utf-8 -*-
 
 
+import io
+import re
 import time
+import datetime
+import operator
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+from .metrics import NULL_METRICS
+
+# maximum number of requests of a single dynamodb BatchWriteItem call
+DYNAMODB_BATCH_WRITE_SIZE = 25
+# maximum number of keys of a single dynamodb BatchGetItem call
+DYNAMODB_BATCH_GET_SIZE = 100
+
+_boto3_lock = threading.Lock()
+_default_boto3_session = None
+_boto3_clients = dict()
 
 
 def create_dynamodb_table_if_not_exists(
@@ -50,3 +69,1081 @@ def create_dynamodb_table_if_not_exists(
         else:
             return
     raise TimeoutError(f"Creating Dynamodb Table timeout in {timeout} seconds") # pragma: no cover
+
+
+#: Lightweight view of an S3 object, attribute compatible with boto3's ``s3.ObjectSummary``.
+S3ObjectSummary = namedtuple("S3ObjectSummary", ["key", "last_modified", "size", "e_tag"])
+
+
+def list_s3_objects(
+    s3_client,
+    bucket: str,
+    prefix: str,
+    start_after: str = None,
+    metrics=NULL_METRICS,
+) -> Iterator[S3ObjectSummary]:
+    """
+    List the objects under a prefix with the ``list_objects_v2`` paginator.
+    When ``start_after`` is given, S3 only returns the keys which are
+    lexicographically greater than it, so the listing cost is proportional
+    to the new keys only.
+
+    :param s3_client: an boto3.session.Session.client("s3") object
+    :param bucket: s3 bucket name
+    :param prefix: s3 key prefix
+    :param start_after: only list the keys after this one
+    :param metrics: where the listed pages are counted
+
+    :return: iterator of :class:`S3ObjectSummary`
+    """
+    paginate_kwargs = dict(Bucket=bucket, Prefix=prefix)
+    if start_after:
+        paginate_kwargs["StartAfter"] = start_after
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(**paginate_kwargs):
+        metrics.increment("list_pages")
+        for content in page.get("Contents", []):
+            yield S3ObjectSummary(
+                key=content["Key"],
+                last_modified=content["LastModified"],
+                size=content["Size"],
+                e_tag=content["ETag"],
+            )
+
+
+def list_s3_prefix_level(
+    s3_client,
+    bucket: str,
+    prefix: str,
+    metrics=NULL_METRICS,
+) -> Tuple[List[S3ObjectSummary], List[str]]:
+    """
+    List one level of a prefix with ``Delimiter="/"``.
+
+    :param s3_client: an boto3.session.Session.client("s3") object
+    :param bucket: s3 bucket name
+    :param prefix: s3 key prefix
+    :param metrics: where the listed pages are counted
+
+    :return: the objects directly under the prefix and the child prefixes
+    """
+    objects, child_prefixes = list(), list()
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter="/"):
+        metrics.increment("list_pages")
+        for content in page.get("Contents", []):
+            objects.append(S3ObjectSummary(
+                key=content["Key"],
+                last_modified=content["LastModified"],
+                size=content["Size"],
+                e_tag=content["ETag"],
+            ))
+        for common_prefix in page.get("CommonPrefixes", []):
+            child_prefixes.append(common_prefix["Prefix"])
+    return objects, child_prefixes
+
+
+def parse_partition_time_range(
+    prefix: str,
+) -> Optional[Tuple[datetime.datetime, datetime.datetime]]:
+    """
+    Find the time range covered by a hive partitioned prefix such as
+    ``data/dt=2022-01-14/hour=05/`` or ``data/year=2022/month=01/``.
+    Recognized partition names are ``dt`` and ``date`` (``YYYY-MM-DD`` or
+    ``YYYYMMDD``), ``year``, ``month``, ``day`` and ``hour``.
+
+    :param prefix: s3 key prefix
+
+    :return: ``(start, end)`` naive UTC datetimes, end excluded, or None
+        if the prefix holds no recognized time partition
+    """
+    values = dict()
+    for segment in prefix.split("/"):
+        if "=" in segment:
+            name, value = segment.split("=", 1)
+            values[name.lower()] = value
+
+    try:
+        if "dt" in values or "date" in values:
+            day = values.get("dt", values.get("date")).replace("-", "")
+            start = datetime.datetime.strptime(day, "%Y%m%d")
+            end = start + datetime.timedelta(days=1)
+        elif "year" in values:
+            year = int(values["year"])
+            if "month" not in values:
+                start = datetime.datetime(year, 1, 1)
+                end = datetime.datetime(year + 1, 1, 1)
+            else:
+                month = int(values["month"])
+                if "day" not in values:
+                    start = datetime.datetime(year, month, 1)
+                    end = datetime.datetime(year + month // 12, month % 12 + 1, 1)
+                else:
+                    start = datetime.datetime(year, month, int(values["day"]))
+                    end = start + datetime.timedelta(days=1)
+        else:
+            return None
+
+        if "hour" in values:
+            start = start.replace(hour=int(values["hour"]))
+            end = start + datetime.timedelta(hours=1)
+    except ValueError:
+        return None  # not a time partition after all, never prune it
+
+    return start, end
+
+
+def list_s3_objects_with_partition_pruning(
+    s3_client,
+    bucket: str,
+    prefix: str,
+    modified_after: datetime.datetime,
+    lookback: datetime.timedelta = datetime.timedelta(days=1),
+    max_workers: int = 1,
+    metrics=NULL_METRICS,
+) -> List[S3ObjectSummary]:
+    """
+    List the objects under a hive partitioned prefix (``dt=YYYY-MM-DD/hour=HH/``
+    and alike), level by level with ``Delimiter="/"``. Partitions whose time
+    range ends before ``modified_after - lookback`` are skipped entirely and
+    the surviving partitions of each level are listed concurrently.
+
+    :param s3_client: an boto3.session.Session.client("s3") object
+    :param bucket: s3 bucket name
+    :param prefix: s3 key prefix
+    :param modified_after: naive UTC datetime, usually the bookmark timestamp
+    :param lookback: tolerance for late data written into an older partition
+    :param max_workers: number of partitions listed concurrently
+    :param metrics: where the listed pages are counted
+
+    :return: list of :class:`S3ObjectSummary`
+    """
+    cutoff = modified_after - lookback
+
+    def is_pruned(child_prefix: str) -> bool:
+        time_range = parse_partition_time_range(child_prefix[len(prefix):])
+        return time_range is not None and time_range[1] <= cutoff
+
+    objects = list()
+    frontier = [prefix]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while frontier:
+            next_frontier = list()
+            levels = executor.map(
+                lambda level_prefix: list_s3_prefix_level(s3_client, bucket, level_prefix, metrics=metrics),
+                frontier)
+            for level_objects, child_prefixes in levels:
+                objects.extend(level_objects)
+                next_frontier.extend(
+                    child_prefix for child_prefix in child_prefixes if not is_pruned(child_prefix))
+            frontier = next_frontier
+    return objects
+
+
+def _batch_write_dynamodb_requests(
+    dynamodb_client,
+    table_name: str,
+    requests: List[dict],
+    max_retries: int = 8,
+) -> None:
+    for chunk_start in range(0, len(requests), DYNAMODB_BATCH_WRITE_SIZE):
+        request_items = {
+            table_name: requests[chunk_start:chunk_start + DYNAMODB_BATCH_WRITE_SIZE]
+        }
+        for retry in range(max_retries + 1):
+            response = dynamodb_client.batch_write_item(RequestItems=request_items)
+            request_items = response.get("UnprocessedItems", {})
+            if not request_items:
+                break
+            time.sleep(min(0.05 * 2 ** retry, 5))
+        else:  # pragma: no cover
+            raise Exception(f"Failed to write {len(request_items[table_name])} items to {table_name}")
+
+
+def batch_delete_dynamodb_items(
+    dynamodb_client,
+    table_name: str,
+    keys: List[dict],
+    max_retries: int = 8,
+) -> None:
+    """
+    Delete many items with ``BatchWriteItem``, 25 keys per call. Unprocessed
+    items (throttling) are retried with exponential backoff.
+
+    :param dynamodb_client: an boto3.session.Session.client("dynamodb") object
+    :param table_name: dynamodb table name
+    :param keys: primary keys of the items to delete, in dynamodb json format
+    :param max_retries: maximum number of retries of the unprocessed items
+
+    :return: None
+    """
+    _batch_write_dynamodb_requests(
+        dynamodb_client=dynamodb_client,
+        table_name=table_name,
+        requests=[{"DeleteRequest": {"Key": key}} for key in keys],
+        max_retries=max_retries,
+    )
+
+
+def batch_put_dynamodb_items(
+    dynamodb_client,
+    table_name: str,
+    items: List[dict],
+    max_retries: int = 8,
+) -> None:
+    """
+    Write many items with ``BatchWriteItem``, 25 items per call. Unprocessed
+    items (throttling) are retried with exponential backoff.
+
+    :param dynamodb_client: an boto3.session.Session.client("dynamodb") object
+    :param table_name: dynamodb table name
+    :param items: items to write, in dynamodb json format
+    :param max_retries: maximum number of retries of the unprocessed items
+
+    :return: None
+    """
+    _batch_write_dynamodb_requests(
+        dynamodb_client=dynamodb_client,
+        table_name=table_name,
+        requests=[{"PutRequest": {"Item": item}} for item in items],
+        max_retries=max_retries,
+    )
+
+
+def get_default_boto3_session():
+    """
+    Get the boto3 session shared by everything in this process that wasn't
+    given an explicit session. It is created on first use.
+
+    :return: boto3.session.Session object
+    """
+    global _default_boto3_session
+    with _boto3_lock:
+        if _default_boto3_session is None:
+            import boto3
+            _default_boto3_session = boto3.session.Session()
+        return _default_boto3_session
+
+
+def get_boto3_client(
+    boto3_session,
+    service_name: str,
+    max_pool_connections: int = 10,
+):
+    """
+    Get a pooled boto3 client. Clients are thread safe, so a single client per
+    session, service and connection pool size is created for the whole process
+    and reused afterwards, which avoids paying the client setup (endpoint
+    resolution, credential lookup, new connection pool) again and again.
+
+    :param boto3_session: boto3.session.Session object
+    :param service_name: aws service name, e.g. "s3"
+    :param max_pool_connections: size of the client http connection pool
+
+    :return: boto3 client
+    """
+    cache_key = (id(boto3_session), service_name, max_pool_connections)
+    with _boto3_lock:
+        cached_session, client = _boto3_clients.get(cache_key, (None, None))
+        # the session is kept alive by the cache, so its id can't be reused by another one
+        if cached_session is not boto3_session:
+            from botocore.config import Config
+            client = boto3_session.client(
+                service_name,
+                config=Config(max_pool_connections=max_pool_connections),
+            )
+            _boto3_clients[cache_key] = (boto3_session, client)
+        return client
+
+
+class BandwidthLimiter(object):
+    """
+    Pace the S3 reads of many threads so they don't exceed a global bandwidth
+    budget. Every read reserves its size on a shared virtual clock and waits
+    until its slot starts.
+
+    :param bytes_per_second: the bandwidth budget
+    """
+
+    def __init__(self, bytes_per_second: int):
+        self.bytes_per_second = bytes_per_second
+        self._next_free_time = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self, n_bytes: int) -> None:
+        with self._lock:
+            now = time.time()
+            start_time = max(now, self._next_free_time)
+            self._next_free_time = start_time + n_bytes / self.bytes_per_second
+        if start_time > now:
+            time.sleep(start_time - now)
+
+
+def batch_get_dynamodb_items(
+    dynamodb_client,
+    table_name: str,
+    keys: List[dict],
+    consistent_read: bool = True,
+    max_retries: int = 8,
+) -> List[dict]:
+    """
+    Get many items with ``BatchGetItem``, 100 keys per call. Unprocessed
+    keys (throttling) are retried with exponential backoff.
+
+    :param dynamodb_client: an boto3.session.Session.client("dynamodb") object
+    :param table_name: dynamodb table name
+    :param keys: primary keys of the items to get, in dynamodb json format
+    :param consistent_read: use strongly consistent reads
+    :param max_retries: maximum number of retries of the unprocessed keys
+
+    :return: the items found, in no particular order
+    """
+    items = list()
+    for chunk_start in range(0, len(keys), DYNAMODB_BATCH_GET_SIZE):
+        request_items = {
+            table_name: {
+                "Keys": keys[chunk_start:chunk_start + DYNAMODB_BATCH_GET_SIZE],
+                "ConsistentRead": consistent_read,
+            }
+        }
+        for retry in range(max_retries + 1):
+            response = dynamodb_client.batch_get_item(RequestItems=request_items)
+            items.extend(response.get("Responses", {}).get(table_name, []))
+            request_items = response.get("UnprocessedKeys", {})
+            if not request_items:
+                break
+            time.sleep(min(0.05 * 2 ** retry, 5))
+        else:  # pragma: no cover
+            raise Exception(f"Failed to get {len(request_items[table_name]['Keys'])} items from {table_name}")
+    return items
+
+
+class S3SeekableFile(io.RawIOBase):
+    """
+    Read only, seekable file object over an S3 object. Every ``read()`` is a
+    ranged GET, so readers which only need parts of the file (e.g. the footer
+    and a few column chunks of a parquet file) only transfer those bytes.
+
+    :param s3_client: an boto3.session.Session.client("s3") object
+    :param bucket: s3 bucket name
+    :param key: s3 object key
+    :param size: object size in bytes, looked up with ``HeadObject`` if not given
+    """
+
+    def __init__(self, s3_client, bucket: str, key: str, size: int = None):
+        super(S3SeekableFile, self).__init__()
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        if size is None:
+            size = s3_client.head_object(Bucket=bucket, Key=key)["ContentLength"]
+        self.size = size
+        self.bytes_read = 0
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._position = offset
+        elif whence == io.SEEK_CUR:
+            self._position += offset
+        elif whence == io.SEEK_END:
+            self._position = self.size + offset
+        else:  # pragma: no cover
+            raise ValueError(f"invalid whence {whence}")
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        end = min(self._position + len(buffer), self.size)
+        if end <= self._position:
+            return 0
+        body = self.s3_client.get_object(
+            Bucket=self.bucket,
+            Key=self.key,
+            Range=f"bytes={self._position}-{end - 1}",
+        )["Body"].read()
+        buffer[:len(body)] = body
+        self._position += len(body)
+        self.bytes_read += len(body)
+        return len(body)
+
+
+# compression of the objects by key extension
+COMPRESSION_EXTENSIONS = {
+    ".gz": "gzip",
+    ".bz2": "bz2",
+    ".zst": "zstd",
+}
+
+
+def get_compression(key: str) -> Optional[str]:
+    """
+    Get the compression of an object from its key extension, e.g. "gzip" for
+    ``data.csv.gz``, None for uncompressed objects.
+    """
+    for extension, compression in COMPRESSION_EXTENSIONS.items():
+        if key.endswith(extension):
+            return compression
+    return None
+
+
+def strip_compression_extension(key: str) -> str:
+    """
+    Remove the compression extension of a key, ``data.csv.gz`` becomes ``data.csv``.
+    """
+    for extension in COMPRESSION_EXTENSIONS:
+        if key.endswith(extension):
+            return key[:-len(extension)]
+    return key
+
+
+def open_decompressed_stream(raw_stream, compression: str):
+    """
+    Wrap a binary stream with a streaming decompressor, the decompressed data
+    is produced as it is read and never held in memory as a whole. Closing the
+    returned stream doesn't close ``raw_stream``.
+
+    :param raw_stream: binary file object of compressed data, e.g. the body of
+        an s3 ``get_object()`` response
+    :param compression: one of "gzip", "bz2" and "zstd" (requires the
+        zstandard package)
+    """
+    if compression == "gzip":
+        import gzip
+
+        return gzip.GzipFile(fileobj=raw_stream, mode="rb")
+    elif compression == "bz2":
+        import bz2
+
+        return bz2.BZ2File(raw_stream, mode="rb")
+    elif compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:  # pragma: no cover
+            raise Exception("Reading zstd compressed files requires the zstandard package")
+
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw_stream, closefd=False))
+    else:
+        raise Exception(f"Unknown compression {compression}")
+
+
+def _xml_local_name(tag: str) -> str:
+    # "{http://namespace}name" -> "name"
+    return tag.rsplit("}", 1)[-1]
+
+
+def _flatten_xml_element(element, name: str, record: dict) -> None:
+    for attribute, value in element.attrib.items():
+        attribute = _xml_local_name(attribute)
+        record[f"{name}.{attribute}" if name else attribute] = value
+    for child in element:
+        child_name = _xml_local_name(child.tag)
+        _flatten_xml_element(child, f"{name}.{child_name}" if name else child_name, record)
+    if name:
+        text = (element.text or "").strip()
+        if text or not (len(element) or element.attrib):
+            record[name] = text or None
+
+
+def iter_xml_records(stream, record_path: str) -> Iterator[dict]:
+    """
+    Parse the records of an xml document incrementally with an event driven
+    parser. Every record is flattened into a dict: the attributes and the
+    child elements of the record become keys (``author``, ``price.currency``
+    for nested ones), repeated child elements keep the last value. Records are
+    dropped from the tree once yielded, so memory stays constant whatever the
+    size of the document.
+
+    :param stream: binary file object of the xml document
+    :param record_path: slash separated tags from the document root element to
+        the record elements, e.g. "catalog/book"
+    """
+    import xml.etree.ElementTree as ElementTree
+
+    record_tags = record_path.strip("/").split("/")
+    tags = []
+    elements = []
+    for event, element in ElementTree.iterparse(stream, events=("start", "end")):
+        if event == "start":
+            tags.append(_xml_local_name(element.tag))
+            elements.append(element)
+            continue
+
+        is_record = tags == record_tags
+        tags.pop()
+        elements.pop()
+        if is_record:
+            record = {}
+            _flatten_xml_element(element, "", record)
+            yield record
+            element.clear()
+            if elements:
+                elements[-1].remove(element)
+
+
+_row_filter_operators = {
+    "=": operator.eq,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "in": lambda column, values: column.isin(values),
+    "not in": lambda column, values: ~column.isin(values),
+}
+
+
+def validate_row_filters(filters: List[tuple]) -> None:
+    """
+    Check row filters are a list of ``(column, operator, value)`` tuples, the
+    conjunctive form also understood by ``pyarrow.parquet.read_table(filters=...)``.
+    """
+    for row_filter in filters:
+        if len(row_filter) != 3 or row_filter[1] not in _row_filter_operators:
+            raise Exception(f"Row filter {row_filter} is not valid. It should be a (column, operator, value) "
+                            f"tuple with operator one of {', '.join(_row_filter_operators)}")
+
+
+def apply_row_filters(df, filters: List[tuple]):
+    """
+    Keep the rows of a pandas dataframe matching all the row filters.
+
+    :param df: pandas dataframe
+    :param filters: list of ``(column, operator, value)`` tuples, ANDed
+
+    :return: the filtered pandas dataframe
+    """
+    if not filters:
+        return df
+    mask = None
+    for column, op, value in filters:
+        column_mask = _row_filter_operators[op](df[column], value)
+        mask = column_mask if mask is None else mask & column_mask
+    return df[mask]
+
+
+def optimize_dataframe_dtypes(
+    df,
+    category_max_ratio: float = 0.5,
+    use_arrow_strings: bool = False,
+):
+    """
+    Reduce the memory footprint of a pandas dataframe: low cardinality string
+    columns become categoricals, integers are downcast to the smallest type
+    holding their range and floats to float32 when it's lossless.
+
+    :param df: pandas dataframe
+    :param category_max_ratio: a string column becomes a categorical when its
+        number of distinct values is at most this ratio of its length
+    :param use_arrow_strings: convert the other string columns to arrow
+        backed strings (``string[pyarrow]``)
+
+    :return: the optimized pandas dataframe
+    """
+    import numpy as np
+    import pandas as pd
+
+    optimized_columns = dict()
+    for column_name, column in df.items():
+        dtype = column.dtype
+        if isinstance(dtype, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(dtype):
+            continue
+        if pd.api.types.is_integer_dtype(dtype):
+            downcast = "unsigned" if len(column) and column.min() >= 0 else "integer"
+            optimized_columns[column_name] = pd.to_numeric(column, downcast=downcast)
+        elif pd.api.types.is_float_dtype(dtype) and dtype != np.float32:
+            float32_column = column.astype(np.float32)
+            if ((float32_column.astype(dtype) == column) | column.isna()).all():
+                optimized_columns[column_name] = float32_column
+        elif pd.api.types.is_string_dtype(dtype):
+            if len(column) and column.nunique(dropna=True) <= category_max_ratio * len(column):
+                optimized_columns[column_name] = column.astype("category")
+            elif use_arrow_strings:
+                optimized_columns[column_name] = column.astype("string[pyarrow]")
+
+    if not optimized_columns:
+        return df
+    df = df.copy(deep=False)
+    for column_name, column in optimized_columns.items():
+        df[column_name] = column
+    return df
+
+
+def unify_categorical_columns(dataframes: list) -> list:
+    """
+    Give the categorical columns of many pandas dataframes the same categories,
+    otherwise ``pd.concat`` falls back to (much bigger) object columns.
+
+    :param dataframes: list of pandas dataframes
+
+    :return: list of pandas dataframes
+    """
+    import pandas as pd
+    from pandas.api.types import union_categoricals
+
+    categorical_columns = {
+        column_name
+        for df in dataframes
+        for column_name, dtype in df.dtypes.items()
+        if isinstance(dtype, pd.CategoricalDtype)
+    }
+    if not categorical_columns:
+        return dataframes
+
+    dataframes = [df.copy(deep=False) for df in dataframes]
+    for column_name in categorical_columns:
+        columns = [df[column_name] for df in dataframes if column_name in df.columns]
+        if not all(isinstance(column.dtype, pd.CategoricalDtype) for column in columns):
+            continue  # a file held too many distinct values, the column ends up as strings anyway
+        categories = union_categoricals(columns, ignore_order=True).categories
+        for df in dataframes:
+            if column_name in df.columns:
+                df[column_name] = df[column_name].cat.set_categories(categories)
+    return dataframes
+
+
+def parse_csv(
+    read_csv,
+    source,
+    columns: List[str] = None,
+    filters: List[tuple] = None,
+    chunk_size: int = 100000,
+    **read_csv_kwargs
+):
+    """
+    Parse a csv file into a pandas dataframe. Only the selected columns are
+    parsed, and when filters are given rows are filtered chunk by chunk.
+
+    :param read_csv: the csv parser, ``pandas.read_csv`` or a function with
+        the same signature
+    :param source: what the csv parser reads from, path or file object
+    :param columns: columns to keep, all of them if None
+    :param filters: list of ``(column, operator, value)`` tuples, ANDed
+    :param chunk_size: number of rows parsed at once when filtering
+    :param read_csv_kwargs: other arguments of the csv parser
+
+    :return: pandas dataframe
+    """
+    import pandas as pd
+
+    if not filters:
+        if columns is not None:
+            read_csv_kwargs["usecols"] = columns
+        return read_csv(source, **read_csv_kwargs)
+
+    if columns is not None:
+        # the filtered columns have to be parsed too, they are dropped once the rows are filtered
+        filter_columns = [column for column, _, _ in filters if column not in columns]
+        read_csv_kwargs["usecols"] = columns + filter_columns
+    chunks = []
+    for chunk in read_csv(source, chunksize=chunk_size, **read_csv_kwargs):
+        chunk = apply_row_filters(chunk, filters)
+        chunks.append(chunk[columns] if columns is not None else chunk)
+    return pd.concat(chunks, axis=0, ignore_index=True)
+
+
+def parse_xml(
+    stream,
+    record_path: str,
+    columns: List[str] = None,
+    filters: List[tuple] = None,
+    batch_size: int = 100000,
+):
+    """
+    Parse the records of an xml document (see ``iter_xml_records``) into a
+    pandas dataframe, batch by batch. Numeric columns are converted like the
+    csv parser would, then the filters and the column selection are applied.
+
+    :param stream: binary file object of the xml document
+    :param record_path: slash separated tags from the document root element to
+        the record elements, e.g. "catalog/book"
+    :param columns: columns to keep, all of them if None
+    :param filters: list of ``(column, operator, value)`` tuples, ANDed
+    :param batch_size: number of records turned into a dataframe at once
+
+    :return: pandas dataframe
+    """
+    import itertools
+    import pandas as pd
+
+    batches = []
+    records = iter_xml_records(stream, record_path)
+    while True:
+        batch = pd.DataFrame.from_records(list(itertools.islice(records, batch_size)))
+        if batch.shape[0] == 0:
+            break
+        for column in batch.columns:
+            try:
+                batch[column] = pd.to_numeric(batch[column])
+            except (ValueError, TypeError):
+                pass
+        # an optional element can be absent from a whole batch, its column is added as NaN
+        missing_columns = [
+            column for column in [column for column, _, _ in filters or []] + (columns or [])
+            if column not in batch.columns
+        ]
+        if missing_columns:
+            batch = batch.reindex(columns=list(batch.columns) + list(dict.fromkeys(missing_columns)))
+        batch = apply_row_filters(batch, filters)
+        batches.append(batch.reindex(columns=columns) if columns is not None else batch)
+
+    if not batches:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(batches, axis=0, ignore_index=True)
+
+
+def dataframe_to_arrow_ipc(df) -> bytes:
+    """
+    Serialize a pandas dataframe as an Arrow IPC stream: a columnar buffer
+    which is read back without parsing, much cheaper than pickling the
+    dataframe.
+    """
+    import pyarrow
+
+    table = pyarrow.Table.from_pandas(df, preserve_index=False)
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def arrow_ipc_to_table(buffer: bytes):
+    """
+    Read an Arrow IPC stream into a ``pyarrow.Table``, the columns point
+    into ``buffer`` without any copy.
+    """
+    import pyarrow
+
+    return pyarrow.ipc.open_stream(pyarrow.py_buffer(buffer)).read_all()
+
+
+def parse_file_body(
+    body: bytes,
+    format_of_data: str,
+    compression: str = None,
+    columns: List[str] = None,
+    filters: List[tuple] = None,
+    dtypes: dict = None,
+    xml_record_path: str = None,
+    csv_chunk_size: int = 100000,
+    xml_batch_size: int = 100000,
+):
+    """
+    Parse the raw bytes of a csv, json or xml file into a pandas dataframe.
+
+    :param body: content of the file, possibly compressed
+    :param format_of_data: one of "csv", "json" and "xml"
+    :param compression: compression of the content, see ``get_compression``
+    :param columns: columns to keep, all of them if None
+    :param filters: list of ``(column, operator, value)`` tuples, ANDed
+    :param dtypes: explicit dtypes of the csv columns
+    :param xml_record_path: path of the record elements of xml files
+
+    :return: ``pandas.DataFrame``
+    """
+    import pandas as pd
+
+    stream = io.BytesIO(body)
+    if compression is not None:
+        stream = open_decompressed_stream(stream, compression)
+
+    if format_of_data == "csv":
+        read_csv_kwargs = dict(encoding='ISO-8859-1')
+        if dtypes:
+            read_csv_kwargs["dtype"] = dtypes
+        df = parse_csv(pd.read_csv, stream, columns=columns, filters=filters,
+                       chunk_size=csv_chunk_size, **read_csv_kwargs)
+    elif format_of_data == "json":
+        df = apply_row_filters(pd.read_json(stream), filters)
+        if columns is not None:
+            df = df[columns]
+    elif format_of_data == "xml":
+        df = parse_xml(stream, xml_record_path, columns=columns, filters=filters, batch_size=xml_batch_size)
+    else:
+        raise Exception(f"{format_of_data} files can't be parsed from bytes")
+    return df
+
+
+def parse_file_bytes(body: bytes, format_of_data: str, **parse_kwargs):
+    """
+    Parse the raw bytes of a csv, json or xml file and return the result as an
+    Arrow IPC stream. This is the function run by the parsing processes, its
+    arguments and result are cheap to send between processes. Dataframes arrow
+    can't convert (e.g. object columns of mixed types) are returned as they
+    are, to be pickled instead.
+
+    :param body: content of the file, possibly compressed
+    :param format_of_data: one of "csv", "json" and "xml"
+    :param parse_kwargs: compression, columns, filters, ... see ``parse_file_body``
+
+    :return: Arrow IPC stream bytes, see ``arrow_ipc_to_table``, or ``pandas.DataFrame``
+    """
+    import pyarrow
+
+    df = parse_file_body(body, format_of_data, **parse_kwargs)
+    try:
+        return dataframe_to_arrow_ipc(df)
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+        return df
+
+
+# column names of the S3 Inventory csv reports (given by the "fileSchema" of their manifest) as they are named
+# in the orc and parquet reports
+INVENTORY_CSV_COLUMN_NAMES = {
+    "Bucket": "bucket",
+    "Key": "key",
+    "VersionId": "version_id",
+    "IsLatest": "is_latest",
+    "IsDeleteMarker": "is_delete_marker",
+    "Size": "size",
+    "LastModifiedDate": "last_modified_date",
+    "ETag": "e_tag",
+}
+
+
+def split_s3_url(url: str) -> Tuple[str, str]:
+    """
+    ``s3://bucket/some/key`` becomes ``("bucket", "some/key")``.
+    """
+    if not url.startswith("s3://"):
+        raise Exception(f"{url} is not an s3:// url")
+    bucket, _, key = url[len("s3://"):].partition("/")
+    return bucket, key
+
+
+def find_latest_inventory_manifest_key(
+    s3_client,
+    bucket: str,
+    prefix: str,
+) -> str:
+    """
+    Find the ``manifest.json`` of the latest S3 Inventory report of a
+    configuration. Reports are delivered under dated folders
+    (``<prefix>2022-01-14T01-00Z/manifest.json``) and the manifest is written
+    once the report is complete.
+
+    :param s3_client: an boto3.session.Session.client("s3") object
+    :param bucket: inventory destination bucket
+    :param prefix: ``<destination prefix>/<source bucket>/<configuration id>/``
+
+    :return: the key of the latest ``manifest.json``
+    """
+    prefix = prefix if prefix.endswith("/") else prefix + "/"
+    _, child_prefixes = list_s3_prefix_level(s3_client, bucket, prefix)
+    report_prefixes = sorted(
+        (child_prefix for child_prefix in child_prefixes
+         if re.fullmatch(r"\d{4}-\d{2}-\d{2}T\d{2}-\d{2}Z/", child_prefix[len(prefix):])),
+        reverse=True)
+    for report_prefix in report_prefixes:
+        manifest_key = f"{report_prefix}manifest.json"
+        objects, _ = list_s3_prefix_level(s3_client, bucket, manifest_key)
+        if any(manifest_object.key == manifest_key for manifest_object in objects):
+            return manifest_key
+    raise Exception(f"There is no inventory report under s3://{bucket}/{prefix}")
+
+
+def _normalize_manifest_table(table):
+    # key, size, last_modified (UTC timestamp) and e_tag columns, whatever the manifest types
+    import pyarrow
+    import pyarrow.compute as pc
+
+    last_modified = table.column("last_modified")
+    if pyarrow.types.is_integer(last_modified.type):
+        last_modified = pc.cast(last_modified, pyarrow.timestamp("s"))
+    elif pyarrow.types.is_string(last_modified.type):
+        last_modified = pc.cast(last_modified, pyarrow.timestamp("us", tz="UTC"))
+    if last_modified.type.tz is None:
+        last_modified = pc.assume_timezone(last_modified, "UTC")
+    if "e_tag" in table.column_names:
+        # quoted, as returned by ListObjects
+        e_tag = pc.binary_join_element_wise(
+            '"', pc.utf8_trim(pc.cast(table.column("e_tag"), pyarrow.string()), '"'), '"', "")
+    else:
+        e_tag = pyarrow.nulls(table.num_rows, pyarrow.string())
+    return pyarrow.table({
+        "key": pc.cast(table.column("key"), pyarrow.string()),
+        "size": pc.cast(table.column("size"), pyarrow.int64()),
+        "last_modified": pc.cast(last_modified, pyarrow.timestamp("us", tz="UTC")),
+        "e_tag": e_tag,
+    })
+
+
+def _url_decode_keys(table):
+    # keys of the csv inventory reports are url encoded, only the (usually few) keys holding an escape
+    # sequence are decoded one by one
+    import urllib.parse
+
+    import pyarrow
+    import pyarrow.compute as pc
+
+    is_encoded = pc.match_substring_regex(table.column("key"), r"[%+]")
+    if not pc.any(is_encoded).as_py():
+        return table
+    encoded = table.filter(is_encoded)
+    decoded_keys = pyarrow.array([urllib.parse.unquote_plus(key) for key in encoded.column("key").to_pylist()],
+                                 pyarrow.string())
+    encoded = encoded.set_column(encoded.column_names.index("key"), "key", decoded_keys)
+    return pyarrow.concat_tables([table.filter(pc.invert(is_encoded)), encoded])
+
+
+def read_inventory_file(
+    s3_client,
+    bucket: str,
+    key: str,
+    file_format: str,
+    file_schema: str,
+):
+    """
+    Read one data file of an S3 Inventory report into a ``pyarrow.Table`` of
+    the current objects, with ``key``, ``size``, ``last_modified`` and
+    ``e_tag`` columns. Versions which aren't the latest and delete markers
+    are dropped.
+
+    :param s3_client: an boto3.session.Session.client("s3") object
+    :param bucket: inventory destination bucket
+    :param key: key of the data file, as listed in the manifest
+    :param file_format: "CSV", "ORC" or "Parquet", the manifest "fileFormat"
+    :param file_schema: the manifest "fileSchema", names the csv columns
+    """
+    import pyarrow
+    import pyarrow.compute as pc
+
+    if file_format == "CSV":
+        import pyarrow.csv
+
+        column_names = [INVENTORY_CSV_COLUMN_NAMES.get(name.strip(), name.strip().lower())
+                        for name in file_schema.split(",")]
+        body = s3_client.get_object(Bucket=bucket, Key=key)["Body"]
+        try:
+            with open_decompressed_stream(body, get_compression(key) or "gzip") as stream:
+                table = pyarrow.csv.read_csv(
+                    stream,
+                    read_options=pyarrow.csv.ReadOptions(column_names=column_names),
+                    convert_options=pyarrow.csv.ConvertOptions(
+                        column_types={"key": pyarrow.string(), "e_tag": pyarrow.string(), "size": pyarrow.int64()},
+                        include_columns=[name for name in column_names
+                                         if name in INVENTORY_CSV_COLUMN_NAMES.values()],
+                    ),
+                )
+        finally:
+            body.close()
+        table = _url_decode_keys(table)
+    elif file_format in ("ORC", "Parquet"):
+        import pyarrow.orc
+        import pyarrow.parquet
+
+        with S3SeekableFile(s3_client, bucket, key) as f:
+            if file_format == "ORC":
+                schema_names = pyarrow.orc.ORCFile(f).schema.names
+            else:
+                schema_names = pyarrow.parquet.ParquetFile(f).schema_arrow.names
+            columns = [name for name in schema_names if name in INVENTORY_CSV_COLUMN_NAMES.values()]
+            f.seek(0)
+            if file_format == "ORC":
+                table = pyarrow.orc.read_table(f, columns=columns)
+            else:
+                table = pyarrow.parquet.read_table(f, columns=columns)
+    else:
+        raise Exception(f"Unknown inventory file format {file_format}")
+
+    if "is_latest" in table.column_names:
+        table = table.filter(pc.fill_null(table.column("is_latest"), True))
+    if "is_delete_marker" in table.column_names:
+        table = table.filter(pc.invert(pc.fill_null(table.column("is_delete_marker"), False)))
+    table = table.rename_columns(["last_modified" if name == "last_modified_date" else name
+                                  for name in table.column_names])
+    return _normalize_manifest_table(table)
+
+
+def read_file_manifest(
+    s3_client,
+    bucket: str,
+    key: str,
+):
+    """
+    Read a manifest written by the producer of the data, a csv (with header),
+    newline delimited json or parquet file, possibly compressed, with one row
+    per data file and the columns ``key``, ``size`` and ``last_modified``
+    (timestamp, ISO 8601 string or epoch seconds, UTC), ``e_tag`` is optional.
+
+    :param s3_client: an boto3.session.Session.client("s3") object
+    :param bucket: s3 bucket name
+    :param key: key of the manifest
+
+    :return: ``pyarrow.Table`` with ``key``, ``size``, ``last_modified`` and
+        ``e_tag`` columns
+    """
+    file_name = strip_compression_extension(key)
+    if file_name.endswith(".parquet"):
+        import pyarrow.parquet
+
+        with S3SeekableFile(s3_client, bucket, key) as f:
+            table = pyarrow.parquet.read_table(f)
+    elif file_name.endswith(".csv") or file_name.endswith(".json") or file_name.endswith(".jsonl"):
+        import pyarrow.csv
+        import pyarrow.json
+
+        body = s3_client.get_object(Bucket=bucket, Key=key)["Body"]
+        compression = get_compression(key)
+        try:
+            stream = open_decompressed_stream(body, compression) if compression else body
+            if file_name.endswith(".csv"):
+                table = pyarrow.csv.read_csv(stream)
+            else:
+                table = pyarrow.json.read_json(stream)
+        finally:
+            body.close()
+    else:
+        raise Exception(f"s3://{bucket}/{key} should be a csv, json or parquet manifest")
+    return _normalize_manifest_table(table)
+
+
+def filter_manifest_table(
+    table,
+    prefix: str,
+    suffixes: List[str],
+    modified_after: float = None,
+    start_after: str = None,
+) -> List[S3ObjectSummary]:
+    """
+    Select the candidate new files of a manifest with vectorized filters,
+    only the rows passing them are turned into :class:`S3ObjectSummary`.
+
+    :param table: ``pyarrow.Table`` with ``key``, ``size``, ``last_modified``
+        and ``e_tag`` columns
+    :param prefix: s3 key prefix
+    :param suffixes: the keys should end with one of them
+    :param modified_after: epoch seconds, keep the files modified after it
+    :param start_after: keep the keys which are lexicographically greater
+
+    :return: list of :class:`S3ObjectSummary`
+    """
+    import pyarrow
+    import pyarrow.compute as pc
+
+    if modified_after is not None:
+        table = table.filter(pc.greater(table.column("last_modified"),
+                                        pyarrow.scalar(int(modified_after * 1e6),
+                                                       pyarrow.timestamp("us", tz="UTC"))))
+    if start_after:
+        table = table.filter(pc.greater(table.column("key"), start_after))
+    keys = table.column("key")
+    mask = pc.starts_with(keys, prefix)
+    has_suffix = pc.ends_with(keys, suffixes[0])
+    for suffix in suffixes[1:]:
+        has_suffix = pc.or_(has_suffix, pc.ends_with(keys, suffix))
+    table = table.filter(pc.and_(mask, has_suffix))
+
+    return [
+        S3ObjectSummary(key=row["key"], last_modified=row["last_modified"], size=row["size"], e_tag=row["e_tag"])
+        for row in table.to_pylist()
+    ]
@@ -0,0 +1,236 @@
+"""
+This utility times the phases of a load and counts what they processed, and emits the figures to pluggable sinks
+"""
+
+import contextlib
+import functools
+import io
+import json
+import logging
+import sys
+import threading
+import time
+from typing import Callable, List
+
+# unit of every counter, in CloudWatch terms, counters not listed here are plain counts
+COUNTER_UNITS = {
+    "bytes_read": "Bytes",
+}
+
+
+class Metrics(object):
+    """
+    The constructor initializes the collector with its sinks, callables receiving one record (a dict) per flush,
+    and the dimensions added to every record (e.g. the job name). Timers keep the number of timed blocks, their
+    total and their longest duration in seconds, counters keep a sum. Both are safe to update from many threads.
+    """
+
+    enabled = True
+
+    def __init__(self, sinks: List[Callable[[dict], None]], dimensions: dict = None):
+        self.sinks = list(sinks)
+        self.dimensions = dict(dimensions or {})
+        self.__lock = threading.Lock()
+        self.__thread_totals = threading.local()
+        self.__counters = {}
+        self.__timers = {}
+
+    def increment(self, name: str, value=1):
+        with self.__lock:
+            self.__counters[name] = self.__counters.get(name, 0) + value
+
+    def add_time(self, name: str, seconds: float):
+        with self.__lock:
+            count, total, longest = self.__timers.get(name, (0, 0.0, 0.0))
+            self.__timers[name] = (count + 1, total + seconds, max(longest, seconds))
+        thread_seconds = self.__thread_seconds()
+        thread_seconds[name] = thread_seconds.get(name, 0.0) + seconds
+
+    def __thread_seconds(self) -> dict:
+        if not hasattr(self.__thread_totals, "seconds"):
+            self.__thread_totals.seconds = {}
+        return self.__thread_totals.seconds
+
+    @contextlib.contextmanager
+    def timer(self, name: str):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start_time)
+
+    """
+    Total seconds of a timer spent by the calling thread since its start, used to split a block timed as a whole
+    into its parts (e.g. the parse time of a file is its read time minus its download time)
+    """
+
+    def thread_seconds(self, name: str) -> float:
+        return self.__thread_seconds().get(name, 0.0)
+
+    def snapshot(self, reset: bool = False, **dimensions) -> dict:
+        with self.__lock:
+            counters, timers = self.__counters, self.__timers
+            if reset:
+                self.__counters, self.__timers = {}, {}
+            else:
+                counters, timers = dict(counters), dict(timers)
+        record = dict(self.dimensions)
+        record.update(dimensions)
+        record.update({
+            "timestamp": time.time(),
+            "counters": counters,
+            "timers": {
+                name: {"count": count, "seconds": total, "max_seconds": longest}
+                for name, (count, total, longest) in timers.items()
+            },
+        })
+        return record
+
+    """
+    Send the figures collected since the last flush to every sink and start over. A failing sink is logged and
+    never fails the load.
+    """
+
+    def flush(self, **dimensions) -> dict:
+        record = self.snapshot(reset=True, **dimensions)
+        if not record["counters"] and not record["timers"]:
+            return None
+
+        for sink in self.sinks:
+            try:
+                sink(record)
+            except Exception as e:
+                logging.getLogger("root").warning(f"metrics sink {sink!r} failed: {e}")
+        return record
+
+
+class NullMetrics(object):
+    """
+    The collector of a DataLoader without sinks: every call is a no-op, timers share one empty context manager.
+    """
+
+    enabled = False
+
+    def __init__(self):
+        self.__timer = contextlib.nullcontext()
+
+    def increment(self, name: str, value=1):
+        pass
+
+    def add_time(self, name: str, seconds: float):
+        pass
+
+    def timer(self, name: str):
+        return self.__timer
+
+    def thread_seconds(self, name: str) -> float:
+        return 0.0
+
+    def flush(self, **dimensions) -> dict:
+        return None
+
+
+NULL_METRICS = NullMetrics()
+
+
+def timed(name: str, flush: bool = False):
+    """
+    Time every call of a method of an object having a ``metrics`` attribute. With flush, the figures collected
+    during the call are sent to the sinks afterwards, as a record of the ``name`` operation.
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            try:
+                with self.metrics.timer(name):
+                    return method(self, *args, **kwargs)
+            finally:
+                if flush:
+                    self.metrics.flush(operation=name)
+
+        return wrapper
+
+    return decorator
+
+
+class MeteredStream(io.RawIOBase):
+    """
+    Wrap a stream read while it is downloaded (e.g. the body of a GetObject response), the time spent waiting for
+    its data is added to the ``download`` timer
+    """
+
+    def __init__(self, raw, metrics: Metrics):
+        self.raw = raw
+        self.metrics = metrics
+
+    def readable(self):
+        return True
+
+    def readall(self):
+        start_time = time.perf_counter()
+        data = self.raw.read()
+        self.metrics.add_time("download", time.perf_counter() - start_time)
+        return data
+
+    def readinto(self, buffer):
+        start_time = time.perf_counter()
+        data = self.raw.read(len(buffer))
+        self.metrics.add_time("download", time.perf_counter() - start_time)
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self.raw.close()
+        super().close()
+
+
+class LoggingSink(object):
+    """
+    Log every record as one json line
+    """
+
+    def __init__(self, logger: logging.Logger = None, level: int = logging.INFO):
+        self.logger = logger or logging.getLogger("root")
+        self.level = level
+
+    def __call__(self, record: dict):
+        self.logger.log(self.level, f"bookmark_utils metrics {json.dumps(record, sort_keys=True)}")
+
+
+class EmfSink(object):
+    """
+    Write every record as a CloudWatch Embedded Metric Format json line, CloudWatch Logs turns them into metrics
+    (e.g. from the stdout of a Glue or Lambda job). Counters keep their name, a timer gives two metrics,
+    ``<name>_seconds`` and ``<name>_count``. The dimensions are the given record keys, job_name and operation
+    by default.
+    """
+
+    def __init__(self, namespace: str = "BookmarkUtils", dimension_names: List[str] = None, stream=None):
+        self.namespace = namespace
+        self.dimension_names = dimension_names or ["job_name", "operation"]
+        self.stream = stream
+
+    def __call__(self, record: dict):
+        document = {key: record[key] for key in self.dimension_names if key in record}
+        metric_definitions = []
+        for name, value in sorted(record["counters"].items()):
+            document[name] = value
+            metric_definitions.append({"Name": name, "Unit": COUNTER_UNITS.get(name, "Count")})
+        for name, timer in sorted(record["timers"].items()):
+            document[f"{name}_seconds"] = timer["seconds"]
+            document[f"{name}_count"] = timer["count"]
+            metric_definitions.append({"Name": f"{name}_seconds", "Unit": "Seconds"})
+            metric_definitions.append({"Name": f"{name}_count", "Unit": "Count"})
+
+        document["_aws"] = {
+            "Timestamp": int(record["timestamp"] * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": self.namespace,
+                "Dimensions": [[key for key in self.dimension_names if key in record]],
+                "Metrics": metric_definitions,
+            }],
+        }
+        stream = self.stream or sys.stdout
+        stream.write(json.dumps(document) + "\n")
+        stream.flush()
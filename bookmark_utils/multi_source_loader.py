@@ -0,0 +1,208 @@
+"""
+This utility drains many bookmarked S3 sources from a single process, sharing one worker and bandwidth budget
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, List, Dict
+
+import boto3
+
+from .bookmark_for_python_shell import DataLoader
+from .helpers import BandwidthLimiter, batch_get_dynamodb_items
+
+if TYPE_CHECKING:  # pragma: no cover
+    import pandas as pd
+
+
+class MultiSourceLoader(object):
+    """
+    The constructor initializes the utility with many sources. Every source is a dict of ``DataLoader`` keyword
+    arguments (s3_bucket_name, s3_location, format_of_data, job_name, ...) and job names should be unique.
+    The table, session and bookmark layout given here are used by the sources which don't set their own. The
+    layout defaults to the one of DataLoader, the latest_pointer layout (whose bookmarks are fetched in bulk) should
+    only be used for the sources bookmarked with it from the start.
+    """
+
+    def __init__(self,
+                 sources: List[dict],
+                 dynamo_db_table_for_bookmark_storage: str = "bookmark_table",
+                 max_workers: int = 8,
+                 max_bytes_per_second: int = None,
+                 bookmark_layout: str = "history",
+                 boto3_session: boto3.session.Session = None):
+        self.max_workers = max_workers
+        self.max_bytes_per_second = max_bytes_per_second
+
+        job_names = [source["job_name"] for source in sources]
+        if len(set(job_names)) != len(job_names):
+            raise Exception("Job names of the sources should be unique")
+
+        self.__data_loaders = {}
+        for source in sources:
+            data_loader_kwargs = dict(
+                dynamo_db_table_for_bookmark_storage=dynamo_db_table_for_bookmark_storage,
+                bookmark_layout=bookmark_layout,
+                boto3_session=boto3_session,
+                max_pool_connections=max(10, max_workers),
+            )
+            data_loader_kwargs.update(source)
+            self.__data_loaders[source["job_name"]] = DataLoader(**data_loader_kwargs)
+        self.__last_load_stats = {}
+
+    @property
+    def max_workers(self):
+        return self.__max_workers
+
+    @max_workers.setter
+    def max_workers(self, value):
+        if not isinstance(value, int) or value < 1:
+            raise Exception("max_workers should be a positive integer")
+
+        self.__max_workers = value
+
+    @property
+    def max_bytes_per_second(self):
+        """
+        Global bandwidth budget of the S3 reads of all the sources, unlimited when None.
+        """
+        return self.__max_bytes_per_second
+
+    @max_bytes_per_second.setter
+    def max_bytes_per_second(self, value):
+        if value is not None and (not isinstance(value, int) or value < 1):
+            raise Exception("max_bytes_per_second should be a positive integer")
+
+        self.__max_bytes_per_second = value
+
+    @property
+    def data_loaders(self) -> Dict[str, DataLoader]:
+        return self.__data_loaders
+
+    @property
+    def last_load_stats(self):
+        """
+        Throughput figures of the last ``load_data_from_s3`` run, all sources together.
+        """
+        return self.__last_load_stats
+
+    """
+    get the latest bookmarks of all the sources. The latest pointer items are fetched with BatchGetItem,
+    one call per 100 sources, the history layout sources are queried concurrently.
+    """
+
+    def get_latest_bookmarks_from_db(self, status="COMPLETE") -> Dict[str, dict]:
+        bookmarks = {}
+
+        pointer_loaders_by_table = {}
+        history_loaders = []
+        for data_loader in self.data_loaders.values():
+            if data_loader.bookmark_layout == "latest_pointer":
+                pointer_loaders_by_table.setdefault(
+                    data_loader.dynamo_db_table_for_bookmark_storage, []).append(data_loader)
+            else:
+                history_loaders.append(data_loader)
+
+        for table_name, data_loaders in pointer_loaders_by_table.items():
+            items = batch_get_dynamodb_items(
+                dynamodb_client=data_loaders[0].dynamodb_client,
+                table_name=table_name,
+                keys=[data_loader.latest_pointer_key() for data_loader in data_loaders],
+            )
+            items_by_job_name = {item['job_name']['S']: item for item in items}
+            for data_loader in data_loaders:
+                bookmarks[data_loader.job_name] = data_loader.bookmark_from_latest_pointer(
+                    items_by_job_name.get(data_loader.job_name, {}), status=status)
+
+        if history_loaders:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(history_loaders))) as executor:
+                history_bookmarks = executor.map(
+                    lambda data_loader: data_loader.get_latest_bookmark_from_db(status=status), history_loaders)
+                for data_loader, bookmark in zip(history_loaders, history_bookmarks):
+                    bookmarks[data_loader.job_name] = bookmark
+
+        return bookmarks
+
+    """
+    This method reads the new data of every source from S3. Bookmarks are fetched in bulk, new files are
+    discovered for every source concurrently and all the files are read by one pool of max_workers threads,
+    paced by max_bytes_per_second. Returns the dataframe of every source by job name.
+    """
+
+    def load_data_from_s3(self) -> "Dict[str, pd.DataFrame]":
+        existing_bookmarks = self.get_latest_bookmarks_from_db(status="COMPLETE")
+        data_loaders = list(self.data_loaders.values())
+        bandwidth_limiter = BandwidthLimiter(self.max_bytes_per_second) if self.max_bytes_per_second else None
+
+        def discover(data_loader):
+            bookmark = existing_bookmarks[data_loader.job_name]
+            return data_loader.get_latest_files_from_s3_using_bookmark(
+                bookmark["bookmark_timestamp"], bookmark["last_processed_key"])
+
+        def read(task):
+            data_loader, file = task
+            if bandwidth_limiter is not None:
+                bandwidth_limiter.acquire(file.size)
+            return data_loader.read_file_from_s3(file)
+
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            discoveries = dict(zip([data_loader.job_name for data_loader in data_loaders],
+                                   executor.map(discover, data_loaders)))
+            tasks = [
+                (data_loader, file)
+                for data_loader in data_loaders
+                for file in discoveries[data_loader.job_name][1]
+            ]
+            dataframes = iter(list(executor.map(read, tasks)))
+
+        results = {}
+        for data_loader in data_loaders:
+            latest_timestamp, files_to_process = discoveries[data_loader.job_name]
+            if not files_to_process:
+                results[data_loader.job_name] = data_loader.concat_loaded_data([])
+                continue
+
+            source_dataframes = [next(dataframes) for _ in files_to_process]
+            results[data_loader.job_name] = data_loader.concat_loaded_data(source_dataframes)
+            data_loader.register_loaded_files(
+                existing_bookmarks[data_loader.job_name]["bookmark_timestamp"], latest_timestamp, files_to_process)
+
+        for data_loader in data_loaders:
+            data_loader.metrics.flush(operation="load_data_from_s3")
+
+        seconds = max(time.time() - start_time, 1e-9)
+        total_bytes = sum(file.size for _, file in tasks)
+        self.__last_load_stats = {
+            "sources": len(data_loaders),
+            "sources_with_new_data": sum(1 for df in results.values() if df.shape[0]),
+            "files": len(tasks),
+            "rows": sum(df.shape[0] for df in results.values()),
+            "bytes": total_bytes,
+            "seconds": seconds,
+            "max_workers": self.max_workers,
+            "megabytes_per_second": total_bytes / 1024 / 1024 / seconds,
+        }
+        print(f"loaded {len(tasks)} files of {len(data_loaders)} sources in {seconds:.2f} seconds")
+        return results
+
+    """
+    commit the bookmark of every source (or of the given job names) independently, a failure of one source
+    doesn't prevent the others from being committed
+    """
+
+    def commit(self, job_names: List[str] = None):
+        job_names = list(self.data_loaders) if job_names is None else job_names
+
+        def commit_one(job_name):
+            try:
+                self.data_loaders[job_name].commit()
+            except Exception as e:
+                print(f"failed to commit the bookmark of {job_name}: {e}")
+                return job_name
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, max(len(job_names), 1))) as executor:
+            failed_job_names = [job_name for job_name in executor.map(commit_one, job_names) if job_name]
+
+        if failed_job_names:
+            raise Exception(f"Failed to commit the bookmark of {', '.join(failed_job_names)}")
@@ -0,0 +1,135 @@
+"""
+This utility keeps local copies of S3 objects, so retries and repeated loads of the same files are served from disk
+"""
+
+import contextlib
+import os
+import hashlib
+import threading
+import uuid
+
+# directory of the cache where the objects are downloaded before being moved in place, never evicted
+DOWNLOAD_DIR_NAME = ".downloads"
+
+# local copies being read in this process (by any cache), with their number of readers, they are never evicted
+_pinned_paths = {}
+_pinned_paths_lock = threading.Lock()
+
+
+class ObjectCache(object):
+    """
+    The constructor initializes the cache with a local directory and a size cap in bytes. Objects are keyed by
+    bucket, key and ETag, so a new version of an object never hits the old copy. When the cap is exceeded the
+    least recently used copies are evicted. The access time is kept as the file modification time, hence the
+    directory can be shared by several processes (e.g. several jobs reading the same feed on one host).
+    Copies are read within ``pinned`` blocks, concurrent evictions of the process never remove them meanwhile.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 10 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.__lock = threading.Lock()
+        os.makedirs(os.path.join(cache_dir, DOWNLOAD_DIR_NAME), exist_ok=True)
+
+    @property
+    def max_bytes(self):
+        return self.__max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, value):
+        if not isinstance(value, int) or value < 1:
+            raise Exception("max_bytes should be a positive integer")
+
+        self.__max_bytes = value
+
+    def get_cache_path(self, bucket: str, key: str, e_tag: str) -> str:
+        digest = hashlib.sha256(f"{bucket}/{key}/{e_tag}".encode("utf-8")).hexdigest()
+        # keep the file name, readers may rely on the extension (e.g. compression)
+        return os.path.join(self.cache_dir, f"{digest}-{os.path.basename(key)}")
+
+    """
+    Keep the copy of an S3 object from being evicted by this process within the block, fetch it inside the block
+    and read it before the block ends. The cache may exceed max_bytes while copies are pinned.
+    """
+
+    @contextlib.contextmanager
+    def pinned(self, bucket: str, key: str, e_tag: str):
+        path = self.get_cache_path(bucket, key, e_tag)
+        with _pinned_paths_lock:
+            _pinned_paths[path] = _pinned_paths.get(path, 0) + 1
+        try:
+            yield path
+        finally:
+            with _pinned_paths_lock:
+                _pinned_paths[path] -= 1
+                if not _pinned_paths[path]:
+                    del _pinned_paths[path]
+
+    """
+    Get the local path of an S3 object, downloading it first if it isn't in the cache yet. The download
+    can be tuned with a boto3 TransferConfig, e.g. concurrent byte-range GETs for large objects.
+    """
+
+    def fetch(self, s3_client, bucket: str, key: str, e_tag: str, size: int = None, transfer_config=None) -> str:
+        path = self.get_cache_path(bucket, key, e_tag)
+        try:
+            os.utime(path)  # mark as recently used
+            with self.__lock:
+                self.hits += 1
+            return path
+        except FileNotFoundError:
+            pass
+
+        with self.__lock:
+            self.misses += 1
+        if size is not None and size > self.max_bytes:  # pragma: no cover
+            raise Exception(f"s3://{bucket}/{key} is bigger than the cache")
+        self.evict(reserved_bytes=size or 0)
+
+        # download to a temporary file first (s3transfer adds its own temporary files next to it), readers never
+        # see a partial file and eviction never removes a file being downloaded
+        temp_path = os.path.join(self.cache_dir, DOWNLOAD_DIR_NAME, f"{uuid.uuid4().hex}-{os.path.basename(path)}")
+        try:
+            s3_client.download_file(Bucket=bucket, Key=key, Filename=temp_path, Config=transfer_config)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return path
+
+    """
+    Remove the least recently used objects, but the pinned ones, until the cache holds at most
+    max_bytes - reserved_bytes bytes
+    """
+
+    def evict(self, reserved_bytes: int = 0):
+        with self.__lock:
+            entries = []
+            for entry in os.scandir(self.cache_dir):
+                if entry.is_file():
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:  # pragma: no cover
+                        continue  # evicted by another process
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total_bytes = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total_bytes + reserved_bytes <= self.max_bytes:
+                    break
+                with _pinned_paths_lock:
+                    if path in _pinned_paths:
+                        continue
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:  # pragma: no cover
+                        pass
+                total_bytes -= size
+
+    def clear(self):
+        with self.__lock:
+            for entry in os.scandir(self.cache_dir):
+                if entry.is_file():
+                    os.remove(entry.path)
@@ -0,0 +1,366 @@
+"""
+This utility drains the backlog of one bookmarked S3 source with many workers, coordinated through work unit
+leases stored in the bookmark table
+"""
+
+import datetime
+import time
+import uuid
+from typing import TYPE_CHECKING, Iterator, List
+
+from .bookmark_for_python_shell import DataLoader
+from .helpers import S3ObjectSummary, batch_delete_dynamodb_items, batch_put_dynamodb_items
+
+if TYPE_CHECKING:  # pragma: no cover
+    import pandas as pd
+
+# sort key of the plan item of a job, stored in the "<job name>#work_units" partition
+WORK_UNIT_PLAN_SORT_KEY = 0
+
+# number of work units read per query while looking for a unit to claim or for the done ones
+WORK_UNIT_QUERY_PAGE_SIZE = 25
+
+
+class ShardedLoader(object):
+    """
+    The constructor initializes the utility with the DataLoader of the source. Every worker (process or separate
+    job) creates its own ShardedLoader with the same DataLoader settings. The first worker to find no unfinished
+    plan splits the new files into work units of about files_per_unit files, then every worker claims units with a
+    lease of lease_seconds, which should be longer than the processing of a unit: the unit of a worker which dies
+    is claimed again by another one once the lease expires.
+    """
+
+    def __init__(self,
+                 data_loader: DataLoader,
+                 files_per_unit: int = 100,
+                 lease_seconds: int = 900,
+                 worker_id: str = None):
+        self.__data_loader = data_loader
+        self.files_per_unit = files_per_unit
+        self.lease_seconds = lease_seconds
+        self.worker_id = worker_id or uuid.uuid4().hex
+
+    @property
+    def data_loader(self) -> DataLoader:
+        return self.__data_loader
+
+    @property
+    def files_per_unit(self):
+        return self.__files_per_unit
+
+    @files_per_unit.setter
+    def files_per_unit(self, value):
+        if not isinstance(value, int) or value < 1:
+            raise Exception("files_per_unit should be a positive integer")
+
+        self.__files_per_unit = value
+
+    @property
+    def lease_seconds(self):
+        return self.__lease_seconds
+
+    @lease_seconds.setter
+    def lease_seconds(self, value):
+        if not isinstance(value, int) or value < 1:
+            raise Exception("lease_seconds should be a positive integer")
+
+        self.__lease_seconds = value
+
+    def plan_key(self) -> dict:
+        return {
+            'job_name': {'S': f"{self.data_loader.job_name}#work_units"},
+            'bookmark_timestamp': {'N': str(WORK_UNIT_PLAN_SORT_KEY)},
+        }
+
+    def work_unit_key(self, plan: dict, unit_number: int) -> dict:
+        return {
+            'job_name': {'S': f"{self.data_loader.job_name}#work_units#{plan['plan_id']}"},
+            'bookmark_timestamp': {'N': str(unit_number)},
+        }
+
+    """
+    get the current plan of the job: its id, number of work units and number of leading units done and
+    bookmarked. None if the job has never been planned.
+    """
+
+    def get_plan(self) -> dict:
+        item = self.data_loader.dynamodb_client.get_item(
+            TableName=self.data_loader.dynamo_db_table_for_bookmark_storage,
+            Key=self.plan_key(),
+            ConsistentRead=True,
+        ).get('Item')
+        if item is None:
+            return None
+        return {
+            "plan_id": item['plan_id']['S'],
+            "unit_count": int(item['unit_count']['N']),
+            "done_through": int(item['done_through']['N']),
+        }
+
+    @staticmethod
+    def is_plan_finished(plan: dict) -> bool:
+        return plan["done_through"] >= plan["unit_count"]
+
+    """
+    Split files, in processing order, into work units of files_per_unit files. Outside key ordered mode, files
+    sharing the same last modified timestamp are kept in the same unit so the bookmark of a unit can't skip data.
+    """
+
+    def split_into_work_units(self, files: list) -> List[list]:
+        units = []
+        unit = []
+        for index, file in enumerate(files):
+            unit.append(file)
+            is_last_file = index == len(files) - 1
+            if not is_last_file and not self.data_loader.key_ordered \
+                    and files[index + 1].last_modified == file.last_modified:
+                continue
+            if len(unit) >= self.files_per_unit or is_last_file:
+                units.append(unit)
+                unit = []
+        return units
+
+    """
+    Plan the job unless an unfinished plan exists: the new files since the COMPLETE bookmark are split into work
+    units which are written to the bookmark table, then the plan item is swapped with a conditional write so only
+    one of several concurrent planners wins. Returns the current plan, None if there is nothing to process.
+    """
+
+    def plan(self) -> dict:
+        data_loader = self.data_loader
+        plan = self.get_plan()
+        if plan is not None and not self.is_plan_finished(plan):
+            plan = self.advance_bookmark(plan)  # catch up with a worker which died before bookmarking
+            if not self.is_plan_finished(plan):
+                return plan
+
+        existing_bookmark = data_loader.get_latest_bookmark_from_db(status="COMPLETE")
+        _, files_to_process = data_loader.get_latest_files_from_s3_using_bookmark(
+            existing_bookmark["bookmark_timestamp"], existing_bookmark["last_processed_key"])
+        if not files_to_process:
+            print("there are no files to process")
+            return plan
+
+        units = self.split_into_work_units(data_loader.sort_files_for_processing(files_to_process))
+        new_plan = {"plan_id": uuid.uuid4().hex, "unit_count": len(units), "done_through": 0}
+        through_timestamp = datetime.datetime.fromtimestamp(existing_bookmark["bookmark_timestamp"])
+        items = []
+        for unit_number, unit in enumerate(units, start=1):
+            # the bookmark of the job once this unit and all the previous ones are done
+            through_timestamp = max([through_timestamp] + [file.last_modified.replace(tzinfo=None) for file in unit])
+            item = dict(self.work_unit_key(new_plan, unit_number))
+            item.update({
+                'status': {'S': "PENDING"},
+                'files': {'L': [
+                    {'M': {
+                        'key': {'S': file.key},
+                        'last_modified': {'S': file.last_modified.isoformat()},
+                        'size': {'N': str(file.size)},
+                        'e_tag': {'S': file.e_tag},
+                    }} for file in unit
+                ]},
+                'through_timestamp': {'N': through_timestamp.strftime('%s')},
+                'through_key': {'S': unit[-1].key},
+            })
+            items.append(item)
+        batch_put_dynamodb_items(
+            dynamodb_client=data_loader.dynamodb_client,
+            table_name=data_loader.dynamo_db_table_for_bookmark_storage,
+            items=items,
+        )
+
+        plan_item = dict(self.plan_key())
+        plan_item.update({
+            'plan_id': {'S': new_plan["plan_id"]},
+            'unit_count': {'N': str(new_plan["unit_count"])},
+            'done_through': {'N': "0"},
+            'planned_by': {'S': self.worker_id},
+            'data_load_timestamp': {'N': datetime.datetime.now().strftime('%s')},
+        })
+        put_item_kwargs = dict(
+            TableName=data_loader.dynamo_db_table_for_bookmark_storage,
+            Item=plan_item,
+            ConditionExpression="attribute_not_exists(plan_id)",
+        )
+        if plan is not None:
+            put_item_kwargs["ConditionExpression"] = "plan_id = :previous_plan_id"
+            put_item_kwargs["ExpressionAttributeValues"] = {':previous_plan_id': {'S': plan["plan_id"]}}
+        try:
+            data_loader.dynamodb_client.put_item(**put_item_kwargs)
+        except data_loader.dynamodb_client.exceptions.ConditionalCheckFailedException:
+            # planned by another worker meanwhile, drain its plan
+            self.delete_work_units(new_plan)
+            return self.get_plan()
+
+        print(f"planned {len(files_to_process)} files of {data_loader.job_name} in {len(units)} work units")
+        if plan is not None:
+            self.delete_work_units(plan)
+        return new_plan
+
+    def delete_work_units(self, plan: dict):
+        batch_delete_dynamodb_items(
+            dynamodb_client=self.data_loader.dynamodb_client,
+            table_name=self.data_loader.dynamo_db_table_for_bookmark_storage,
+            keys=[self.work_unit_key(plan, unit_number) for unit_number in range(1, plan["unit_count"] + 1)],
+        )
+
+    """
+    read the work units of a plan after the given unit number, in order, page by page
+    """
+
+    def iter_work_units(self, plan: dict, after: int = 0) -> Iterator[dict]:
+        query_kwargs = dict(
+            TableName=self.data_loader.dynamo_db_table_for_bookmark_storage,
+            KeyConditionExpression="#job_name = :job_name AND #bookmark_timestamp > :after",
+            ExpressionAttributeNames={
+                '#job_name': 'job_name',
+                '#bookmark_timestamp': 'bookmark_timestamp',
+            },
+            ExpressionAttributeValues={
+                ':job_name': self.work_unit_key(plan, 0)['job_name'],
+                ':after': {'N': str(after)},
+            },
+            ScanIndexForward=True,
+            ConsistentRead=True,
+            Limit=WORK_UNIT_QUERY_PAGE_SIZE,
+        )
+        while True:
+            result = self.data_loader.dynamodb_client.query(**query_kwargs)
+            for item in result['Items']:
+                yield {
+                    "unit_number": int(item['bookmark_timestamp']['N']),
+                    "status": item['status']['S'],
+                    "lease_expires_at": int(item.get('lease_expires_at', {}).get('N', 0)),
+                    "files": [
+                        S3ObjectSummary(
+                            key=file['M']['key']['S'],
+                            last_modified=datetime.datetime.fromisoformat(file['M']['last_modified']['S']),
+                            size=int(file['M']['size']['N']),
+                            e_tag=file['M']['e_tag']['S'],
+                        ) for file in item['files']['L']
+                    ],
+                    "through_timestamp": int(item['through_timestamp']['N']),
+                    "through_key": item['through_key']['S'],
+                }
+            if 'LastEvaluatedKey' not in result:
+                return
+            query_kwargs['ExclusiveStartKey'] = result['LastEvaluatedKey']
+
+    """
+    claim the first pending work unit of a plan which isn't leased, or whose lease expired, with a conditional
+    write. Returns None when every pending unit is leased by another worker.
+    """
+
+    def claim_work_unit(self, plan: dict) -> dict:
+        dynamodb_boto3_client = self.data_loader.dynamodb_client
+        for unit in self.iter_work_units(plan, after=plan["done_through"]):
+            now = int(time.time())
+            if unit["status"] != "PENDING" or unit["lease_expires_at"] >= now:
+                continue
+            try:
+                dynamodb_boto3_client.update_item(
+                    TableName=self.data_loader.dynamo_db_table_for_bookmark_storage,
+                    Key=self.work_unit_key(plan, unit["unit_number"]),
+                    UpdateExpression="SET lease_owner = :worker_id, lease_expires_at = :lease_expires_at "
+                                     "ADD attempts :one",
+                    ConditionExpression="#status = :pending AND "
+                                        "(attribute_not_exists(lease_expires_at) OR lease_expires_at < :now)",
+                    ExpressionAttributeNames={'#status': 'status'},
+                    ExpressionAttributeValues={
+                        ':worker_id': {'S': self.worker_id},
+                        ':lease_expires_at': {'N': str(now + self.lease_seconds)},
+                        ':one': {'N': "1"},
+                        ':pending': {'S': "PENDING"},
+                        ':now': {'N': str(now)},
+                    },
+                )
+            except dynamodb_boto3_client.exceptions.ConditionalCheckFailedException:
+                continue  # claimed by another worker meanwhile
+            return unit
+        return None
+
+    """
+    mark a claimed work unit done, as long as this worker still holds its lease
+    """
+
+    def complete_work_unit(self, plan: dict, unit: dict):
+        dynamodb_boto3_client = self.data_loader.dynamodb_client
+        try:
+            dynamodb_boto3_client.update_item(
+                TableName=self.data_loader.dynamo_db_table_for_bookmark_storage,
+                Key=self.work_unit_key(plan, unit["unit_number"]),
+                UpdateExpression="SET #status = :done, completed_at = :now",
+                ConditionExpression="lease_owner = :worker_id AND #status = :pending",
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={
+                    ':done': {'S': "DONE"},
+                    ':now': {'N': str(int(time.time()))},
+                    ':worker_id': {'S': self.worker_id},
+                    ':pending': {'S': "PENDING"},
+                },
+            )
+        except dynamodb_boto3_client.exceptions.ConditionalCheckFailedException:
+            print(f"the lease of work unit {unit['unit_number']} expired, it may be processed twice")
+
+    """
+    Advance the COMPLETE bookmark of the job to the last work unit of the plan which is done along with all the
+    previous ones. Concurrent workers may do so at the same time, neither the bookmark nor the plan ever move back.
+    """
+
+    def advance_bookmark(self, plan: dict) -> dict:
+        data_loader = self.data_loader
+        last_done_unit = None
+        for unit in self.iter_work_units(plan, after=plan["done_through"]):
+            if unit["status"] != "DONE":
+                break
+            last_done_unit = unit
+        if last_done_unit is None:
+            return plan
+
+        dynamodb_boto3_client = data_loader.dynamodb_client
+        try:
+            data_loader.register_bookmark(
+                datetime.datetime.fromtimestamp(last_done_unit["through_timestamp"]),
+                status="COMPLETE",
+                last_processed_key=last_done_unit["through_key"] if data_loader.key_ordered else None,
+                only_forward=True,
+                clear_in_progress=True)
+        except dynamodb_boto3_client.exceptions.ConditionalCheckFailedException:
+            pass  # advanced further by another worker meanwhile
+
+        try:
+            dynamodb_boto3_client.update_item(
+                TableName=data_loader.dynamo_db_table_for_bookmark_storage,
+                Key=self.plan_key(),
+                UpdateExpression="SET done_through = :done_through",
+                ConditionExpression="plan_id = :plan_id AND done_through < :done_through",
+                ExpressionAttributeValues={
+                    ':done_through': {'N': str(last_done_unit["unit_number"])},
+                    ':plan_id': {'S': plan["plan_id"]},
+                },
+            )
+        except dynamodb_boto3_client.exceptions.ConditionalCheckFailedException:
+            pass  # advanced further by another worker meanwhile
+        return dict(plan, done_through=max(plan["done_through"], last_done_unit["unit_number"]))
+
+    """
+    This method is run by every worker: it plans the job if needed, then claims and reads work units until none
+    is left, yielding the data of every unit. A unit is marked done, and the bookmark advanced, only when the
+    consumer asks for the next one (or exhausts the iterator), i.e. once the yielded data has been handled.
+    """
+
+    def load_work_units(self) -> "Iterator[pd.DataFrame]":
+        data_loader = self.data_loader
+        plan = self.plan()
+        while plan is not None and not self.is_plan_finished(plan):
+            unit = self.claim_work_unit(plan)
+            if unit is None:
+                print("there are no work units left to claim")
+                return
+
+            print(f"worker {self.worker_id} claimed work unit {unit['unit_number']}/{plan['unit_count']} "
+                  f"({len(unit['files'])} files)")
+            yield data_loader.concat_loaded_data(data_loader.read_files_from_s3(unit["files"]))
+            self.complete_work_unit(plan, unit)
+            plan = self.advance_bookmark(plan)
+            data_loader.metrics.flush(operation="load_work_unit")
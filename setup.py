@@ -29,7 +29,8 @@ download_url = "https://pypi.python.org/pypi/{}/{}#downloads".format(
 )
 install_requires = read_requirements_file(os.path.join(dir_here, "requirements.txt"))
 extras_require = {
-    "tests": read_requirements_file(os.path.join(dir_here, "requirements-test.txt"))
+    "tests": read_requirements_file(os.path.join(dir_here, "requirements-test.txt")),
+    "async": ["aiobotocore"],
 }
 packages = [package_name, ] + [
     "{}.{}".format(package_name, file)
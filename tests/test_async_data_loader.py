@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+import os
+import asyncio
+import datetime
+import boto3
+import pytest
+import bookmark_utils
+from bookmark_utils import AsyncDataLoader, DataLoader
+
+pytest.importorskip("aiobotocore")
+
+boto_ses = boto3.session.Session()
+sts = boto_ses.client("sts")
+s3 = boto_ses.client("s3")
+
+account_id = sts.get_caller_identity()["Account"]
+
+package_name = bookmark_utils.__name__
+dir_here = os.path.dirname(os.path.abspath(__file__))
+
+
+class TestAsyncDataLoader:
+    # --- Tests dependencies
+    test_s3_bucket = "{}-{}-test".format(
+        account_id,
+        package_name.replace("_", "-"),
+    )
+    test_s3_prefix = "async"
+    test_dynamodb_table = "{}_{}_test".format(
+        account_id,
+        package_name.replace("-", "_"),
+    )
+
+    @classmethod
+    def setup_class(cls):
+        try:
+            s3.head_bucket(Bucket=cls.test_s3_bucket)
+        except Exception as e:
+            if "HeadBucket operation: Not Found" in str(e):
+                s3.create_bucket(Bucket=cls.test_s3_bucket)
+            else:
+                raise
+
+        for fname in ["a.csv", "b.csv"]:
+            path = os.path.join(dir_here, "data", fname)
+            s3.upload_file(path, Bucket=cls.test_s3_bucket, Key=f"{cls.test_s3_prefix}/{fname}")
+
+    def new_data_loader(self, job_name, **kwargs):
+        return DataLoader(
+            s3_bucket_name=self.test_s3_bucket,
+            s3_location=self.test_s3_prefix,
+            format_of_data="csv",
+            job_name=job_name,
+            dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table,
+            **kwargs)
+
+    # --- Test cases
+    @pytest.mark.parametrize("bookmark_layout", ["history", "latest_pointer"])
+    def test_load_data_from_s3_and_commit(self, bookmark_layout):
+        data_loader_kwargs = dict(bookmark_layout=bookmark_layout, key_ordered=bookmark_layout == "latest_pointer")
+        data_loader = self.new_data_loader(f"job_test_async_load_{bookmark_layout}", **data_loader_kwargs)
+
+        async def load_and_commit():
+            async with AsyncDataLoader(data_loader, max_concurrency=4) as async_data_loader:
+                df = await async_data_loader.load_data_from_s3()
+                assert await async_data_loader.get_latest_timestamp_from_db(status="COMPLETE") == 0
+                await async_data_loader.commit()
+                assert await async_data_loader.get_latest_timestamp_from_db(status="COMPLETE") != 0
+                bookmark = await async_data_loader.get_latest_bookmark_from_db(status="COMPLETE")
+                _, new_files = await async_data_loader.get_latest_files_from_s3_using_bookmark(
+                    bookmark["bookmark_timestamp"], bookmark["last_processed_key"])
+                return df, new_files
+
+        df, new_files = asyncio.run(load_and_commit())
+        expected_df = self.new_data_loader(f"job_test_async_expected_{bookmark_layout}",
+                                           **data_loader_kwargs).load_data_from_s3()
+        assert df.equals(expected_df)
+        assert new_files == []
+        # the sync DataLoader sees the bookmark committed by the async one
+        assert data_loader.check_for_new_data() == []
+
+    def test_key_ordered_crash_before_commit(self):
+        data_loader = self.new_data_loader("job_test_async_key_ordered_crash_before_commit", key_ordered=True)
+        committed_bookmark = {
+            "bookmark_timestamp": int(datetime.datetime(2100, 1, 1).strftime("%s")),
+            "last_processed_key": f"{self.test_s3_prefix}/a.csv",
+        }
+        data_loader.register_bookmark(datetime.datetime(2100, 1, 1), status="COMPLETE",
+                                      last_processed_key=f"{self.test_s3_prefix}/a.csv")
+
+        async def load_without_commit():
+            async with AsyncDataLoader(data_loader) as async_data_loader:
+                return await async_data_loader.load_data_from_s3()
+
+        # the run dies between the IN_PROGRESS bookmark and the commit
+        assert asyncio.run(load_without_commit()).shape[0] != 0
+        assert data_loader.get_latest_bookmark_from_db(status="COMPLETE") == committed_bookmark
+        assert data_loader.get_latest_bookmark_from_db(status="IN_PROGRESS")["last_processed_key"] == \
+               f"{self.test_s3_prefix}/b.csv"
+
+    def test_concurrent_loaders(self):
+        data_loaders = [self.new_data_loader(f"job_test_async_concurrent_{index}") for index in range(3)]
+
+        async def load_all():
+            async with AsyncDataLoader(data_loaders[0]) as first, AsyncDataLoader(data_loaders[1]) as second, \
+                    AsyncDataLoader(data_loaders[2]) as third:
+                return await asyncio.gather(first.load_data_from_s3(), second.load_data_from_s3(),
+                                            third.load_data_from_s3())
+
+        dataframes = asyncio.run(load_all())
+        assert all(df.equals(dataframes[0]) for df in dataframes) and dataframes[0].shape[0] != 0
+
+    def test_credentials_of_boto3_session(self):
+        boto3_session = boto3.session.Session(
+            aws_access_key_id="AKIAEXPLICITKEY", aws_secret_access_key="explicit-secret",
+            aws_session_token="explicit-token", region_name=boto_ses.region_name)
+        data_loader = self.new_data_loader("job_test_async_credentials", boto3_session=boto3_session)
+
+        async def get_credentials():
+            async with AsyncDataLoader(data_loader) as async_data_loader:
+                return await async_data_loader.s3_client._request_signer._credentials.get_frozen_credentials()
+
+        credentials = asyncio.run(get_credentials())
+        assert (credentials.access_key, credentials.secret_key, credentials.token) == \
+               ("AKIAEXPLICITKEY", "explicit-secret", "explicit-token")
+
+    def test_not_opened_exception(self):
+        with pytest.raises(Exception) as ex:
+            AsyncDataLoader(self.new_data_loader("job_test_async_not_opened")).s3_client
+        assert str(ex.value) == "AsyncDataLoader should be opened with async with"
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
 import os
+import time
+import datetime
 import boto3
 import pytest
 import bookmark_utils
@@ -74,6 +76,22 @@ class TestBookmark:
 
         data_loader.load_data_from_s3()
 
+    def test_check_for_new_data(self):
+        data_loader = DataLoader(
+            s3_bucket_name=self.test_s3_bucket,
+            s3_location=self.test_s3_prefix + "_csv",
+            format_of_data="csv",
+            job_name="job_test_check_for_new_data",
+            dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table,
+        )
+
+        new_files = data_loader.check_for_new_data()
+        assert sorted(file.key for file in new_files) == [
+            f"{self.test_s3_prefix}_csv/a.csv", f"{self.test_s3_prefix}_csv/b.csv"]
+        data_loader.load_data_from_s3()
+        data_loader.commit()
+        assert data_loader.check_for_new_data() == []
+
     def test_parquet_data_load(self):
         s3_path_test = self.test_s3_prefix + "_parquet"
         data_loader = DataLoader(
@@ -86,6 +104,20 @@ class TestBookmark:
         df = data_loader.load_data_from_s3()
         assert df.shape[0] != 0
 
+    def test_parquet_dataset_mode_data_load(self):
+        s3_path_test = self.test_s3_prefix + "_parquet"
+        data_loader = DataLoader(
+            s3_bucket_name=self.test_s3_bucket,
+            s3_location=s3_path_test,
+            format_of_data="parquet",
+            job_name="job_test_parquet_dataset_mode_data_load",
+            dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table,
+            parquet_dataset_mode=True,
+            max_workers=4)
+
+        df = data_loader.load_data_from_s3()
+        assert df.shape[0] != 0
+
     def test_json_data_load(self):
         s3_path_test = self.test_s3_prefix + "_json"
         data_loader = DataLoader(
@@ -98,6 +130,597 @@ class TestBookmark:
         df = data_loader.load_data_from_s3()
         assert df.shape[0] != 0
 
+    def test_concurrent_data_load(self):
+        s3_path_test = self.test_s3_prefix + "_csv"
+        serial_data_loader = DataLoader(
+            s3_bucket_name=self.test_s3_bucket,
+            s3_location=s3_path_test,
+            format_of_data="csv",
+            job_name="job_test_serial_data_load",
+            dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table)
+        concurrent_data_loader = DataLoader(
+            s3_bucket_name=self.test_s3_bucket,
+            s3_location=s3_path_test,
+            format_of_data="csv",
+            job_name="job_test_concurrent_data_load",
+            dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table,
+            max_workers=4)
+
+        serial_df = serial_data_loader.load_data_from_s3()
+        concurrent_df = concurrent_data_loader.load_data_from_s3()
+        assert concurrent_df.equals(serial_df)
+        assert concurrent_data_loader.last_load_stats["files"] == 2
+        assert concurrent_data_loader.last_load_stats["rows"] == concurrent_df.shape[0]
+
+    def test_iter_batches(self):
+        s3_path_test = self.test_s3_prefix + "_csv"
+        data_loader = DataLoader(
+            s3_bucket_name=self.test_s3_bucket,
+            s3_location=s3_path_test,
+            format_of_data="csv",
+            job_name="job_test_iter_batches",
+            dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table)
+
+        batches = list(data_loader.iter_batches(files_per_batch=1))
+        assert len(batches) >= 1
+        assert sum(batch.shape[0] for batch in batches) == data_loader.last_load_stats["rows"]
+        data_loader.commit()
+        assert list(data_loader.iter_batches(rows_per_batch=1000)) == []
+
+    def test_iter_batches_checkpointed(self):
+        def new_data_loader():
+            return DataLoader(
+                s3_bucket_name=self.test_s3_bucket,
+                s3_location=self.test_s3_prefix + "_csv",
+                format_of_data="csv",
+                job_name="job_test_iter_batches_checkpointed",
+                dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table,
+                key_ordered=True)
+
+        # the first run dies while handling its second batch
+        batches = new_data_loader().iter_batches(files_per_batch=1, checkpointed=True)
+        first_batch = next(batches)
+        second_batch = next(batches)
+        batches.close()
+
+        # the restarted run resumes after the checkpoint of the first batch
+        data_loader = new_data_loader()
+        resumed_batches = list(data_loader.iter_batches(files_per_batch=1, checkpointed=True))
+        assert len(resumed_batches) == 1 and resumed_batches[0].equals(second_batch)
+        assert not first_batch.equals(second_batch)
+        data_loader.commit()
+        assert list(new_data_loader().iter_batches(files_per_batch=1, checkpointed=True)) == []
+
+    def test_key_ordered_data_load(self):
+        s3_path_test = self.test_s3_prefix + "_csv"
+        data_loader = DataLoader(
+            s3_bucket_name=self.test_s3_bucket,
+            s3_location=s3_path_test,
+            format_of_data="csv",
+            job_name="job_test_key_ordered_data_load",
+            dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table,
+            key_ordered=True)
+
+        df = data_loader.load_data_from_s3()
+        assert df.shape[0] != 0
+        data_loader.commit()
+        bookmark = data_loader.get_latest_bookmark_from_db(status="COMPLETE")
+        assert bookmark["last_processed_key"] == f"{s3_path_test}/b.csv"
+        assert data_loader.load_data_from_s3().shape[0] == 0
+
+    def test_key_ordered_crash_before_commit(self):
+        s3_path_test = self.test_s3_prefix + "_csv"
+
+        def new_data_loader():
+            return DataLoader(
+                s3_bucket_name=self.test_s3_bucket,
+                s3_location=s3_path_test,
+                format_of_data="csv",
+                job_name="job_test_key_ordered_crash_before_commit",
+                dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table,
+                key_ordered=True)
+
+        # a committed run whose bookmark timestamp is newer than the files of the next keys
+        committed_bookmark = {
+            "bookmark_timestamp": int(datetime.datetime(2100, 1, 1).strftime("%s")),
+            "last_processed_key": f"{s3_path_test}/a.csv",
+        }
+        new_data_loader().register_bookmark(datetime.datetime(2100, 1, 1), status="COMPLETE",
+                                            last_processed_key=f"{s3_path_test}/a.csv")
+
+        # the next run dies between the IN_PROGRESS bookmark and the commit
+        df = new_data_loader().load_data_from_s3()
+        assert df.shape[0] != 0
+        data_loader = new_data_loader()
+        assert data_loader.get_latest_bookmark_from_db(status="COMPLETE") == committed_bookmark
+        assert data_loader.get_latest_bookmark_from_db(status="IN_PROGRESS")["last_processed_key"] == \
+               f"{s3_path_test}/b.csv"
+
+        # the restarted run loads the same files again
+        assert data_loader.load_data_from_s3().equals(df)
+        data_loader.commit()
+        assert data_loader.get_latest_bookmark_from_db(status="COMPLETE")["last_processed_key"] == \
+               f"{s3_path_test}/b.csv"
+        assert data_loader.load_data_from_s3().shape[0] == 0
+
+    def test_in_progress_bookmark_never_replaces_complete(self):
+        data_loader = DataLoader(
+            s3_bucket_name=self.test_s3_bucket,
+            s3_location=self.test_s3_prefix + "_csv",
+            format_of_data="csv",
+            job_name="job_test_in_progress_bookmark_never_replaces_complete",
+            dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table)
+
+        data_loader.register_bookmark(datetime.datetime(2022, 1, 1), status="COMPLETE")
+        data_loader.register_bookmark(datetime.datetime(2022, 1, 1, 0, 0, 0, 500000), status="IN_PROGRESS")
+        assert data_loader.get_latest_timestamp_from_db(status="COMPLETE") == \
+               int(datetime.datetime(2022, 1, 1).strftime("%s"))
+
+    def test_partition_pruning_data_load(self):
+        s3_path_test = self.test_s3_prefix + "_partitioned/"
+        for key in [f"{s3_path_test}dt=2000-01-01/hour=00/a.csv", f"{s3_path_test}dt=2000-01-02/b.csv"]:
+            s3.upload_file(os.path.join(dir_here, "data", "a.csv"), Bucket=self.test_s3_bucket, Key=key)
+        data_loader = DataLoader(
+            s3_bucket_name=self.test_s3_bucket,
+            s3_location=s3_path_test,
+            format_of_data="csv",
+            job_name="job_test_partition_pruning_data_load",
+            dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table,
+            partition_pruning=True,
+            max_workers=4)
+
+        _, files = data_loader.get_latest_files_from_s3_using_bookmark(0)
+        assert len(files) == 2
+        # every partition ends decades before this bookmark
+        _, files = data_loader.get_latest_files_from_s3_using_bookmark(datetime.datetime(2001, 1, 1).timestamp())
+        assert files == []
+
+    def test_partition_pruning_local_time_zone(self):
+        s3_path_test = self.test_s3_prefix + "_partitioned_tz/"
+        for key in [f"{s3_path_test}dt=2000-01-01/hour=00/a.csv", f"{s3_path_test}dt=2000-01-02/b.csv"]:
+            s3.upload_file(os.path.join(dir_here, "data", "a.csv"), Bucket=self.test_s3_bucket, Key=key)
+        data_loader = DataLoader(
+            s3_bucket_name=self.test_s3_bucket,
+            s3_location=s3_path_test,
+            format_of_data="csv",
+            job_name="job_test_partition_pruning_local_time_zone",
+            dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table,
+            partition_pruning=True,
+            partition_lookback_seconds=0)
+
+        # bookmarks are decoded in the local time zone, like the bookmark filter of the listed files does
+        time_zone = os.environ.get("TZ")
+        os.environ["TZ"] = "America/Los_Angeles"
+        time.tzset()
+        try:
+            _, files = data_loader.get_latest_files_from_s3_using_bookmark(
+                datetime.datetime(2000, 1, 2, 20).timestamp())
+        finally:
+            if time_zone is None:
+                del os.environ["TZ"]
+            else:
+                os.environ["TZ"] = time_zone
+            time.tzset()
+        assert [file.key for file in files] == [f"{s3_path_test}dt=2000-01-02/b.csv"]
+
+    def test_latest_pointer_bookmark_layout(self):
+        s3_path_test = self.test_s3_prefix + "_csv"
+        data_loader = DataLoader(
+            s3_bucket_name=self.test_s3_bucket,
+            s3_location=s3_path_test,
+            format_of_data="csv",
+            job_name="job_test_latest_pointer_bookmark_layout",
+            dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table,
+            bookmark_layout="latest_pointer")
+
+        assert data_loader.get_latest_timestamp_from_db(status="COMPLETE") == 0
+        assert data_loader.load_data_from_s3().shape[0] != 0
+        in_progress_timestamp = data_loader.get_latest_timestamp_from_db(status="IN_PROGRESS")
+        assert in_progress_timestamp != 0
+        assert data_loader.load_data_from_s3().shape[0] != 0
+        data_loader.commit()
+        assert data_loader.get_latest_timestamp_from_db(status="COMPLETE") == in_progress_timestamp
+        assert data_loader.load_data_from_s3().shape[0] == 0
+
+    def test_invalid_bookmark_layout_exception(self):
+        with pytest.raises(Exception):
+            DataLoader(
+                s3_bucket_name=self.test_s3_bucket,
+                s3_location=self.test_s3_prefix,
+                format_of_data="csv",
+                job_name="job_123",
+                dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table,
+                bookmark_layout="linked_list")
+
+    def test_compact_bookmark_history(self):
+        data_loader = DataLoader(
+            s3_bucket_name=self.test_s3_bucket,
+            s3_location=self.test_s3_prefix + "_csv",
+            format_of_data="csv",
+            job_name="job_test_compact_bookmark_history",
+            dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table)
+
+        data_loader.compact_bookmark_history(keep_last_items=1)
+        data_loader.register_bookmark(datetime.datetime(2022, 1, 1), status="COMPLETE")
+        for day in range(2, 6):
+            data_loader.register_bookmark(datetime.datetime(2022, 1, day), status="IN_PROGRESS")
+
+        assert data_loader.compact_bookmark_history(keep_last_items=2) == 2
+        assert data_loader.get_latest_timestamp_from_db(status="COMPLETE") == \
+               int(datetime.datetime(2022, 1, 1).strftime("%s"))
+        assert data_loader.get_latest_timestamp_from_db(status="IN_PROGRESS") == \
+               int(datetime.datetime(2022, 1, 5).strftime("%s"))
+
+    def test_history_ttl(self):
+        data_loader = DataLoader(
+            s3_bucket_name=self.test_s3_bucket,
+            s3_location=self.test_s3_prefix + "_csv",
+            format_of_data="csv",
+            job_name="job_test_history_ttl",
+            dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table,
+            bookmark_layout="latest_pointer",
+            history_ttl_seconds=3600)
+
+        data_loader.register_bookmark(datetime.datetime(2022, 1, 1), status="IN_PROGRESS")
+        data_loader.commit()
+        items = dynamodb.query(
+            TableName=self.test_dynamodb_table,
+            KeyConditionExpression="job_name = :job_name AND bookmark_timestamp >= :zero",
+            ExpressionAttributeValues={':job_name': {'S': "job_test_history_ttl"}, ':zero': {'N': "0"}},
+        )['Items']
+        assert len(items) == 1 and items[0]['status']['S'] == "COMPLETE"
+        assert 0 < int(items[0]['expires_at']['N']) - time.time() <= 3600
+        time_to_live = dynamodb.describe_time_to_live(TableName=self.test_dynamodb_table)
+        assert time_to_live['TimeToLiveDescription']['AttributeName'] == "expires_at"
+
+    def test_history_ttl_requires_latest_pointer_layout(self):
+        with pytest.raises(Exception):
+            DataLoader(
+                s3_bucket_name=self.test_s3_bucket,
+                s3_location=self.test_s3_prefix + "_csv",
+                format_of_data="csv",
+                job_name="job_123",
+                dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table,
+                history_ttl_seconds=3600)
+
+    def test_shared_session_and_clients(self):
+        data_loaders = [
+            DataLoader(
+                s3_bucket_name=self.test_s3_bucket,
+                s3_location=self.test_s3_prefix + "_csv",
+                format_of_data="csv",
+                job_name=f"job_test_shared_session_{index}",
+                dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table,
+                boto3_session=boto_ses)
+            for index in range(3)
+        ]
+
+        assert all(data_loader.boto3_session is boto_ses for data_loader in data_loaders)
+        assert len({id(data_loader.s3_client) for data_loader in data_loaders}) == 1
+        assert len({id(data_loader.dynamodb_client) for data_loader in data_loaders}) == 1
+        assert data_loaders[0].load_data_from_s3().shape[0] != 0
+
+    def test_columns_and_filters_data_load(self):
+        s3_path_test = self.test_s3_prefix + "_csv"
+        data_loader = DataLoader(
+            s3_bucket_name=self.test_s3_bucket,
+            s3_location=s3_path_test,
+            format_of_data="csv",
+            job_name="job_test_columns_and_filters_data_load",
+            dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table,
+            columns=["name"],
+            filters=[("id", ">", 1), ("id", "!=", 4)])
+
+        df = data_loader.load_data_from_s3()
+        assert list(df.columns) == ["name"]
+        assert sorted(df["name"]) == ["bob", "cathy"]
+
+    def test_invalid_filters_exception(self):
+        with pytest.raises(Exception):
+            DataLoader(
+                s3_bucket_name=self.test_s3_bucket,
+                s3_location=self.test_s3_prefix + "_csv",
+                format_of_data="csv",
+                job_name="job_123",
+                dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table,
+                filters=[("id", "~", 1)])
+
+    def test_arrow_output_data_load(self):
+        import pyarrow
+
+        s3_path_test = self.test_s3_prefix + "_csv"
+        data_loader = DataLoader(
+            s3_bucket_name=self.test_s3_bucket,
+            s3_location=s3_path_test,
+            format_of_data="csv",
+            job_name="job_test_arrow_output_data_load",
+            dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table,
+            output_format="arrow",
+            filters=[("id", ">", 1)])
+
+        table = data_loader.load_data_from_s3()
+        assert isinstance(table, pyarrow.Table)
+        assert table.num_rows == 3
+        assert sorted(table.to_pandas()["name"]) == ["bob", "cathy", "david"]
+
+    def test_arrow_output_object_cache_data_load(self, tmp_path):
+        class InMemoryReadsDataLoader(DataLoader):
+            in_memory_reads = 0
+
+            def read_file_bytes(self, file) -> bytes:
+                self.in_memory_reads += 1
+                return super().read_file_bytes(file)
+
+        data_loader = InMemoryReadsDataLoader(
+            s3_bucket_name=self.test_s3_bucket,
+            s3_location=self.test_s3_prefix + "_csv",
+            format_of_data="csv",
+            job_name="job_test_arrow_output_object_cache_data_load",
+            dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table,
+            output_format="arrow",
+            cache_dir=str(tmp_path))
+
+        table = data_loader.load_data_from_s3()
+        assert table.num_rows == 4
+        # the cached copies are parsed from their path, not read in memory first
+        assert data_loader.object_cache.misses == 2
+        assert data_loader.in_memory_reads == 0
+
+    def test_arrow_output_json_data_load(self):
+        s3_path_test = self.test_s3_prefix + "_json_arrow/"
+        s3.put_object(Bucket=self.test_s3_bucket, Key=f"{s3_path_test}a.json",
+                      Body=b'[{"id": 1, "name": "alice"}, {"id": 2, "name": "bob"}]')
+
+        def new_data_loader(**kwargs):
+            return DataLoader(
+                s3_bucket_name=self.test_s3_bucket,
+                s3_location=s3_path_test,
+                format_of_data="json",
+                job_name="job_test_arrow_output_json_data_load",
+                dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table,
+                output_format="arrow",
+                columns=["name"],
+                filters=[("id", ">", 1)],
+                **kwargs)
+
+        data_loader = new_data_loader(parse_processes=1)
+        try:
+            table = data_loader.load_data_from_s3()
+        finally:
+            data_loader.close()
+        assert table.equals(new_data_loader().load_data_from_s3())
+        assert table.to_pydict() == {"name": ["bob"]}
+
+        # pandas keeps mixed types in an object column, arrow can't convert it
+        s3.put_object(Bucket=self.test_s3_bucket, Key=f"{s3_path_test}b.json",
+                      Body=b'[{"id": 3, "name": 1}, {"id": 4, "name": "x"}]')
+        with pytest.raises(Exception, match="single type"):
+            new_data_loader().load_data_from_s3()
+
+        with pytest.raises(Exception):
+            new_data_loader(use_schema_registry=True)
+
+    def test_schema_registry_data_load(self):
+        def new_data_loader():
+            return DataLoader(
+                s3_bucket_name=self.test_s3_bucket,
+                s3_location=self.test_s3_prefix + "_csv",
+                format_of_data="csv",
+                job_name="job_test_schema_registry_data_load",
+                dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table,
+                use_schema_registry=True)
+
+        first_df = new_data_loader().load_data_from_s3()
+        data_loader = new_data_loader()
+        assert data_loader.get_registered_csv_dtypes() == {
+            column: str(dtype) for column, dtype in first_df.dtypes.items()}
+        df = data_loader.load_data_from_s3()
+        assert df.equals(first_df)
+        assert data_loader.schema_drifts == []
+
+    def test_object_cache_data_load(self, tmp_path):
+        def new_data_loader():
+            return DataLoader(
+                s3_bucket_name=self.test_s3_bucket,
+                s3_location=self.test_s3_prefix + "_csv",
+                format_of_data="csv",
+                job_name="job_test_object_cache_data_load",
+                dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table,
+                cache_dir=str(tmp_path))
+
+        first_data_loader = new_data_loader()
+        first_df = first_data_loader.load_data_from_s3()
+        assert first_data_loader.object_cache.misses == 2
+
+        # a retry before commit is served from the local disk
+        data_loader = new_data_loader()
+        assert data_loader.load_data_from_s3().equals(first_df)
+        assert (data_loader.object_cache.hits, data_loader.object_cache.misses) == (2, 0)
+
+    def test_large_object_data_load(self):
+        def new_data_loader(**kwargs):
+            return DataLoader(
+                s3_bucket_name=self.test_s3_bucket,
+                s3_location=self.test_s3_prefix + "_csv",
+                format_of_data="csv",
+                job_name="job_test_large_object_data_load",
+                dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table,
+                **kwargs)
+
+        # every file is downloaded with ranged GETs, the result is the same as with streamed reads
+        df = new_data_loader(large_object_threshold_bytes=1, range_concurrency=4).load_data_from_s3()
+        assert df.equals(new_data_loader().load_data_from_s3())
+
+        with pytest.raises(Exception) as ex:
+            new_data_loader(large_object_threshold_bytes=1, range_size_bytes=1024)
+        assert str(ex.value) == "range_size_bytes should be an integer of at least 5 MiB"
+
+    def test_compressed_data_load(self):
+        import bz2
+        import gzip
+
+        s3_path_test = self.test_s3_prefix + "_compressed_csv"
+        for fname, compress, extension in [("a.csv", gzip.compress, "gz"), ("b.csv", bz2.compress, "bz2")]:
+            with open(os.path.join(dir_here, "data", fname), "rb") as f:
+                s3.put_object(Bucket=self.test_s3_bucket, Key=f"{s3_path_test}/{fname}.{extension}",
+                              Body=compress(f.read()))
+
+        def load(s3_location):
+            return DataLoader(
+                s3_bucket_name=self.test_s3_bucket,
+                s3_location=s3_location,
+                format_of_data="csv",
+                job_name="job_test_compressed_data_load_" + s3_location,
+                dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table).load_data_from_s3()
+
+        df = load(s3_path_test)
+        expected_df = load(self.test_s3_prefix + "_csv")
+        columns = list(expected_df.columns)
+        assert df.sort_values(columns).reset_index(drop=True).equals(
+            expected_df.sort_values(columns).reset_index(drop=True))
+
+    def test_parse_processes_data_load(self):
+        def new_data_loader(**kwargs):
+            return DataLoader(
+                s3_bucket_name=self.test_s3_bucket,
+                s3_location=self.test_s3_prefix + "_csv",
+                format_of_data="csv",
+                job_name="job_test_parse_processes_data_load",
+                dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table,
+                **kwargs)
+
+        data_loader = new_data_loader(parse_processes=2)
+        try:
+            df = data_loader.load_data_from_s3()
+        finally:
+            data_loader.close()
+        assert df.equals(new_data_loader().load_data_from_s3())
+
+    def test_parse_processes_mixed_types_data_load(self):
+        s3_path_test = self.test_s3_prefix + "_json_mixed_types/"
+        s3.put_object(Bucket=self.test_s3_bucket, Key=f"{s3_path_test}a.json", Body=b'[{"a": 1}, {"a": "x"}]')
+
+        def new_data_loader(**kwargs):
+            return DataLoader(
+                s3_bucket_name=self.test_s3_bucket,
+                s3_location=s3_path_test,
+                format_of_data="json",
+                job_name="job_test_parse_processes_mixed_types_data_load",
+                dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table,
+                **kwargs)
+
+        data_loader = new_data_loader(parse_processes=1)
+        try:
+            df = data_loader.load_data_from_s3()
+        finally:
+            data_loader.close()
+        assert df.to_dict(orient="list") == {"a": [1, "x"]}
+        assert df.equals(new_data_loader().load_data_from_s3())
+
+    def test_metrics_data_load(self):
+        records = []
+        data_loader = DataLoader(
+            s3_bucket_name=self.test_s3_bucket,
+            s3_location=self.test_s3_prefix + "_csv",
+            format_of_data="csv",
+            job_name="job_test_metrics_data_load",
+            dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table,
+            metrics_sinks=[records.append])
+
+        df = data_loader.load_data_from_s3()
+        data_loader.commit()
+        assert [record["operation"] for record in records] == ["load_data_from_s3", "commit"]
+
+        record = records[0]
+        assert record["job_name"] == "job_test_metrics_data_load"
+        assert record["counters"]["list_pages"] >= 1
+        assert record["counters"]["objects_kept"] == record["counters"]["files"] == 2
+        assert record["counters"]["objects_scanned"] >= 2
+        assert record["counters"]["rows"] == df.shape[0]
+        assert record["counters"]["bytes_read"] == data_loader.last_load_stats["bytes"]
+        for timer in ["list", "bookmark_read", "bookmark_write", "download", "parse", "read_file", "concat"]:
+            assert record["timers"][timer]["count"] >= 1
+        assert record["timers"]["read_file"]["count"] == 2
+
+    def test_inventory_data_load(self):
+        import gzip
+        import json
+        import urllib.parse
+
+        s3_path_test = self.test_s3_prefix + "_inventory_csv"
+        for fname, key in [("a.csv", "a.csv"), ("b.csv", "b and c.csv")]:
+            s3.upload_file(os.path.join(dir_here, "data", fname), Bucket=self.test_s3_bucket,
+                           Key=f"{s3_path_test}/{key}")
+
+        # an S3 Inventory csv report of the bucket, keys are url encoded
+        inventory_prefix = f"inventory/{self.test_s3_bucket}/daily"
+        rows = [
+            f'"{self.test_s3_bucket}","{urllib.parse.quote_plus(content["Key"], safe="/")}","{content["Size"]}",'
+            f'"{content["LastModified"].strftime("%Y-%m-%dT%H:%M:%S.000Z")}","{content["ETag"].strip(chr(34))}"'
+            for content in s3.list_objects_v2(Bucket=self.test_s3_bucket)["Contents"]
+        ]
+        data_key = f"{inventory_prefix}/data/report.csv.gz"
+        s3.put_object(Bucket=self.test_s3_bucket, Key=data_key, Body=gzip.compress("\n".join(rows).encode()))
+        manifest = {
+            "sourceBucket": self.test_s3_bucket,
+            "destinationBucket": f"arn:aws:s3:::{self.test_s3_bucket}",
+            "fileFormat": "CSV",
+            "fileSchema": "Bucket, Key, Size, LastModifiedDate, ETag",
+            "files": [{"key": data_key}],
+        }
+        s3.put_object(Bucket=self.test_s3_bucket, Key=f"{inventory_prefix}/2022-01-01T01-00Z/manifest.json",
+                      Body=json.dumps(dict(manifest, files=[])))
+        s3.put_object(Bucket=self.test_s3_bucket, Key=f"{inventory_prefix}/2022-01-02T01-00Z/manifest.json",
+                      Body=json.dumps(manifest))
+
+        def new_data_loader(**kwargs):
+            return DataLoader(
+                s3_bucket_name=self.test_s3_bucket,
+                s3_location=s3_path_test,
+                format_of_data="csv",
+                job_name="job_test_inventory_data_load",
+                dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table,
+                **kwargs)
+
+        listed_files = new_data_loader().get_latest_files_from_s3_using_bookmark(0)
+        data_loader = new_data_loader(inventory_location=f"s3://{self.test_s3_bucket}/{inventory_prefix}/")
+        assert data_loader.get_latest_files_from_s3_using_bookmark(0) == listed_files
+        assert data_loader.load_data_from_s3().shape[0] != 0
+        data_loader.commit()
+        assert data_loader.check_for_new_data() == []
+
+        # the same files from a manifest written by the producer
+        manifest_rows = ["key,size,last_modified"] + [
+            f"{file.key},{file.size},{file.last_modified.isoformat()}" for file in listed_files[1]]
+        s3.put_object(Bucket=self.test_s3_bucket, Key="manifests/files.csv", Body="\n".join(manifest_rows))
+        data_loader = new_data_loader(manifest_location=f"s3://{self.test_s3_bucket}/manifests/files.csv")
+        assert data_loader.get_latest_files_from_s3_using_bookmark(0) == (
+            listed_files[0], [file._replace(e_tag=None) for file in listed_files[1]])
+
+    def test_xml_data_load(self):
+        data_loader = DataLoader(
+            s3_bucket_name=self.test_s3_bucket,
+            s3_location=self.test_s3_prefix + "_xml",
+            format_of_data="xml",
+            job_name="job_test_xml_data_load",
+            dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table,
+            xml_record_path="catalog/book",
+            filters=[("price", ">", 5)])
+
+        df = data_loader.load_data_from_s3()
+        assert list(df.columns) == ["id", "title", "price.currency", "price"]
+        assert df["id"].tolist() == [1, 3]
+
+    def test_xml_record_path_required_exception(self):
+        with pytest.raises(Exception) as ex:
+            DataLoader(
+                s3_bucket_name=self.test_s3_bucket,
+                s3_location=self.test_s3_prefix + "_xml",
+                format_of_data="xml",
+                job_name="job_test_xml_record_path_required_exception",
+                dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table)
+        assert str(ex.value) == "xml_record_path is required to read xml files"
+
     def test_commit_and_load(self):
         data_loader = DataLoader(
             s3_bucket_name="bucket-for-datalab",
@@ -131,6 +754,17 @@ class TestBookmark:
         except dynamodb_client.exceptions.ResourceNotFoundException:
             pass
 
+
+def test_import_is_lazy():
+    import subprocess
+    import sys
+
+    code = "import sys, bookmark_utils; " \
+           "print(sorted(set(sys.modules) & {'pandas', 'pyarrow', 'awswrangler', 'pytest'}))"
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=os.path.dirname(dir_here))
+    assert output.decode().strip() == "[]"
+
+
 if __name__ == "__main__":
     import os
 
@@ -8,6 +8,8 @@ from datetime import datetime
 from bookmark_utils import helpers
 
 client = boto3.session.Session().client("dynamodb")
+s3 = boto3.session.Session().client("s3")
+account_id = boto3.session.Session().client("sts").get_caller_identity()["Account"]
 
 
 class TestCreateDynamodbTableIfNotExists:
@@ -77,6 +79,114 @@ class TestCreateDynamodbTableIfNotExists:
         assert (et - st).total_seconds() <= 2  # spend no more than 2 seconds
 
 
+def test_parse_partition_time_range():
+    assert helpers.parse_partition_time_range("dt=2022-01-14/") == (
+        datetime(2022, 1, 14), datetime(2022, 1, 15))
+    assert helpers.parse_partition_time_range("dt=20220114/hour=05/") == (
+        datetime(2022, 1, 14, 5), datetime(2022, 1, 14, 6))
+    assert helpers.parse_partition_time_range("year=2021/month=12/") == (
+        datetime(2021, 12, 1), datetime(2022, 1, 1))
+    assert helpers.parse_partition_time_range("year=2022/") == (
+        datetime(2022, 1, 1), datetime(2023, 1, 1))
+    assert helpers.parse_partition_time_range("region=eu/") is None
+    assert helpers.parse_partition_time_range("dt=latest/") is None
+
+
+def test_optimize_dataframe_dtypes():
+    import pandas as pd
+
+    df1 = helpers.optimize_dataframe_dtypes(pd.DataFrame({
+        "country": ["US", "US", "FR", "US"],
+        "amount": [1, 2, 3, 250],
+        "price": [0.5, 1.25, None, 2.0],
+    }))
+    assert isinstance(df1["country"].dtype, pd.CategoricalDtype)
+    assert df1["amount"].dtype == "uint8"
+    assert df1["price"].dtype == "float32"
+
+    df2 = helpers.optimize_dataframe_dtypes(pd.DataFrame({
+        "country": ["DE", "DE", "DE", "DE"],
+        "amount": [-1, 2, 3, 4],
+        "price": [0.1, 0.2, 0.3, 0.4],  # not exact in float32
+    }))
+    assert df2["amount"].dtype == "int8"
+    assert df2["price"].dtype == "float64"
+
+    df = pd.concat(helpers.unify_categorical_columns([df1, df2]), ignore_index=True)
+    assert isinstance(df["country"].dtype, pd.CategoricalDtype)
+    assert sorted(df["country"].cat.categories) == ["DE", "FR", "US"]
+
+
+def test_compressed_stream():
+    import gzip
+    import io
+
+    assert helpers.get_compression("data/a.csv.gz") == "gzip"
+    assert helpers.get_compression("data/a.csv") is None
+    assert helpers.strip_compression_extension("data/a.json.zst") == "data/a.json"
+    stream = helpers.open_decompressed_stream(io.BytesIO(gzip.compress(b"a,b\n1,2\n")), "gzip")
+    assert stream.read() == b"a,b\n1,2\n"
+
+
+def test_iter_xml_records():
+    import io
+
+    document = b"""<root xmlns="urn:test"><header/>
+        <items><item id="1"><name>a</name><size unit="kb">2</size></item><item id="2"/></items>
+    </root>"""
+    assert list(helpers.iter_xml_records(io.BytesIO(document), "root/items/item")) == [
+        {"id": "1", "name": "a", "size.unit": "kb", "size": "2"},
+        {"id": "2"},
+    ]
+
+
+def test_parse_xml_filters_sparse_element():
+    import io
+
+    document = b"<r><b><id>1</id></b><b><id>2</id><price>9</price></b><b><id>3</id><price>4</price></b></r>"
+    df = helpers.parse_xml(io.BytesIO(document), "r/b", filters=[("price", ">", 5)], batch_size=1)
+    assert df["id"].tolist() == [2]
+    df = helpers.parse_xml(io.BytesIO(document), "r/b", columns=["id", "price"], batch_size=1)
+    assert df["id"].tolist() == [1, 2, 3]
+
+
+class TestFileManifest:
+    test_s3_bucket = "{}-bookmark-utils-test".format(account_id)
+    test_manifest_key = "manifest/files.jsonl"
+
+    @classmethod
+    def setup_class(cls):
+        try:
+            s3.head_bucket(Bucket=cls.test_s3_bucket)
+        except Exception as e:
+            if "HeadBucket operation: Not Found" in str(e):
+                s3.create_bucket(Bucket=cls.test_s3_bucket)
+            else:
+                raise
+
+        rows = [
+            ("data/a.csv", 100, "a"),
+            ("data/b.csv.gz", 200, "b"),
+            ("data/c.json", 300, "c"),
+            ("other/d.csv", 400, "d"),
+            ("data/e.csv", 50, "e"),
+        ]
+        s3.put_object(Bucket=cls.test_s3_bucket, Key=cls.test_manifest_key, Body="".join(
+            f'{{"key": "{key}", "size": 1, "last_modified": {last_modified}, "e_tag": "{e_tag}"}}\n'
+            for key, last_modified, e_tag in rows).encode("utf-8"))
+
+    def test_read_and_filter_file_manifest(self):
+        table = helpers.read_file_manifest(s3, self.test_s3_bucket, self.test_manifest_key)
+        assert table.num_rows == 5
+
+        files = helpers.filter_manifest_table(table, prefix="data/", suffixes=["csv", "csv.gz"], modified_after=60)
+        assert [file.key for file in files] == ["data/a.csv", "data/b.csv.gz"]
+        assert files[0].last_modified.timestamp() == 100 and files[0].e_tag == '"a"'
+        files = helpers.filter_manifest_table(table, prefix="data/", suffixes=["csv"], start_after="data/a.csv")
+        assert [file.key for file in files] == ["data/e.csv"]
+        assert helpers.split_s3_url("s3://bucket/some/key") == ("bucket", "some/key")
+
+
 if __name__ == "__main__":
     import os
 
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+import io
+import json
+import logging
+
+from bookmark_utils.metrics import NULL_METRICS, EmfSink, LoggingSink, MeteredStream, Metrics, timed
+
+
+def test_metrics_flush():
+    records = []
+    metrics = Metrics([records.append], dimensions={"job_name": "job"})
+    metrics.increment("files")
+    metrics.increment("files", 2)
+    metrics.add_time("parse", 0.5)
+    metrics.add_time("parse", 1.5)
+    with metrics.timer("list"):
+        pass
+
+    record = metrics.flush(operation="load_data_from_s3")
+    assert records == [record]
+    assert record["job_name"] == "job"
+    assert record["operation"] == "load_data_from_s3"
+    assert record["counters"] == {"files": 3}
+    assert record["timers"]["parse"] == {"count": 2, "seconds": 2.0, "max_seconds": 1.5}
+    assert record["timers"]["list"]["count"] == 1
+    assert metrics.thread_seconds("parse") == 2.0
+
+    # nothing collected since the last flush
+    assert metrics.flush() is None
+    assert len(records) == 1
+
+
+def test_metrics_failing_sink():
+    def failing_sink(record):
+        raise ValueError("unreachable")
+
+    records = []
+    metrics = Metrics([failing_sink, records.append])
+    metrics.increment("files")
+    metrics.flush()
+    assert len(records) == 1
+
+
+def test_null_metrics():
+    with NULL_METRICS.timer("list"):
+        NULL_METRICS.increment("files")
+    assert NULL_METRICS.enabled is False
+    assert NULL_METRICS.thread_seconds("list") == 0.0
+    assert NULL_METRICS.flush() is None
+
+
+def test_timed():
+    class Job(object):
+        def __init__(self):
+            self.records = []
+            self.metrics = Metrics([self.records.append])
+
+        @timed("run", flush=True)
+        def run(self):
+            self.metrics.increment("rows", 10)
+            return "done"
+
+    job = Job()
+    assert job.run() == "done"
+    assert job.records[0]["operation"] == "run"
+    assert job.records[0]["counters"] == {"rows": 10}
+    assert job.records[0]["timers"]["run"]["count"] == 1
+
+
+def test_metered_stream():
+    metrics = Metrics([])
+    stream = io.BufferedReader(MeteredStream(io.BytesIO(b"a,b\n1,2\n"), metrics))
+    assert stream.read(4) == b"a,b\n"
+    assert stream.read() == b"1,2\n"
+    assert metrics.snapshot()["timers"]["download"]["count"] >= 1
+
+
+def test_logging_sink(caplog):
+    metrics = Metrics([LoggingSink()], dimensions={"job_name": "job"})
+    metrics.increment("files")
+    with caplog.at_level(logging.INFO, logger="root"):
+        metrics.flush()
+    assert '"files": 1' in caplog.text
+
+
+def test_emf_sink():
+    stream = io.StringIO()
+    metrics = Metrics([EmfSink(stream=stream)], dimensions={"job_name": "job"})
+    metrics.increment("bytes_read", 100)
+    metrics.add_time("parse", 0.25)
+    metrics.flush(operation="load_data_from_s3")
+
+    document = json.loads(stream.getvalue())
+    assert document["job_name"] == "job"
+    assert document["operation"] == "load_data_from_s3"
+    assert document["bytes_read"] == 100
+    assert document["parse_seconds"] == 0.25
+    assert document["parse_count"] == 1
+    metric_directive = document["_aws"]["CloudWatchMetrics"][0]
+    assert metric_directive["Namespace"] == "BookmarkUtils"
+    assert metric_directive["Dimensions"] == [["job_name", "operation"]]
+    assert {"Name": "bytes_read", "Unit": "Bytes"} in metric_directive["Metrics"]
+    assert {"Name": "parse_seconds", "Unit": "Seconds"} in metric_directive["Metrics"]
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import os
+import boto3
+import pytest
+import bookmark_utils
+from bookmark_utils import DataLoader, MultiSourceLoader
+
+boto_ses = boto3.session.Session()
+sts = boto_ses.client("sts")
+s3 = boto_ses.client("s3")
+
+account_id = sts.get_caller_identity()["Account"]
+
+package_name = bookmark_utils.__name__
+dir_here = os.path.dirname(os.path.abspath(__file__))
+
+
+class TestMultiSourceLoader:
+    # --- Tests dependencies
+    test_s3_bucket = "{}-{}-test".format(
+        account_id,
+        package_name.replace("_", "-"),
+    )
+    test_s3_prefix = "multi_source"
+    test_dynamodb_table = "{}_{}_test".format(
+        account_id,
+        package_name.replace("-", "_"),
+    )
+
+    @classmethod
+    def setup_class(cls):
+        try:
+            s3.head_bucket(Bucket=cls.test_s3_bucket)
+        except Exception as e:
+            if "HeadBucket operation: Not Found" in str(e):
+                s3.create_bucket(Bucket=cls.test_s3_bucket)
+            else:
+                raise
+
+        # one source per data file
+        for fname in os.listdir(os.path.join(dir_here, "data")):
+            path = os.path.join(dir_here, "data", fname)
+            file_type = fname.split(".")[-1]
+            key = f"{cls.test_s3_prefix}/{file_type}/{fname}"
+            s3.upload_file(path, Bucket=cls.test_s3_bucket, Key=key)
+
+    # --- Test cases
+    def test_load_and_commit(self):
+        sources = [
+            dict(
+                s3_bucket_name=self.test_s3_bucket,
+                s3_location=f"{self.test_s3_prefix}/{file_type}/",
+                format_of_data=file_type,
+                job_name=f"job_test_multi_source_{file_type}",
+            )
+            for file_type in ["csv", "json", "parquet"]
+        ]
+        loader = MultiSourceLoader(
+            sources=sources,
+            dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table,
+            max_workers=4,
+            max_bytes_per_second=100 * 1024 * 1024,
+            boto3_session=boto_ses,
+        )
+
+        results = loader.load_data_from_s3()
+        assert set(results) == {source["job_name"] for source in sources}
+        assert all(df.shape[0] != 0 for df in results.values())
+        assert loader.last_load_stats["sources_with_new_data"] == 3
+
+        loader.commit()
+        results = loader.load_data_from_s3()
+        assert all(df.shape[0] == 0 for df in results.values())
+
+    def test_source_bookmarked_by_data_loader(self):
+        source = dict(
+            s3_bucket_name=self.test_s3_bucket,
+            s3_location=f"{self.test_s3_prefix}/csv/",
+            format_of_data="csv",
+            job_name="job_test_multi_source_bookmarked_by_data_loader",
+        )
+        data_loader = DataLoader(dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table, **source)
+        assert data_loader.load_data_from_s3().shape[0] != 0
+        data_loader.commit()
+
+        loader = MultiSourceLoader(sources=[source], dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table)
+        results = loader.load_data_from_s3()
+        assert results[source["job_name"]].shape[0] == 0
+
+    def test_duplicated_job_name_exception(self):
+        source = dict(
+            s3_bucket_name=self.test_s3_bucket,
+            s3_location=f"{self.test_s3_prefix}/csv/",
+            format_of_data="csv",
+            job_name="job_test_multi_source_duplicated",
+        )
+        with pytest.raises(Exception):
+            MultiSourceLoader(
+                sources=[source, source],
+                dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table,
+            )
+
+
+if __name__ == "__main__":
+    import os
+
+    basename = os.path.basename(__file__)
+    pytest.main([basename, "-s", "--tb=native"])
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+import os
+import boto3
+import pytest
+import bookmark_utils
+from bookmark_utils.object_cache import ObjectCache
+
+boto_ses = boto3.session.Session()
+sts = boto_ses.client("sts")
+s3 = boto_ses.client("s3")
+
+account_id = sts.get_caller_identity()["Account"]
+
+package_name = bookmark_utils.__name__
+
+
+class TestObjectCache:
+    # --- Tests dependencies
+    test_s3_bucket = "{}-{}-test".format(
+        account_id,
+        package_name.replace("_", "-"),
+    )
+    test_s3_prefix = "object_cache"
+
+    @classmethod
+    def setup_class(cls):
+        try:
+            s3.head_bucket(Bucket=cls.test_s3_bucket)
+        except Exception as e:
+            if "HeadBucket operation: Not Found" in str(e):
+                s3.create_bucket(Bucket=cls.test_s3_bucket)
+            else:
+                raise
+
+        for name in ["a", "b", "c"]:
+            s3.put_object(Bucket=cls.test_s3_bucket, Key=f"{cls.test_s3_prefix}/{name}.csv", Body=b"x" * 100)
+
+    def fetch(self, cache, name):
+        key = f"{self.test_s3_prefix}/{name}.csv"
+        e_tag = s3.head_object(Bucket=self.test_s3_bucket, Key=key)["ETag"]
+        return cache.fetch(s3, self.test_s3_bucket, key, e_tag, size=100)
+
+    # --- Test cases
+    def test_fetch_and_evict(self, tmp_path):
+        cache = ObjectCache(str(tmp_path), max_bytes=250)
+
+        path_a = self.fetch(cache, "a")
+        with open(path_a, "rb") as f:
+            assert f.read() == b"x" * 100
+        assert self.fetch(cache, "a") == path_a
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        self.fetch(cache, "b")
+        os.utime(path_a, (0, 0))  # a is now the least recently used one
+        self.fetch(cache, "c")
+        assert not os.path.exists(path_a)
+        assert len([entry for entry in os.scandir(str(tmp_path)) if entry.is_file()]) == 2
+
+    def test_pinned_copies_are_not_evicted(self, tmp_path):
+        cache = ObjectCache(str(tmp_path), max_bytes=150)
+
+        key = f"{self.test_s3_prefix}/a.csv"
+        e_tag = s3.head_object(Bucket=self.test_s3_bucket, Key=key)["ETag"]
+        with cache.pinned(self.test_s3_bucket, key, e_tag):
+            path_a = self.fetch(cache, "a")
+            self.fetch(cache, "b")  # the cache only has room for one copy
+            assert os.path.exists(path_a)
+        self.fetch(cache, "c")
+        assert not os.path.exists(path_a)
+
+    def test_concurrent_eviction(self, tmp_path):
+        from concurrent.futures import ThreadPoolExecutor
+
+        cache = ObjectCache(str(tmp_path), max_bytes=150)
+
+        def fetch_and_read(index):
+            key = f"{self.test_s3_prefix}/{'abc'[index % 3]}.csv"
+            e_tag = s3.head_object(Bucket=self.test_s3_bucket, Key=key)["ETag"]
+            with cache.pinned(self.test_s3_bucket, key, e_tag):
+                path = cache.fetch(s3, self.test_s3_bucket, key, e_tag, size=100)
+                with open(path, "rb") as f:
+                    return f.read()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            assert all(body == b"x" * 100 for body in executor.map(fetch_and_read, range(300)))
+
+    def test_invalid_max_bytes_exception(self, tmp_path):
+        with pytest.raises(Exception):
+            ObjectCache(str(tmp_path), max_bytes=0)
+
+
+if __name__ == "__main__":
+    import os
+
+    basename = os.path.basename(__file__)
+    pytest.main([basename, "-s", "--tb=native"])
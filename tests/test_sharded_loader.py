@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+import os
+import datetime
+import boto3
+import pytest
+import bookmark_utils
+from bookmark_utils import DataLoader, ShardedLoader
+
+boto_ses = boto3.session.Session()
+sts = boto_ses.client("sts")
+s3 = boto_ses.client("s3")
+
+account_id = sts.get_caller_identity()["Account"]
+
+package_name = bookmark_utils.__name__
+dir_here = os.path.dirname(os.path.abspath(__file__))
+
+
+class TestShardedLoader:
+    # --- Tests dependencies
+    test_s3_bucket = "{}-{}-test".format(
+        account_id,
+        package_name.replace("_", "-"),
+    )
+    test_s3_prefix = "sharded"
+    test_dynamodb_table = "{}_{}_test".format(
+        account_id,
+        package_name.replace("-", "_"),
+    )
+
+    @classmethod
+    def setup_class(cls):
+        try:
+            s3.head_bucket(Bucket=cls.test_s3_bucket)
+        except Exception as e:
+            if "HeadBucket operation: Not Found" in str(e):
+                s3.create_bucket(Bucket=cls.test_s3_bucket)
+            else:
+                raise
+
+        for fname in ["a.csv", "b.csv"]:
+            path = os.path.join(dir_here, "data", fname)
+            s3.upload_file(path, Bucket=cls.test_s3_bucket, Key=f"{cls.test_s3_prefix}/{fname}")
+
+    def new_worker(self, job_name):
+        data_loader = DataLoader(
+            s3_bucket_name=self.test_s3_bucket,
+            s3_location=self.test_s3_prefix,
+            format_of_data="csv",
+            job_name=job_name,
+            dynamo_db_table_for_bookmark_storage=self.test_dynamodb_table,
+            key_ordered=True,
+            bookmark_layout="latest_pointer")
+        return ShardedLoader(data_loader, files_per_unit=1)
+
+    # --- Test cases
+    def test_load_work_units(self):
+        job_name = "job_test_sharded_load_work_units"
+        first_worker = self.new_worker(job_name)
+        second_worker = self.new_worker(job_name)
+
+        first_work_units = first_worker.load_work_units()
+        assert next(first_work_units).shape[0] != 0
+
+        # the second worker drains the other unit, the bookmark waits for the first one
+        assert len(list(second_worker.load_work_units())) == 1
+        bookmark = first_worker.data_loader.get_latest_bookmark_from_db(status="COMPLETE")
+        assert bookmark["last_processed_key"] is None
+
+        assert list(first_work_units) == []
+        bookmark = first_worker.data_loader.get_latest_bookmark_from_db(status="COMPLETE")
+        assert bookmark["last_processed_key"] == f"{self.test_s3_prefix}/b.csv"
+        assert list(self.new_worker(job_name).load_work_units()) == []
+
+    def test_data_loader_run_after_sharded_run(self):
+        job_name = "job_test_sharded_then_data_loader"
+        data_loader = self.new_worker(job_name).data_loader
+        # an earlier run which never committed
+        data_loader.register_bookmark(datetime.datetime(2000, 1, 1), status="IN_PROGRESS",
+                                      last_processed_key=f"{self.test_s3_prefix}/a.csv")
+
+        assert len(list(self.new_worker(job_name).load_work_units())) == 2
+        data_loader.commit()
+        bookmark = data_loader.get_latest_bookmark_from_db(status="COMPLETE")
+        assert bookmark["last_processed_key"] == f"{self.test_s3_prefix}/b.csv"
+        assert data_loader.load_data_from_s3().shape[0] == 0
+
+    def test_invalid_files_per_unit_exception(self):
+        with pytest.raises(Exception) as ex:
+            ShardedLoader(self.new_worker("job_test_sharded_invalid").data_loader, files_per_unit=0)
+        assert str(ex.value) == "files_per_unit should be a positive integer"
+
+
+if __name__ == "__main__":
+    import os
+
+    basename = os.path.basename(__file__)
+    pytest.main([basename, "-s", "--tb=native"])